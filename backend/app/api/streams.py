@@ -0,0 +1,157 @@
+"""
+Server-Sent Events streams for one-way consumers (kiosks, bots)
+"""
+import asyncio
+import json
+from typing import AsyncIterator, List, Optional
+from fastapi import APIRouter, Header, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from app.core.config import settings
+from app.services.ai_providers import AIProviderUnavailableError, ai_providers
+from app.services.chat_sessions import chat_sessions
+from app.services.database_service import DatabaseService
+from app.services.price_hub import PriceTick, price_hub
+from app.utils.auth import extract_bearer_token, load_user_for_token
+
+router = APIRouter(prefix="/cryptassist/stream")
+
+MAX_STREAM_IDS = 100
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",  # Stop nginx from buffering the stream
+}
+
+def format_price_event(tick: PriceTick) -> str:
+    data = json.dumps({"cryptoId": tick.crypto_id, "price": tick.price, "timestamp": tick.timestamp})
+    return f"id: {price_hub.epoch}:{tick.seq}\nevent: price\ndata: {data}\n\n"
+
+def get_ai_service():
+    try:
+        return ai_providers.get()
+    except AIProviderUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+def parse_ids(ids: str) -> List[str]:
+    crypto_ids = list(dict.fromkeys(crypto_id.strip() for crypto_id in ids.split(",") if crypto_id.strip()))
+    if not crypto_ids:
+        raise HTTPException(status_code=400, detail="Provide at least one crypto id in 'ids'")
+    if len(crypto_ids) > MAX_STREAM_IDS:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_STREAM_IDS} crypto ids per stream")
+    return crypto_ids
+
+def parse_last_event_id(last_event_id: Optional[str]) -> Optional[int]:
+    """Sequence number of an "<epoch>:<seq>" event id issued by this worker's hub, else None"""
+    epoch, _, seq = (last_event_id or "").partition(":")
+    if epoch != price_hub.epoch:
+        # Another worker, or this one before a restart: its sequence numbers do not apply here
+        return None
+    try:
+        return int(seq)
+    except ValueError:
+        return None
+
+async def price_events(request: Request, crypto_ids: List[str], last_event_id: Optional[int]) -> AsyncIterator[str]:
+    # Subscribe before replaying so no tick falls between the backlog and the live stream
+    subscription = price_hub.subscribe(crypto_ids)
+    try:
+        yield "retry: 5000\n\n"
+
+        if last_event_id is not None and last_event_id <= price_hub.last_seq:
+            # Resume: replay what the client missed from the per-coin ring buffers
+            backlog = price_hub.ticks_since(crypto_ids, last_event_id)
+        else:
+            # Fresh stream, or an id from another hub: start from a snapshot of the latest prices
+            backlog = sorted(price_hub.latest_ticks(crypto_ids), key=lambda tick: tick.seq)
+        sent_seq = last_event_id or 0
+        for tick in backlog:
+            yield format_price_event(tick)
+            sent_seq = max(sent_seq, tick.seq)
+
+        while not await request.is_disconnected():
+            try:
+                tick = await asyncio.wait_for(subscription.get(), settings.sse_keepalive_seconds)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            if tick.seq <= sent_seq:
+                continue
+            sent_seq = tick.seq
+            yield format_price_event(tick)
+    finally:
+        subscription.close()
+
+@router.get("/prices")
+async def stream_prices(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated crypto ids"),
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID")
+):
+    """Stream live price ticks as Server-Sent Events, resuming after Last-Event-ID"""
+    crypto_ids = parse_ids(ids)
+    return StreamingResponse(
+        price_events(request, crypto_ids, parse_last_event_id(last_event_id)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+async def completion_events(request: Request, chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+    """Relay model output as "token" events, then one "done" (or "error") event"""
+    try:
+        async for chunk in chunks:
+            if await request.is_disconnected():
+                break
+            yield f"event: token\ndata: {json.dumps({'content': chunk})}\n\n"
+        else:
+            yield "event: done\ndata: {}\n\n"
+    except Exception as e:
+        print(f"Error streaming AI response: {e}")
+        yield f"event: error\ndata: {json.dumps({'message': str(e)})}\n\n"
+    finally:
+        await chunks.aclose()
+
+@router.get("/chat")
+async def stream_chat(request: Request, message: str, context: Optional[str] = None,
+                      session_id: Optional[str] = Query(None, alias="sessionId")):
+    """Stream an AI assistant answer as Server-Sent Events; turns sent with a sessionId from startChatSession are remembered"""
+    ai_service = get_ai_service()
+    history = None
+    if session_id:
+        current_user = load_user_for_token(extract_bearer_token(request.headers.get("authorization", "")))
+        user_id = current_user.id if current_user else None
+        try:
+            history = chat_sessions.history(session_id, user_id)
+        except Exception as e:
+            raise HTTPException(status_code=404, detail=str(e))
+
+    market_context = await ai_service.get_current_market_context()
+    messages = ai_service.build_chat_messages(message, market_context, context, history)
+    chunks = ai_service.stream_chat_completion(messages, temperature=0.7)
+    if session_id:
+        chunks = chat_sessions.recording(session_id, user_id, message, chunks)
+    return StreamingResponse(
+        completion_events(request, chunks),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+@router.get("/advice/{portfolio_id}")
+async def stream_portfolio_advice(request: Request, portfolio_id: str):
+    """Stream AI advice for one of the caller's portfolios as Server-Sent Events"""
+    from app.services.ai_service import portfolio_advice_data
+
+    current_user = load_user_for_token(extract_bearer_token(request.headers.get("authorization", "")))
+    if not current_user:
+        raise HTTPException(status_code=401, detail="Authentication required")
+    with DatabaseService() as db_service:
+        portfolio_model = db_service.get_portfolio(portfolio_id)
+        if not portfolio_model or portfolio_model.user_id != current_user.id:
+            raise HTTPException(status_code=404, detail=f"Portfolio {portfolio_id} not found")
+        portfolio_data = portfolio_advice_data(portfolio_model, db_service.get_portfolio_assets(portfolio_id))
+
+    ai_service = get_ai_service()
+    return StreamingResponse(
+        completion_events(request, ai_service.stream_portfolio_advice(portfolio_data)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
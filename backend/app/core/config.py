@@ -18,6 +18,102 @@ class Settings(BaseSettings):
     debug: bool = True
     cors_origins: str = "http://localhost:3000"
 
+    # Background revaluation of stored holdings (seconds between price ticks, 0 disables)
+    revaluation_interval_seconds: int = 60
+
+    # Live price subscriptions (seconds between upstream polls, 0 disables; per-subscriber queue size)
+    price_poll_interval_seconds: int = 10
+    price_hub_queue_size: int = 100
+    price_hub_history_size: int = 64  # Recent ticks kept per coin for SSE Last-Event-ID resume
+    sse_keepalive_seconds: int = 15
+
+    # WebSocket fan-out (per-connection send queue bound, seconds a consumer may stall before eviction)
+    ws_send_queue_size: int = 256
+    ws_slow_consumer_timeout_seconds: int = 10
+    ws_tick_batch_ms: int = 250  # Price updates are coalesced into one delta frame per window (0 sends immediately)
+
+    # WebSocket liveness (seconds between pings, 0 disables; seconds to wait for a pong; seconds an
+    # unsubscribed connection may stay silent before it is reaped) and connections allowed per user
+    ws_heartbeat_interval_seconds: int = 30
+    ws_heartbeat_timeout_seconds: int = 10
+    ws_idle_timeout_seconds: int = 300
+    ws_max_connections_per_user: int = 10
+
+    # Live portfolio valuation: minimum % move in value before a portfolio update is pushed
+    portfolio_update_threshold_pct: float = 0.5
+
+    # Revaluing portfolios on read (portfolios(live: true)): seconds before a snapshot price is refetched
+    live_valuation_max_price_age_seconds: int = 120
+
+    # Portfolio risk analytics (annual risk-free rate for Sharpe/Sortino, historical VaR/CVaR confidence,
+    # longest window in days, memoized results) and concurrent daily price history fetches
+    analytics_risk_free_rate: float = 0.0
+    analytics_var_confidence: float = 0.95
+    analytics_max_window_days: int = 365
+    analytics_cache_max_entries: int = 1000
+    price_history_max_concurrent_fetches: int = 5
+
+    # Portfolio value history (longest window in days, cached series)
+    value_history_max_days: int = 365
+    value_history_cache_max_entries: int = 1000
+
+    # Cross-worker fan-out of WebSocket broadcasts and live price ticks: "memory" (single process) or
+    # "redis" (uses redis_url; one worker at a time holds the price poller lease and polls for all of them).
+    # The revaluation job still runs on every worker.
+    broker_backend: str = "memory"
+
+    # Transactions between per-asset state checkpoints used by as-of portfolio queries
+    checkpoint_interval_transactions: int = 50
+
+    # Verified-token cache for authenticated requests
+    auth_cache_ttl_seconds: int = 60
+    auth_cache_max_entries: int = 10000
+
+    # Password hashing (bcrypt work factor and size of the dedicated hashing thread pool)
+    bcrypt_rounds: int = 12
+    password_hash_workers: int = 4
+
+    # AI model endpoint (OpenAI-compatible chat completions API; point at scripts/stub_llm_server.py for local testing)
+    ai_endpoint: str = "https://models.github.ai/inference"
+    ai_model_name: str = "meta/Meta-Llama-3.1-8B-Instruct"
+
+    # AI backend ("github" or "stub" for canned local replies), built on first use; warm it up at startup
+    ai_provider: str = "github"
+    ai_warm_up_on_startup: bool = True
+
+    # AI requests: concurrent calls to the model, callers allowed to wait for a slot, and how long they wait
+    ai_max_concurrent_requests: int = 4
+    ai_max_queued_requests: int = 16
+    ai_queue_timeout_seconds: float = 5.0
+    ai_request_timeout_seconds: float = 30.0
+
+    # Seconds a market context snapshot is shared between AI chats before it is refreshed
+    market_context_refresh_seconds: int = 60
+
+    # Portfolio summaries in AI prompts (holdings listed individually, approximate token budget)
+    ai_prompt_max_holdings: int = 25
+    ai_prompt_token_budget: int = 1500
+
+    # AI advice cache ("memory" or "redis"; advice without a market snapshot is reused within one bucket)
+    advice_cache_backend: str = "memory"
+    advice_cache_ttl_seconds: int = 900
+    advice_cache_max_entries: int = 1000
+    advice_cache_market_bucket_seconds: int = 300
+
+    # Server-side chat sessions (tokens of recent turns kept verbatim, cap on the rolling summary of older
+    # turns, and LRU eviction by session count, total history tokens, or seconds idle)
+    chat_session_token_budget: int = 1200
+    chat_session_summary_token_budget: int = 300
+    chat_session_max_sessions: int = 1000
+    chat_session_max_total_tokens: int = 500000
+    chat_session_idle_seconds: int = 3600
+
+    # Asynchronous AI jobs ("memory" runs them on in-process workers, "celery" on Celery workers via redis_url)
+    ai_job_backend: str = "memory"
+    ai_job_workers: int = 2
+    ai_job_max_pending: int = 100
+    ai_job_retention_seconds: int = 3600
+
     # Admin secret for creating admin users
     admin_secret: str = "local-admin-secret"
 
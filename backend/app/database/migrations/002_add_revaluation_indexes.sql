@@ -0,0 +1,6 @@
+-- Migration 002: Add indexes for bulk price revaluation
+-- The revaluation job updates every holding of a coin with one statement per crypto_id
+-- and then rolls up totals for the affected portfolios, so both lookups need an index.
+
+CREATE INDEX IF NOT EXISTS ix_portfolio_assets_crypto_id ON portfolio_assets(crypto_id);
+CREATE INDEX IF NOT EXISTS ix_portfolio_assets_portfolio_id ON portfolio_assets(portfolio_id);
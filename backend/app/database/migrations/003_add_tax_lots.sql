@@ -0,0 +1,33 @@
+-- Migration 003: Add tax lots for FIFO/LIFO/HIFO cost-basis accounting
+-- Each buy opens a lot; each sell consumes lots according to the portfolio's cost basis method
+-- and records the realized P&L per consumed lot. Existing assets get their lots rebuilt from
+-- transaction history on their next sell.
+
+ALTER TABLE portfolios ADD COLUMN cost_basis_method VARCHAR(10) DEFAULT 'fifo';
+
+CREATE TABLE IF NOT EXISTS tax_lots (
+    id VARCHAR(36) PRIMARY KEY,
+    asset_id VARCHAR(36) NOT NULL REFERENCES portfolio_assets(id),
+    portfolio_id VARCHAR(36) NOT NULL REFERENCES portfolios(id),
+    transaction_id VARCHAR(36) NOT NULL REFERENCES asset_transactions(id),
+    price_per_unit FLOAT NOT NULL,
+    original_amount FLOAT NOT NULL,
+    remaining_amount FLOAT NOT NULL,
+    acquired_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_tax_lots_asset_id ON tax_lots(asset_id);
+
+CREATE TABLE IF NOT EXISTS lot_disposals (
+    id VARCHAR(36) PRIMARY KEY,
+    lot_id VARCHAR(36) NOT NULL REFERENCES tax_lots(id),
+    transaction_id VARCHAR(36) NOT NULL REFERENCES asset_transactions(id),
+    amount FLOAT NOT NULL,
+    cost_basis FLOAT NOT NULL,
+    proceeds FLOAT NOT NULL,
+    realized_profit_loss FLOAT NOT NULL,
+    disposed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS ix_lot_disposals_lot_id ON lot_disposals(lot_id);
+CREATE INDEX IF NOT EXISTS ix_lot_disposals_transaction_id ON lot_disposals(transaction_id);
@@ -0,0 +1,23 @@
+-- Migration 004: Add per-asset state checkpoints for as-of portfolio queries
+-- A checkpoint stores an asset's amount, cost basis and realized P&L after a given transaction.
+-- portfolioAsOf loads the nearest checkpoint and replays only the transactions after it.
+
+CREATE TABLE IF NOT EXISTS asset_checkpoints (
+    id VARCHAR(36) PRIMARY KEY,
+    asset_id VARCHAR(36) NOT NULL REFERENCES portfolio_assets(id),
+    portfolio_id VARCHAR(36) NOT NULL REFERENCES portfolios(id),
+    crypto_id VARCHAR(255) NOT NULL,
+    symbol VARCHAR(255) NOT NULL,
+    name VARCHAR(255) NOT NULL,
+    as_of TIMESTAMP NOT NULL,
+    transaction_count INTEGER NOT NULL,
+    amount FLOAT NOT NULL,
+    cost_basis FLOAT NOT NULL,
+    realized_profit_loss FLOAT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS ix_asset_checkpoints_asset_id_as_of ON asset_checkpoints(asset_id, as_of);
+CREATE INDEX IF NOT EXISTS ix_asset_checkpoints_portfolio_id ON asset_checkpoints(portfolio_id);
+
+-- Replaying after a checkpoint filters transactions by asset and time
+CREATE INDEX IF NOT EXISTS ix_asset_transactions_asset_id_timestamp ON asset_transactions(asset_id, timestamp);
@@ -0,0 +1,14 @@
+-- Migration 005: Count transactions since each asset's latest checkpoint on the asset row
+-- checkpoint_asset used to COUNT the asset's transactions after its latest checkpoint on every
+-- new transaction; it now reads and maintains this counter instead.
+
+ALTER TABLE portfolio_assets ADD COLUMN transactions_since_checkpoint INTEGER DEFAULT 0;
+
+UPDATE portfolio_assets SET transactions_since_checkpoint = (
+    SELECT COUNT(*) FROM asset_transactions t
+    WHERE t.asset_id = portfolio_assets.id
+      AND t.timestamp > COALESCE(
+          (SELECT MAX(c.as_of) FROM asset_checkpoints c WHERE c.asset_id = portfolio_assets.id),
+          TIMESTAMP '1970-01-01 00:00:00'
+      )
+);
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Float, DateTime, Text, ForeignKey, Integer, Boolean
+from sqlalchemy import Column, String, Float, DateTime, Text, ForeignKey, Integer, Boolean, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 from datetime import datetime
@@ -34,6 +34,7 @@ class PortfolioModel(Base):
     total_profit_loss_percentage = Column(Float, default=0.0)
     total_realized_profit_loss = Column(Float, default=0.0)  # Total realized P&L from all sales
     total_cost_basis = Column(Float, default=0.0)  # Total amount originally invested
+    cost_basis_method = Column(String, default="fifo")  # Lot matching for sells: 'fifo', 'lifo' or 'hifo'
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -45,8 +46,8 @@ class PortfolioAssetModel(Base):
     __tablename__ = "portfolio_assets"
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
-    portfolio_id = Column(String, ForeignKey("portfolios.id"), nullable=False)
-    crypto_id = Column(String, nullable=False)
+    portfolio_id = Column(String, ForeignKey("portfolios.id"), nullable=False, index=True)
+    crypto_id = Column(String, nullable=False, index=True)  # Indexed for per-coin bulk revaluation
     symbol = Column(String, nullable=False)
     name = Column(String, nullable=False)
     amount = Column(Float, nullable=False)
@@ -55,13 +56,19 @@ class PortfolioAssetModel(Base):
     total_value = Column(Float, nullable=False)
     profit_loss = Column(Float, nullable=False)
     profit_loss_percentage = Column(Float, nullable=False)
+    transactions_since_checkpoint = Column(Integer, default=0)  # Kept by checkpoint_asset so it needs no COUNT
     
     # Relationships
     portfolio = relationship("PortfolioModel", back_populates="assets")
     transactions = relationship("AssetTransactionModel", back_populates="asset", cascade="all, delete-orphan")
+    lots = relationship("TaxLotModel", back_populates="asset", cascade="all, delete-orphan")
+    checkpoints = relationship("AssetCheckpointModel", back_populates="asset", cascade="all, delete-orphan")
 
 class AssetTransactionModel(Base):
     __tablename__ = "asset_transactions"
+    __table_args__ = (
+        Index("ix_asset_transactions_asset_id_timestamp", "asset_id", "timestamp"),
+    )
     
     id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
     asset_id = Column(String, ForeignKey("portfolio_assets.id"), nullable=False)
@@ -79,4 +86,58 @@ class AssetTransactionModel(Base):
     
     # Relationships
     asset = relationship("PortfolioAssetModel", back_populates="transactions")
-    portfolio = relationship("PortfolioModel")
\ No newline at end of file
+    portfolio = relationship("PortfolioModel")
+
+class TaxLotModel(Base):
+    __tablename__ = "tax_lots"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    asset_id = Column(String, ForeignKey("portfolio_assets.id"), nullable=False, index=True)
+    portfolio_id = Column(String, ForeignKey("portfolios.id"), nullable=False)
+    transaction_id = Column(String, ForeignKey("asset_transactions.id"), nullable=False)  # The buy that opened the lot
+    price_per_unit = Column(Float, nullable=False)
+    original_amount = Column(Float, nullable=False)
+    remaining_amount = Column(Float, nullable=False)  # 0 once the lot is fully sold
+    acquired_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    asset = relationship("PortfolioAssetModel", back_populates="lots")
+    transaction = relationship("AssetTransactionModel")
+    disposals = relationship("LotDisposalModel", back_populates="lot", cascade="all, delete-orphan")
+
+class LotDisposalModel(Base):
+    __tablename__ = "lot_disposals"
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    lot_id = Column(String, ForeignKey("tax_lots.id"), nullable=False, index=True)
+    transaction_id = Column(String, ForeignKey("asset_transactions.id"), nullable=False, index=True)  # The sell that consumed the lot
+    amount = Column(Float, nullable=False)
+    cost_basis = Column(Float, nullable=False)
+    proceeds = Column(Float, nullable=False)
+    realized_profit_loss = Column(Float, nullable=False)
+    disposed_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    lot = relationship("TaxLotModel", back_populates="disposals")
+    transaction = relationship("AssetTransactionModel")
+
+class AssetCheckpointModel(Base):
+    __tablename__ = "asset_checkpoints"
+    __table_args__ = (
+        Index("ix_asset_checkpoints_asset_id_as_of", "asset_id", "as_of"),
+    )
+    
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    asset_id = Column(String, ForeignKey("portfolio_assets.id"), nullable=False)
+    portfolio_id = Column(String, ForeignKey("portfolios.id"), nullable=False, index=True)
+    crypto_id = Column(String, nullable=False)
+    symbol = Column(String, nullable=False)
+    name = Column(String, nullable=False)
+    as_of = Column(DateTime, nullable=False)  # Timestamp of the last transaction folded into this checkpoint
+    transaction_count = Column(Integer, nullable=False)  # Number of transactions folded in
+    amount = Column(Float, nullable=False)
+    cost_basis = Column(Float, nullable=False)
+    realized_profit_loss = Column(Float, nullable=False)
+    
+    # Relationships
+    asset = relationship("PortfolioAssetModel", back_populates="checkpoints")
@@ -3,7 +3,18 @@ from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from strawberry.fastapi import GraphQLRouter
 from app.schemas.schema import schema
+from app.schemas.context import get_context
+from app.api.streams import router as streams_router
 from app.database.connection import create_tables
+from app.services.revaluation_service import revaluation_job
+from app.services.price_hub import price_poller
+from app.services.portfolio_valuation import portfolio_valuations
+from app.services.market_context import market_context_service
+from app.services.ai_jobs import ai_jobs
+from app.services.ai_providers import ai_providers
+from app.services.chat_sessions import chat_sessions
+from app.core.config import settings
+from app.services.websocket_manager import websocket_manager
 
 app = FastAPI(
     title="Crypto Portfolio Analyzer API",
@@ -15,6 +26,24 @@ app = FastAPI(
 @app.on_event("startup")
 async def startup_event():
     create_tables()
+    revaluation_job.start()
+    # Starts the broker, which must be listening before the poller's first ticks
+    await websocket_manager.start()
+    price_poller.start()
+    # Fetch the first market snapshot in the background so the first chat does not wait for it
+    market_context_service.refresh()
+    if settings.ai_warm_up_on_startup:
+        # Build the AI backend off the request path; startup does not wait for it
+        ai_providers.warm_up()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await revaluation_job.stop()
+    await price_poller.stop()
+    await portfolio_valuations.stop()
+    await ai_jobs.stop()
+    await ai_providers.aclose()
+    await websocket_manager.stop()
 
 # CORS middleware
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
@@ -35,23 +64,16 @@ async def check_admin_or_debug_access(request):
         return True
     
     # In production, check if user is admin
-    authorization = request.headers.get("authorization", "")
-    if not authorization.startswith("Bearer "):
-        return False
-    
-    token = authorization.split(" ")[1]
+    from app.utils.auth import extract_bearer_token, load_user_for_token, is_user_admin
     
-    from app.database.connection import get_db
-    from app.utils.auth import get_current_user_from_token, is_user_admin
+    token = extract_bearer_token(request.headers.get("authorization", ""))
+    if not token:
+        return False
     
-    db = next(get_db())
     try:
-        current_user = get_current_user_from_token(token, db)
-        return is_user_admin(current_user)
-    except:
+        return is_user_admin(load_user_for_token(token))
+    except Exception:
         return False
-    finally:
-        db.close()
 
 # Custom GraphQL app with admin-only playground in production
 from strawberry.fastapi import GraphQLRouter
@@ -69,8 +91,9 @@ class AdminControlledGraphQLRouter(GraphQLRouter):
         return await super().render_graphiql_page(request)
 
 # Create GraphQL router with admin controls
-graphql_app = AdminControlledGraphQLRouter(schema, graphiql=True)
+graphql_app = AdminControlledGraphQLRouter(schema, graphiql=True, context_getter=get_context)
 app.include_router(graphql_app, prefix="/cryptassist/graphql")
+app.include_router(streams_router)
 
 @app.get("/")
 async def root():
@@ -78,4 +101,11 @@ async def root():
 
 @app.get("/cryptassist/health")
 async def health():
-    return {"status": "healthy"}
\ No newline at end of file
+    return {"status": "healthy"}
+
+@app.get("/cryptassist/metrics")
+async def metrics(request: Request):
+    """Real-time fan-out and chat session gauges (admin or debug mode only)"""
+    if not await check_admin_or_debug_access(request):
+        raise HTTPException(status_code=403, detail="Metrics access restricted to administrators.")
+    return {"websockets": websocket_manager.metrics(), "chatSessions": chat_sessions.metrics()}
\ No newline at end of file
@@ -0,0 +1,34 @@
+from functools import cached_property
+from typing import Optional
+from strawberry.fastapi import BaseContext
+from app.utils.auth import AuthenticatedUser, extract_bearer_token, load_user_for_token
+
+class GraphQLContext(BaseContext):
+    """Per-request GraphQL context; the authenticated user is resolved lazily, at most once"""
+    
+    @cached_property
+    def auth_token(self) -> Optional[str]:
+        """Bearer token from the Authorization header, or the WebSocket connection_init payload"""
+        token = None
+        if self.request is not None:
+            token = extract_bearer_token(self.request.headers.get("authorization", ""))
+        if token is None and isinstance(self.connection_params, dict):
+            authorization = self.connection_params.get("authorization") or self.connection_params.get("Authorization")
+            token = extract_bearer_token(authorization)
+        return token
+    
+    @cached_property
+    def current_user(self) -> Optional[AuthenticatedUser]:
+        """The authenticated user, or None; verified and loaded only when first accessed"""
+        return load_user_for_token(self.auth_token)
+    
+    def require_user(self) -> AuthenticatedUser:
+        """Return the authenticated user or raise if the request is not authenticated"""
+        if not self.auth_token:
+            raise Exception("Authentication required")
+        if not self.current_user:
+            raise Exception("Invalid authentication token")
+        return self.current_user
+
+async def get_context() -> GraphQLContext:
+    return GraphQLContext()
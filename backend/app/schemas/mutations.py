@@ -2,10 +2,15 @@ import strawberry
 from typing import Optional, List, Dict
 from datetime import datetime, timedelta
 import uuid
-from app.schemas.types import Portfolio, PortfolioAsset, AssetTransaction, CreatePortfolioInput, AddAssetInput, UpdateAssetInput, AddTransactionInput, User, AuthResponse, RegisterInput, LoginInput
+from app.schemas.types import Portfolio, PortfolioAsset, AssetTransaction, CreatePortfolioInput, AddAssetInput, UpdateAssetInput, AddTransactionInput, User, AuthResponse, RegisterInput, LoginInput, AIJob
+from app.services.ai_jobs import ai_jobs
+from app.services.ai_providers import ai_providers
+from app.services.advice_cache import advice_cache
+from app.services.chat_sessions import chat_sessions
 from app.services.database_service import DatabaseService
+from app.services.portfolio_valuation import portfolio_valuations
 from app.database.models import PortfolioModel, PortfolioAssetModel, AssetTransactionModel, UserModel
-from app.utils.auth import validate_email, validate_password, create_user, authenticate_user, create_access_token, get_current_user_from_token
+from app.utils.auth import is_user_admin, validate_email, validate_password, create_user_async, authenticate_user_async, create_access_token
 from app.database.connection import get_db
 
 @strawberry.type
@@ -13,92 +18,27 @@ class Mutation:
     @strawberry.mutation
     async def create_portfolio(self, input: CreatePortfolioInput, info) -> Portfolio:
         """Create a new portfolio (requires authentication)"""
-        # Extract JWT token from request headers
-        request = info.context["request"]
-        authorization = request.headers.get("authorization", "")
+        # User is resolved once per request by the GraphQL context
+        current_user = info.context.require_user()
         
-        if not authorization.startswith("Bearer "):
-            raise Exception("Authentication required")
-        
-        token = authorization.split(" ")[1]
-        
-        # Get current user from token
-        db = next(get_db())
-        try:
-            current_user = get_current_user_from_token(token, db)
-            if not current_user:
-                raise Exception("Invalid authentication token")
-            
-            # Create portfolio for this user
-            with DatabaseService() as db_service:
-                portfolio_model = db_service.create_portfolio(input.name, input.description, current_user.id)
-                
-                return Portfolio(
-                    id=portfolio_model.id,
-                    name=portfolio_model.name,
-                    description=portfolio_model.description,
-                    total_value=portfolio_model.total_value,
-                    total_profit_loss=portfolio_model.total_profit_loss,
-                    total_profit_loss_percentage=portfolio_model.total_profit_loss_percentage,
-                    assets=[],
-                    created_at=portfolio_model.created_at,
-                    updated_at=portfolio_model.updated_at
-                )
-        finally:
-            db.close()
-    
-    @strawberry.mutation
-    async def create_admin_user(self, email: str, password: str, admin_secret: str) -> AuthResponse:
-        """Create an admin user (requires admin secret)"""
-        import os
-        
-        # Check admin secret
-        expected_secret = os.getenv("ADMIN_SECRET", "change-this-in-production")
-        if admin_secret != expected_secret:
-            raise Exception("Invalid admin secret")
-        
-        # Validate email format
-        if not validate_email(email):
-            raise Exception("Invalid email format")
-        
-        # Validate password strength
-        is_valid, message = validate_password(password)
-        if not is_valid:
-            raise Exception(message)
-        
-        # Get database session
-        db = next(get_db())
-        try:
-            # Check if user already exists
-            from app.utils.auth import get_user_by_email, create_admin_user
-            existing_user = get_user_by_email(db, email)
-            if existing_user:
-                raise Exception("User with this email already exists")
-            
-            # Create new admin user
-            user_model = create_admin_user(db, email, password)
-            
-            # Create access token
-            access_token = create_access_token(data={"sub": user_model.id})
-            
-            # Convert to GraphQL types
-            user = User(
-                id=user_model.id,
-                email=user_model.email,
-                is_active=user_model.is_active,
-                is_verified=user_model.is_verified,
-                is_admin=user_model.is_admin,
-                created_at=user_model.created_at,
-                last_login=user_model.last_login
+        # Create portfolio for this user
+        with DatabaseService() as db_service:
+            portfolio_model = db_service.create_portfolio(
+                input.name, input.description, current_user.id, input.cost_basis_method
             )
             
-            return AuthResponse(
-                user=user,
-                access_token=access_token
+            return Portfolio(
+                id=portfolio_model.id,
+                name=portfolio_model.name,
+                description=portfolio_model.description,
+                total_value=portfolio_model.total_value,
+                total_profit_loss=portfolio_model.total_profit_loss,
+                total_profit_loss_percentage=portfolio_model.total_profit_loss_percentage,
+                cost_basis_method=portfolio_model.cost_basis_method,
+                assets=[],
+                created_at=portfolio_model.created_at,
+                updated_at=portfolio_model.updated_at
             )
-            
-        finally:
-            db.close()
     
     @strawberry.mutation
     async def delete_portfolio(self, portfolio_id: str = strawberry.argument(name="portfolioId")) -> bool:
@@ -107,7 +47,28 @@ class Mutation:
             success = db_service.delete_portfolio(portfolio_id)
             if not success:
                 raise Exception(f"Portfolio {portfolio_id} not found")
-            return True
+        await portfolio_valuations.holdings_changed(portfolio_id)
+        return True
+    
+    @strawberry.mutation
+    async def set_cost_basis_method(
+        self,
+        info,
+        portfolio_id: str = strawberry.argument(name="portfolioId"),
+        cost_basis_method: str = strawberry.argument(name="costBasisMethod")
+    ) -> bool:
+        """Change how sells are matched against tax lots (fifo, lifo or hifo) and recompute realized P&L"""
+        current_user = info.context.require_user()
+        
+        with DatabaseService() as db_service:
+            portfolio_model = db_service.get_portfolio(portfolio_id)
+            if not portfolio_model or portfolio_model.user_id != current_user.id:
+                raise Exception(f"Portfolio {portfolio_id} not found")
+            portfolio = db_service.set_cost_basis_method(portfolio_id, cost_basis_method)
+            if not portfolio:
+                raise Exception(f"Portfolio {portfolio_id} not found")
+        await portfolio_valuations.holdings_changed(portfolio_id)
+        return True
     
     @strawberry.mutation
     async def add_asset_to_portfolio(self, input: AddAssetInput) -> PortfolioAsset:
@@ -166,6 +127,7 @@ class Mutation:
             
             # Update portfolio totals
             db_service.update_portfolio_totals(input.portfolio_id)
+            await portfolio_valuations.holdings_changed(input.portfolio_id)
             
             # Convert to GraphQL types
             initial_transaction = AssetTransaction(
@@ -204,6 +166,7 @@ class Mutation:
             success = db_service.delete_asset(asset_id)
             if success:
                 db_service.update_portfolio_totals(portfolio_id)
+                await portfolio_valuations.holdings_changed(portfolio_id)
             return success
     
     @strawberry.mutation
@@ -251,6 +214,7 @@ class Mutation:
             
             # Update portfolio totals
             db_service.update_portfolio_totals(input.portfolio_id)
+            await portfolio_valuations.holdings_changed(input.portfolio_id)
             
             # Get transactions for response
             transactions = db_service.get_asset_transactions(input.asset_id)
@@ -323,6 +287,7 @@ class Mutation:
             
             # Update portfolio totals
             db_service.update_portfolio_totals(input.portfolio_id)
+            await portfolio_valuations.holdings_changed(input.portfolio_id)
             
             return AssetTransaction(
                 id=transaction_model.id,
@@ -339,7 +304,7 @@ class Mutation:
     async def get_portfolio_advice(self, portfolio_id: str = strawberry.argument(name="portfolioId")) -> str:
         """Get AI-powered advice for a specific portfolio"""
         try:
-            from app.services.ai_service import ai_service
+            from app.services.ai_service import portfolio_advice_data
             
             with DatabaseService() as db_service:
                 # Get portfolio data
@@ -349,25 +314,10 @@ class Mutation:
                 
                 # Get assets with current prices
                 assets = db_service.get_portfolio_assets(portfolio_id)
-                
-                # Format portfolio data
-                portfolio_data = {
-                    "total_value": float(portfolio_model.total_value or 0),
-                    "assets": []
-                }
-                
-                for asset in assets:
-                    portfolio_data["assets"].append({
-                        "symbol": asset.symbol,
-                        "amount": float(asset.amount or 0),
-                        "current_price": float(asset.current_price or 0),
-                        "total_value": float(asset.total_value or 0),
-                        "profit_loss": float(asset.profit_loss or 0),
-                        "profit_loss_percentage": float(asset.profit_loss_percentage or 0)
-                    })
+                portfolio_data = portfolio_advice_data(portfolio_model, assets)
                 
                 # Get AI advice
-                advice = await ai_service.get_portfolio_advice(portfolio_data)
+                advice = await ai_providers.get().get_portfolio_advice(portfolio_data)
                 return advice
                 
         except Exception as e:
@@ -375,63 +325,76 @@ class Mutation:
             return f"I apologize, but I'm unable to provide advice at the moment due to a technical issue: {str(e)}. Please try again later or check that your GitHub token is properly configured."
     
     @strawberry.mutation
-    async def chat_with_assistant(self, message: str, context: Optional[str] = None) -> str:
-        """Chat with the AI assistant about crypto and portfolio management"""
+    async def request_portfolio_advice(
+        self,
+        info,
+        portfolio_id: str = strawberry.argument(name="portfolioId"),
+        priority: Optional[int] = None
+    ) -> AIJob:
+        """Queue AI advice for one of the current user's portfolios; poll aiJob or subscribe to aiJobUpdates for the result"""
+        from app.services.ai_service import portfolio_advice_data
+        
+        current_user = info.context.require_user()
+        with DatabaseService() as db_service:
+            portfolio_model = db_service.get_portfolio(portfolio_id)
+            if not portfolio_model or portfolio_model.user_id != current_user.id:
+                raise Exception(f"Portfolio {portfolio_id} not found")
+            portfolio_data = portfolio_advice_data(portfolio_model, db_service.get_portfolio_assets(portfolio_id))
+        
+        # The queue is shared: only admins may reorder it (0 runs first, 9 last)
+        if priority is None or not is_user_admin(current_user):
+            priority = 5
+        
+        # Identical requests still in flight share one job
+        dedupe_key = f"{current_user.id}:portfolio_advice:{advice_cache.key_for(portfolio_data)}"
+        job = await ai_jobs.submit(
+            "portfolio_advice",
+            {"portfolio_data": portfolio_data},
+            user_id=current_user.id,
+            priority=min(max(priority, 0), 9),
+            dedupe_key=dedupe_key
+        )
+        return AIJob.from_job(job)
+    
+    @strawberry.mutation
+    async def chat_with_assistant(
+        self,
+        info,
+        message: str,
+        context: Optional[str] = None,
+        session_id: Optional[str] = None
+    ) -> str:
+        """Chat with the AI assistant about crypto and portfolio management; turns sent with a sessionId from startChatSession are remembered"""
+        user_id = info.context.current_user.id if info.context.current_user else None
+        history = chat_sessions.history(session_id, user_id) if session_id else None
         try:
-            from app.services.ai_service import ai_service
+            ai_service = ai_providers.get()
             
-            system_prompt = """You are CryptoAssist, an expert cryptocurrency advisor with access to real-time market data. You provide current, actionable insights about:
-
-- Current cryptocurrency prices, trends, and market movements  
-- Portfolio allocation strategies based on current market conditions
-- DeFi protocols, staking opportunities, and yield farming
-- Trading patterns, market cycles, and entry/exit strategies
-- Blockchain technology, tokenomics, and project evaluation
-- Real-time market sentiment and macro factors
-
-**IMPORTANT**: You have access to current, real-time market data provided in the system messages. Always use this current data in your analysis rather than outdated information from your training. Reference current prices, recent price movements, and today's market sentiment.
-
-You can:
-- Analyze current market conditions and provide timely insights
-- Discuss specific cryptocurrencies using their current prices and trends
-- Explain current market movements and what's driving them today
-- Recommend actions based on real-time market data
-- Share insights about current market cycles and timing
-- Compare current prices to historical levels and trends
-
-Always include this disclaimer: "This is educational information and market analysis based on current data, not personalized financial advice. Cryptocurrency investments carry high risk and volatility. Only invest what you can afford to lose and always conduct your own research (DYOR) before making investment decisions."
-
-Be detailed, analytical, and focus on current market conditions with specific, timely insights."""
-
             # Get current market data for context
             market_context = await ai_service.get_current_market_context()
-            
-            # Build messages array
-            messages = [
-                {"role": "system", "content": system_prompt},
-                {"role": "system", "content": market_context}
-            ]
-            
-            # Add additional context if provided
-            if context:
-                messages.append({
-                    "role": "system", 
-                    "content": f"Additional context: {context}"
-                })
-            
-            # Add user message
-            messages.append({
-                "role": "user", 
-                "content": message
-            })
+            messages = ai_service.build_chat_messages(message, market_context, context, history)
             
             # Get AI response
             response = await ai_service.chat_completion(messages, temperature=0.7)
+            if session_id:
+                chat_sessions.record(session_id, user_id, message, response)
             return response
             
         except Exception as e:
             return f"I apologize, but I'm experiencing technical difficulties right now: {str(e)}. Please try again in a moment!"
     
+    @strawberry.mutation
+    async def start_chat_session(self, info) -> str:
+        """Start a chat session and return its id, to be passed as sessionId"""
+        user_id = info.context.current_user.id if info.context.current_user else None
+        return chat_sessions.start(user_id)
+    
+    @strawberry.mutation
+    async def end_chat_session(self, info, session_id: str) -> bool:
+        """Forget a chat session's history"""
+        user_id = info.context.current_user.id if info.context.current_user else None
+        return chat_sessions.end(session_id, user_id)
+    
     @strawberry.mutation
     async def register(self, input: RegisterInput) -> AuthResponse:
         """Register a new user"""
@@ -454,60 +417,7 @@ Be detailed, analytical, and focus on current market conditions with specific, t
                 raise Exception("User with this email already exists")
             
             # Create new user
-            user_model = create_user(db, input.email, input.password)
-            
-            # Create access token
-            access_token = create_access_token(data={"sub": user_model.id})
-            
-            # Convert to GraphQL types
-            user = User(
-                id=user_model.id,
-                email=user_model.email,
-                is_active=user_model.is_active,
-                is_verified=user_model.is_verified,
-                is_admin=user_model.is_admin,
-                created_at=user_model.created_at,
-                last_login=user_model.last_login
-            )
-            
-            return AuthResponse(
-                user=user,
-                access_token=access_token
-            )
-            
-        finally:
-            db.close()
-    
-    @strawberry.mutation
-    async def create_admin_user(self, email: str, password: str, admin_secret: str) -> AuthResponse:
-        """Create an admin user (requires admin secret)"""
-        import os
-        
-        # Check admin secret
-        expected_secret = os.getenv("ADMIN_SECRET", "change-this-in-production")
-        if admin_secret != expected_secret:
-            raise Exception("Invalid admin secret")
-        
-        # Validate email format
-        if not validate_email(email):
-            raise Exception("Invalid email format")
-        
-        # Validate password strength
-        is_valid, message = validate_password(password)
-        if not is_valid:
-            raise Exception(message)
-        
-        # Get database session
-        db = next(get_db())
-        try:
-            # Check if user already exists
-            from app.utils.auth import get_user_by_email, create_admin_user
-            existing_user = get_user_by_email(db, email)
-            if existing_user:
-                raise Exception("User with this email already exists")
-            
-            # Create new admin user
-            user_model = create_admin_user(db, email, password)
+            user_model = await create_user_async(db, input.email, input.password)
             
             # Create access token
             access_token = create_access_token(data={"sub": user_model.id})
@@ -538,7 +448,7 @@ Be detailed, analytical, and focus on current market conditions with specific, t
         db = next(get_db())
         try:
             # Authenticate user
-            user_model = authenticate_user(db, input.email, input.password)
+            user_model = await authenticate_user_async(db, input.email, input.password)
             if not user_model:
                 raise Exception("Invalid email or password")
             
@@ -590,13 +500,13 @@ Be detailed, analytical, and focus on current market conditions with specific, t
         db = next(get_db())
         try:
             # Check if user already exists
-            from app.utils.auth import get_user_by_email, create_admin_user
+            from app.utils.auth import get_user_by_email
             existing_user = get_user_by_email(db, email)
             if existing_user:
                 raise Exception("User with this email already exists")
             
             # Create new admin user
-            user_model = create_admin_user(db, email, password)
+            user_model = await create_user_async(db, email, password, is_admin=True)
             
             # Create access token
             access_token = create_access_token(data={"sub": user_model.id})
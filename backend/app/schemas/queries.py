@@ -2,11 +2,14 @@ import strawberry
 from typing import List, Optional
 from datetime import datetime
 from fastapi import Request
-from app.schemas.types import CryptoCurrency, Portfolio, PortfolioAsset, AssetTransaction, PriceData
+from app.core.config import settings
+from app.schemas.types import CryptoCurrency, Portfolio, PortfolioAsset, AssetTransaction, PriceData, PortfolioSnapshot, AssetSnapshot, AIJob, PortfolioAnalytics, PortfolioValueHistory
+from app.services.ai_jobs import ai_jobs
 from app.services.crypto_api import crypto_api_service
 from app.services.database_service import DatabaseService
-from app.utils.auth import get_current_user_from_token
-from app.database.connection import get_db
+from app.services.portfolio_analytics import portfolio_analytics
+from app.services.snapshot_valuation import profit_loss_percentage, snapshot_valuer
+from app.services.value_history import portfolio_value_history
 
 @strawberry.type
 class Query:
@@ -92,83 +95,93 @@ class Query:
             return None
     
     @strawberry.field
-    async def portfolios(self, info) -> List[Portfolio]:
-        """Get user portfolios (requires authentication)"""
-        # Extract JWT token from request headers
-        request = info.context["request"]
-        authorization = request.headers.get("authorization", "")
-        
-        if not authorization.startswith("Bearer "):
+    async def portfolios(self, info, live: bool = False) -> List[Portfolio]:
+        """Get user portfolios (requires authentication); with live, values are recomputed at current market prices"""
+        # User is resolved once per request by the GraphQL context
+        current_user = info.context.current_user
+        if not current_user:
             # Return empty list for unauthenticated users
             return []
         
-        token = authorization.split(" ")[1]
-        
-        # Get current user from token
-        db = next(get_db())
-        try:
-            current_user = get_current_user_from_token(token, db)
-            if not current_user:
-                return []
+        # Get portfolios for this user
+        with DatabaseService() as db_service:
+            portfolio_models = db_service.get_portfolios_by_user(current_user.id)
+            # Only active assets (amount > 0) are shown in the main display
+            active_assets = [db_service.get_active_portfolio_assets(portfolio_model.id) for portfolio_model in portfolio_models]
             
-            # Get portfolios for this user
-            with DatabaseService() as db_service:
-                portfolio_models = db_service.get_portfolios_by_user(current_user.id)
-                portfolios = []
-                
-                for portfolio_model in portfolio_models:
-                    # Convert only active assets (amount > 0) to GraphQL types for main display
-                    active_assets = db_service.get_active_portfolio_assets(portfolio_model.id)
-                    assets = []
-                    for asset_model in active_assets:
-                        # Get transactions for this asset
-                        transaction_models = db_service.get_asset_transactions(asset_model.id)
-                        transactions = [
-                            AssetTransaction(
-                                id=t.id,
-                                transaction_type=t.transaction_type,
-                                amount=t.amount,
-                                price_per_unit=t.price_per_unit,
-                                total_value=t.total_value,
-                                realized_profit_loss=t.realized_profit_loss,
-                                timestamp=t.timestamp,
-                                notes=t.notes
-                            ) for t in transaction_models
-                        ]
-                        
-                        asset = PortfolioAsset(
-                            id=asset_model.id,
-                            crypto_id=asset_model.crypto_id,
-                            symbol=asset_model.symbol,
-                            name=asset_model.name,
-                            amount=asset_model.amount,
-                            average_buy_price=asset_model.average_buy_price,
-                            current_price=asset_model.current_price,
-                            total_value=asset_model.total_value,
-                            profit_loss=asset_model.profit_loss,
-                            profit_loss_percentage=asset_model.profit_loss_percentage,
-                            transactions=transactions
-                        )
-                        assets.append(asset)
+            valuations = None
+            if live:
+                # One price lookup and one vectorized pass over every holding of every portfolio
+                holdings = [asset_model for assets in active_assets for asset_model in assets]
+                portfolio_index = [index for index, assets in enumerate(active_assets) for _ in assets]
+                valuations = await snapshot_valuer.value(holdings, portfolio_index, len(portfolio_models))
+            
+            portfolios = []
+            row = 0
+            for portfolio_index, portfolio_model in enumerate(portfolio_models):
+                assets = []
+                for asset_model in active_assets[portfolio_index]:
+                    # Get transactions for this asset
+                    transaction_models = db_service.get_asset_transactions(asset_model.id)
+                    transactions = [
+                        AssetTransaction(
+                            id=t.id,
+                            transaction_type=t.transaction_type,
+                            amount=t.amount,
+                            price_per_unit=t.price_per_unit,
+                            total_value=t.total_value,
+                            realized_profit_loss=t.realized_profit_loss,
+                            timestamp=t.timestamp,
+                            notes=t.notes
+                        ) for t in transaction_models
+                    ]
                     
-                    portfolio = Portfolio(
-                        id=portfolio_model.id,
-                        name=portfolio_model.name,
-                        description=portfolio_model.description,
-                        total_value=portfolio_model.total_value,
-                        total_profit_loss=portfolio_model.total_profit_loss,
-                        total_profit_loss_percentage=portfolio_model.total_profit_loss_percentage,
-                        total_realized_profit_loss=portfolio_model.total_realized_profit_loss,
-                        total_cost_basis=portfolio_model.total_cost_basis,
-                        assets=assets,
-                        created_at=portfolio_model.created_at,
-                        updated_at=portfolio_model.updated_at
+                    asset = PortfolioAsset(
+                        id=asset_model.id,
+                        crypto_id=asset_model.crypto_id,
+                        symbol=asset_model.symbol,
+                        name=asset_model.name,
+                        amount=asset_model.amount,
+                        average_buy_price=asset_model.average_buy_price,
+                        current_price=asset_model.current_price,
+                        total_value=asset_model.total_value,
+                        profit_loss=asset_model.profit_loss,
+                        profit_loss_percentage=asset_model.profit_loss_percentage,
+                        transactions=transactions
                     )
-                    portfolios.append(portfolio)
+                    if valuations is not None:
+                        asset.current_price = float(valuations.current_price[row])
+                        asset.total_value = float(valuations.total_value[row])
+                        asset.profit_loss = float(valuations.profit_loss[row])
+                        asset.profit_loss_percentage = float(valuations.profit_loss_percentage[row])
+                    row += 1
+                    assets.append(asset)
                 
-                return portfolios
-        finally:
-            db.close()
+                portfolio = Portfolio(
+                    id=portfolio_model.id,
+                    name=portfolio_model.name,
+                    description=portfolio_model.description,
+                    total_value=portfolio_model.total_value,
+                    total_profit_loss=portfolio_model.total_profit_loss,
+                    total_profit_loss_percentage=portfolio_model.total_profit_loss_percentage,
+                    total_realized_profit_loss=portfolio_model.total_realized_profit_loss,
+                    total_cost_basis=portfolio_model.total_cost_basis,
+                    cost_basis_method=portfolio_model.cost_basis_method or "fifo",
+                    assets=assets,
+                    created_at=portfolio_model.created_at,
+                    updated_at=portfolio_model.updated_at
+                )
+                if valuations is not None:
+                    portfolio.total_value = float(valuations.portfolio_total_value[portfolio_index])
+                    portfolio.total_profit_loss = float(valuations.portfolio_profit_loss[portfolio_index])
+                    portfolio.total_profit_loss_percentage = profit_loss_percentage(
+                        portfolio.total_profit_loss,
+                        portfolio_model.total_realized_profit_loss,
+                        portfolio_model.total_cost_basis
+                    )
+                portfolios.append(portfolio)
+            
+            return portfolios
     
     @strawberry.field
     async def portfolio(self, id: str) -> Optional[Portfolio]:
@@ -220,11 +233,45 @@ class Query:
                 total_profit_loss=portfolio_model.total_profit_loss,
                 total_profit_loss_percentage=portfolio_model.total_profit_loss_percentage,
                 total_realized_profit_loss=portfolio_model.total_realized_profit_loss,
+                cost_basis_method=portfolio_model.cost_basis_method or "fifo",
                 assets=assets,
                 created_at=portfolio_model.created_at,
                 updated_at=portfolio_model.updated_at
             )
     
+    @strawberry.field
+    async def portfolio_as_of(self, info, id: str, timestamp: datetime) -> Optional[PortfolioSnapshot]:
+        """Get one of the current user's portfolios as it was at a past point in time"""
+        current_user = info.context.require_user()
+        
+        with DatabaseService() as db_service:
+            portfolio_model = db_service.get_portfolio(id)
+            if not portfolio_model or portfolio_model.user_id != current_user.id:
+                return None
+            
+            # Each asset starts from its nearest checkpoint and replays only later transactions
+            states = db_service.get_portfolio_state_as_of(id, timestamp)
+            assets = [
+                AssetSnapshot(
+                    crypto_id=state.crypto_id,
+                    symbol=state.symbol,
+                    name=state.name,
+                    amount=state.amount,
+                    cost_basis=state.cost_basis,
+                    average_buy_price=state.average_buy_price,
+                    realized_profit_loss=state.realized_profit_loss
+                ) for state in states
+            ]
+            
+            return PortfolioSnapshot(
+                id=portfolio_model.id,
+                name=portfolio_model.name,
+                as_of=timestamp,
+                open_cost_basis=sum(state.cost_basis for state in states),
+                total_realized_profit_loss=sum(state.realized_profit_loss for state in states),
+                assets=assets
+            )
+    
     @strawberry.field
     async def priceHistory(
         self, 
@@ -268,4 +315,45 @@ class Query:
                 )
                 transactions.append(transaction)
             
-            return transactions
\ No newline at end of file
+            return transactions
+    
+    @strawberry.field
+    async def ai_job(self, info, id: str) -> Optional[AIJob]:
+        """Status and result of one of the current user's AI jobs"""
+        current_user = info.context.require_user()
+        job = await ai_jobs.get(id)
+        if not job or job.user_id != current_user.id:
+            return None
+        return AIJob.from_job(job)
+    
+    @strawberry.field
+    async def portfolio_analytics(self, info, id: str, window: int = 90) -> Optional[PortfolioAnalytics]:
+        """Risk analytics of one of the current user's portfolios over the last `window` days"""
+        current_user = info.context.require_user()
+        if window < 2 or window > settings.analytics_max_window_days:
+            raise Exception(f"Window must be between 2 and {settings.analytics_max_window_days} days")
+        with DatabaseService() as db_service:
+            portfolio_model = db_service.get_portfolio(id)
+            if not portfolio_model or portfolio_model.user_id != current_user.id:
+                return None
+            assets = db_service.get_active_portfolio_assets(id)
+            result = await portfolio_analytics.analyze(portfolio_model, assets, window)
+        return PortfolioAnalytics.from_result(result)
+    
+    @strawberry.field
+    async def portfolio_value_history(
+        self, info, id: str, days: int = 90, resolution: str = "daily"
+    ) -> Optional[PortfolioValueHistory]:
+        """Value, cost basis and P&L of one of the current user's portfolios over the last `days` days"""
+        current_user = info.context.require_user()
+        if days < 1 or days > settings.value_history_max_days:
+            raise Exception(f"Days must be between 1 and {settings.value_history_max_days}")
+        with DatabaseService() as db_service:
+            portfolio_model = db_service.get_portfolio(id)
+            if not portfolio_model or portfolio_model.user_id != current_user.id:
+                return None
+        try:
+            result = await portfolio_value_history.history(id, days, resolution)
+        except ValueError as e:
+            raise Exception(str(e))
+        return PortfolioValueHistory.from_result(result)
@@ -1,7 +1,13 @@
 import strawberry
 import asyncio
-from typing import AsyncGenerator
-from app.schemas.types import PriceData
+from typing import AsyncGenerator, Optional
+from app.schemas.types import PriceData, PortfolioValuation, AIJob
+from app.services.ai_jobs import ai_jobs
+from app.services.ai_providers import ai_providers
+from app.services.chat_sessions import chat_sessions
+from app.services.database_service import DatabaseService
+from app.services.portfolio_valuation import portfolio_valuations
+from app.services.price_hub import price_hub
 
 @strawberry.type
 class Subscription:
@@ -10,23 +16,96 @@ class Subscription:
         self, crypto_ids: list[str]
     ) -> AsyncGenerator[PriceData, None]:
         """Subscribe to real-time price updates for specific cryptocurrencies"""
-        # TODO: Implement real-time price updates
-        # This is a placeholder implementation
-        while True:
-            await asyncio.sleep(1)  # Wait 1 second
-            # Mock price data - replace with real WebSocket/API integration
-            for crypto_id in crypto_ids:
-                yield PriceData(
-                    timestamp=int(asyncio.get_event_loop().time()),
-                    price=50000.0  # Mock price
-                )
+        # Ticks come from the shared price hub, so upstream polling does not grow with subscribers
+        subscription = price_hub.subscribe(crypto_ids)
+        try:
+            # Send the last known prices right away instead of waiting for the next poll
+            for tick in price_hub.latest_ticks(crypto_ids):
+                yield PriceData(timestamp=str(tick.timestamp), price=tick.price, crypto_id=tick.crypto_id)
+            
+            async for tick in subscription:
+                yield PriceData(timestamp=str(tick.timestamp), price=tick.price, crypto_id=tick.crypto_id)
+        finally:
+            subscription.close()
     
     @strawberry.subscription
     async def portfolio_updates(
-        self, portfolio_id: str
+        self, info, portfolio_id: str
+    ) -> AsyncGenerator[PortfolioValuation, None]:
+        """Subscribe to live value changes of one of the current user's portfolios"""
+        current_user = info.context.require_user()
+        if portfolio_valuations.get_owner(portfolio_id) != current_user.id:
+            raise Exception(f"Portfolio {portfolio_id} not found")
+        
+        # Only the latest valuation matters, so a slow client skips intermediate ones
+        updates: asyncio.Queue = asyncio.Queue(maxsize=1)
+        def listener(valuation):
+            if updates.full():
+                updates.get_nowait()
+            updates.put_nowait(valuation)
+        
+        if not portfolio_valuations.add_listener(portfolio_id, listener):
+            raise Exception(f"Portfolio {portfolio_id} not found")
+        try:
+            while True:
+                valuation = await updates.get()
+                if valuation.get("deleted"):
+                    # The portfolio is gone, so no further updates will come
+                    return
+                yield PortfolioValuation(
+                    portfolio_id=valuation["portfolio_id"],
+                    total_value=valuation["total_value"],
+                    total_profit_loss=valuation["total_profit_loss"],
+                    total_profit_loss_percentage=valuation["total_profit_loss_percentage"],
+                    timestamp=str(valuation["timestamp"])
+                )
+        finally:
+            portfolio_valuations.remove_listener(portfolio_id, listener)
+    
+    @strawberry.subscription
+    async def chat_stream(
+        self, info, message: str, context: Optional[str] = None,
+        session_id: Optional[str] = None
     ) -> AsyncGenerator[str, None]:
-        """Subscribe to portfolio value changes"""
-        # TODO: Implement real-time portfolio updates
-        while True:
-            await asyncio.sleep(5)  # Wait 5 seconds
-            yield f"Portfolio {portfolio_id} updated"
\ No newline at end of file
+        """Chat with the AI assistant, receiving the answer in chunks as it is generated; sessionId comes from startChatSession"""
+        ai_service = ai_providers.get()
+        user_id = info.context.current_user.id if info.context.current_user else None
+        history = chat_sessions.history(session_id, user_id) if session_id else None
+        
+        market_context = await ai_service.get_current_market_context()
+        messages = ai_service.build_chat_messages(message, market_context, context, history)
+        chunks = ai_service.stream_chat_completion(messages, temperature=0.7)
+        if session_id:
+            chunks = chat_sessions.recording(session_id, user_id, message, chunks)
+        async for chunk in chunks:
+            yield chunk
+    
+    @strawberry.subscription
+    async def portfolio_advice_stream(
+        self, info, portfolio_id: str
+    ) -> AsyncGenerator[str, None]:
+        """Stream AI advice for one of the current user's portfolios as it is generated"""
+        from app.services.ai_service import portfolio_advice_data
+        
+        current_user = info.context.require_user()
+        with DatabaseService() as db_service:
+            portfolio_model = db_service.get_portfolio(portfolio_id)
+            if not portfolio_model or portfolio_model.user_id != current_user.id:
+                raise Exception(f"Portfolio {portfolio_id} not found")
+            portfolio_data = portfolio_advice_data(portfolio_model, db_service.get_portfolio_assets(portfolio_id))
+        
+        async for chunk in ai_providers.get().stream_portfolio_advice(portfolio_data):
+            yield chunk
+    
+    @strawberry.subscription
+    async def ai_job_updates(
+        self, info, id: str
+    ) -> AsyncGenerator[AIJob, None]:
+        """Receive an AI job's status changes, ending with its result"""
+        current_user = info.context.require_user()
+        job = await ai_jobs.get(id)
+        if not job or job.user_id != current_user.id:
+            raise Exception(f"AI job {id} not found")
+        
+        async for snapshot in ai_jobs.watch(id):
+            yield AIJob.from_job(snapshot)
@@ -68,19 +68,164 @@ class Portfolio:
     total_profit_loss_percentage: float = strawberry.field(name="totalProfitLossPercentage")
     total_realized_profit_loss: float = strawberry.field(name="totalRealizedProfitLoss", default=0.0)
     total_cost_basis: float = strawberry.field(name="totalCostBasis", default=0.0)
+    cost_basis_method: str = strawberry.field(name="costBasisMethod", default="fifo")  # "fifo", "lifo" or "hifo"
     assets: List[PortfolioAsset]
     created_at: datetime = strawberry.field(name="createdAt")
     updated_at: datetime = strawberry.field(name="updatedAt")
 
+@strawberry.type
+class AssetSnapshot:
+    crypto_id: str = strawberry.field(name="cryptoId")
+    symbol: str
+    name: str
+    amount: float
+    cost_basis: float = strawberry.field(name="costBasis")
+    average_buy_price: float = strawberry.field(name="averageBuyPrice")
+    realized_profit_loss: float = strawberry.field(name="realizedProfitLoss")
+
+@strawberry.type
+class PortfolioSnapshot:
+    id: str
+    name: str
+    as_of: datetime = strawberry.field(name="asOf")
+    open_cost_basis: float = strawberry.field(name="openCostBasis")  # Cost of the units still held, unlike Portfolio.totalCostBasis
+    total_realized_profit_loss: float = strawberry.field(name="totalRealizedProfitLoss")
+    assets: List[AssetSnapshot]
+
+@strawberry.type
+class PortfolioValuation:
+    portfolio_id: str = strawberry.field(name="portfolioId")
+    total_value: float = strawberry.field(name="totalValue")
+    total_profit_loss: float = strawberry.field(name="totalProfitLoss")
+    total_profit_loss_percentage: float = strawberry.field(name="totalProfitLossPercentage")
+    timestamp: str  # Milliseconds since epoch, as a string like PriceData
+
+@strawberry.type
+class AllocationWeight:
+    crypto_id: str = strawberry.field(name="cryptoId")
+    symbol: str
+    value: float
+    weight: float  # Fraction of portfolio value (0 to 1)
+
+@strawberry.type
+class PortfolioAnalytics:
+    """Risk statistics of current holdings over a trailing window; ratios and returns are fractions"""
+    portfolio_id: str = strawberry.field(name="portfolioId")
+    window: int  # Days of price history
+    total_value: float = strawberry.field(name="totalValue")
+    weights: List[AllocationWeight]
+    observations: int  # Daily returns behind the statistics
+    annualized_return: Optional[float] = strawberry.field(name="annualizedReturn", default=None)
+    annualized_volatility: Optional[float] = strawberry.field(name="annualizedVolatility", default=None)
+    max_drawdown: Optional[float] = strawberry.field(name="maxDrawdown", default=None)
+    sharpe_ratio: Optional[float] = strawberry.field(name="sharpeRatio", default=None)
+    sortino_ratio: Optional[float] = strawberry.field(name="sortinoRatio", default=None)
+    value_at_risk: Optional[float] = strawberry.field(name="valueAtRisk", default=None)  # One-day historical VaR
+    conditional_value_at_risk: Optional[float] = strawberry.field(name="conditionalValueAtRisk", default=None)
+    beta: Optional[float] = None  # Versus BTC
+    missing_history: List[str] = strawberry.field(name="missingHistory", default_factory=list)  # Crypto ids left out of the series
+
+    @classmethod
+    def from_result(cls, result) -> "PortfolioAnalytics":
+        return cls(
+            portfolio_id=result.portfolio_id,
+            window=result.window,
+            total_value=result.total_value,
+            weights=[
+                AllocationWeight(crypto_id=weight.crypto_id, symbol=weight.symbol, value=weight.value, weight=weight.weight)
+                for weight in result.weights
+            ],
+            observations=result.observations,
+            annualized_return=result.annualized_return,
+            annualized_volatility=result.annualized_volatility,
+            max_drawdown=result.max_drawdown,
+            sharpe_ratio=result.sharpe_ratio,
+            sortino_ratio=result.sortino_ratio,
+            value_at_risk=result.value_at_risk,
+            conditional_value_at_risk=result.conditional_value_at_risk,
+            beta=result.beta,
+            missing_history=result.missing_history or []
+        )
+
+@strawberry.type
+class PortfolioValuePoint:
+    timestamp: str  # Milliseconds since epoch (UTC midnight of the day), as a string like PriceData
+    value: float
+    cost_basis: float = strawberry.field(name="costBasis")
+    unrealized_profit_loss: float = strawberry.field(name="unrealizedProfitLoss")
+    realized_profit_loss: float = strawberry.field(name="realizedProfitLoss")
+    total_profit_loss: float = strawberry.field(name="totalProfitLoss")
+
+@strawberry.type
+class PortfolioValueHistory:
+    portfolio_id: str = strawberry.field(name="portfolioId")
+    days: int
+    resolution: str  # "daily" or "weekly"
+    points: List[PortfolioValuePoint]
+    missing_history: List[str] = strawberry.field(name="missingHistory", default_factory=list)  # Crypto ids held on days without a price, valued at zero there
+
+    @classmethod
+    def from_result(cls, result) -> "PortfolioValueHistory":
+        unrealized = result.unrealized_profit_loss
+        return cls(
+            portfolio_id=result.portfolio_id,
+            days=result.days,
+            resolution=result.resolution,
+            points=[
+                PortfolioValuePoint(
+                    timestamp=str(int(timestamp)),
+                    value=value,
+                    cost_basis=cost_basis,
+                    unrealized_profit_loss=unrealized_pl,
+                    realized_profit_loss=realized_pl,
+                    total_profit_loss=unrealized_pl + realized_pl
+                )
+                for timestamp, value, cost_basis, unrealized_pl, realized_pl in zip(
+                    result.timestamps.tolist(), result.value.tolist(), result.cost_basis.tolist(),
+                    unrealized.tolist(), result.realized_profit_loss.tolist()
+                )
+            ],
+            missing_history=result.missing_history
+        )
+
+@strawberry.type
+class AIJob:
+    id: str
+    kind: str
+    status: str  # "queued", "running", "completed" or "failed"
+    priority: int
+    result: Optional[str] = None
+    error: Optional[str] = None
+    created_at: datetime = strawberry.field(name="createdAt")
+    started_at: Optional[datetime] = strawberry.field(name="startedAt", default=None)
+    completed_at: Optional[datetime] = strawberry.field(name="completedAt", default=None)
+
+    @classmethod
+    def from_job(cls, job) -> "AIJob":
+        to_datetime = lambda timestamp: datetime.utcfromtimestamp(timestamp) if timestamp else None
+        return cls(
+            id=job.id,
+            kind=job.kind,
+            status=job.status,
+            priority=job.priority,
+            result=job.result,
+            error=job.error,
+            created_at=to_datetime(job.created_at),
+            started_at=to_datetime(job.started_at),
+            completed_at=to_datetime(job.completed_at)
+        )
+
 @strawberry.type
 class PriceData:
     timestamp: str  # Use string for large timestamp values
     price: float
+    crypto_id: Optional[str] = strawberry.field(name="cryptoId", default=None)  # Set on live price updates
 
 @strawberry.input
 class CreatePortfolioInput:
     name: str
     description: Optional[str] = None
+    cost_basis_method: str = strawberry.field(name="costBasisMethod", default="fifo")  # "fifo", "lifo" or "hifo"
 
 @strawberry.input
 class AddAssetInput:
@@ -0,0 +1,88 @@
+"""
+Content-addressed cache for AI portfolio advice
+"""
+import hashlib
+import json
+import time
+from typing import Dict, Optional
+from app.core.config import settings
+from app.utils.cache import TTLCache
+
+def normalize_portfolio_data(portfolio_data: Dict) -> Dict:
+    """Canonical form of advice input: assets sorted, numbers rounded to what the prompt shows"""
+    assets = [
+        {
+            "symbol": asset.get("symbol", ""),
+            "amount": round(float(asset.get("amount", 0)), 6),
+            "current_price": round(float(asset.get("current_price", 0)), 4),
+            "total_value": round(float(asset.get("total_value", 0)), 2),
+            "profit_loss": round(float(asset.get("profit_loss", 0)), 2),
+            "profit_loss_percentage": round(float(asset.get("profit_loss_percentage", 0)), 2)
+        }
+        for asset in portfolio_data.get("assets", [])
+    ]
+    assets.sort(key=lambda asset: (asset["symbol"], asset["amount"]))
+    return {"total_value": round(float(portfolio_data.get("total_value", 0)), 2), "assets": assets}
+
+class AdviceCache:
+    """Advice keyed by a hash of the normalized portfolio and the market snapshot it was given.
+
+    Entries live in a size-bounded in-process TTL cache, or in Redis when
+    ADVICE_CACHE_BACKEND is "redis" so they survive restarts and are shared by workers.
+    """
+
+    def __init__(self, backend: str = "memory", ttl_seconds: int = 900, max_entries: int = 1000,
+                 market_bucket_seconds: int = 300, redis_url: Optional[str] = None):
+        if backend not in ("memory", "redis"):
+            raise ValueError(f"Unknown advice cache backend '{backend}'")
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.market_bucket_seconds = market_bucket_seconds
+        self.redis_url = redis_url
+        self._memory = TTLCache(max_entries, ttl_seconds)
+        self._redis = None
+
+    def key_for(self, portfolio_data: Dict, market_context: Optional[str] = None) -> str:
+        """Content address of an advice request"""
+        # Without an explicit market snapshot, advice is reused within one time bucket
+        market = market_context if market_context is not None else f"bucket:{int(time.time() // self.market_bucket_seconds)}"
+        document = json.dumps(
+            {"portfolio": normalize_portfolio_data(portfolio_data), "market": market},
+            sort_keys=True,
+            separators=(",", ":")
+        )
+        return hashlib.sha256(document.encode()).hexdigest()
+
+    def _client(self):
+        if self._redis is None:
+            # Imported lazily so the memory backend works without a Redis client installed
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        return self._redis
+
+    async def get(self, key: str) -> Optional[str]:
+        if self.backend == "memory":
+            return self._memory.get(key)
+        try:
+            return await self._client().get(f"cryptassist:advice:{key}")
+        except Exception as e:
+            print(f"Error reading advice cache: {e}")
+            return None
+
+    async def set(self, key: str, advice: str):
+        if self.backend == "memory":
+            self._memory.set(key, advice)
+            return
+        try:
+            await self._client().set(f"cryptassist:advice:{key}", advice, ex=self.ttl_seconds)
+        except Exception as e:
+            print(f"Error writing advice cache: {e}")
+
+# Global instance
+advice_cache = AdviceCache(
+    backend=settings.advice_cache_backend,
+    ttl_seconds=settings.advice_cache_ttl_seconds,
+    max_entries=settings.advice_cache_max_entries,
+    market_bucket_seconds=settings.advice_cache_market_bucket_seconds,
+    redis_url=settings.redis_url
+)
@@ -0,0 +1,36 @@
+"""
+Celery app running AI jobs on separate workers (AI_JOB_BACKEND=celery)
+
+Start workers with:
+    celery -A app.services.ai_celery worker --loglevel=info
+"""
+import asyncio
+from typing import Any, Dict, Optional
+from celery import Celery
+from app.core.config import settings
+from app.services.ai_jobs import DEDUPE_KEY, JOB_HANDLERS
+
+celery_app = Celery("cryptassist", broker=settings.redis_url, backend=settings.redis_url)
+celery_app.conf.update(
+    task_track_started=True,
+    result_expires=settings.ai_job_retention_seconds,
+    # Honour per-job priorities on the Redis broker (0 runs first)
+    broker_transport_options={"priority_steps": list(range(10)), "queue_order_strategy": "priority"},
+)
+
+_worker_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def _run(coroutine):
+    # One event loop per worker process, so the AI service's pooled client survives between tasks
+    global _worker_loop
+    if _worker_loop is None:
+        _worker_loop = asyncio.new_event_loop()
+    return _worker_loop.run_until_complete(coroutine)
+
+@celery_app.task(name="cryptassist.ai_job")
+def run_ai_job(kind: str, payload: Dict[str, Any], dedupe_key: Optional[str] = None) -> str:
+    try:
+        return _run(JOB_HANDLERS[kind](payload))
+    finally:
+        if dedupe_key is not None:
+            celery_app.backend.client.delete(DEDUPE_KEY.format(dedupe_key))
@@ -0,0 +1,269 @@
+"""
+Asynchronous AI jobs: enqueue now, fetch or subscribe to the result later
+"""
+import asyncio
+import itertools
+import json
+import time
+import uuid
+from dataclasses import dataclass, replace
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+from app.core.config import settings
+
+FINISHED_STATUSES = ("completed", "failed")
+
+# Redis keys used by the Celery backend
+JOB_KEY = "cryptassist:aijob:{}"
+DEDUPE_KEY = "cryptassist:aijob-dedupe:{}"
+
+@dataclass
+class AIJob:
+    id: str
+    kind: str
+    user_id: str
+    priority: int  # Lower runs first
+    status: str = "queued"
+    result: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = 0.0
+    started_at: Optional[float] = None
+    completed_at: Optional[float] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+async def run_portfolio_advice(payload: Dict[str, Any]) -> str:
+    from app.services.ai_providers import ai_providers
+    return await ai_providers.get().get_portfolio_advice(payload["portfolio_data"], payload.get("market_context"))
+
+# Job kind -> coroutine producing the result
+JOB_HANDLERS: Dict[str, Callable[[Dict[str, Any]], Awaitable[str]]] = {
+    "portfolio_advice": run_portfolio_advice,
+}
+
+class InProcessAIJobQueue:
+    """Default backend: a priority queue drained by a bounded pool of asyncio workers.
+
+    Submitting a job with the `dedupe_key` of one that is still queued or running
+    returns the existing job instead of calling the model twice. Finished jobs are
+    kept for `retention_seconds` so clients can fetch the result.
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = 100, retention_seconds: int = 3600):
+        self.worker_count = workers
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self.jobs: Dict[str, AIJob] = {}
+        self._active_keys: Dict[str, str] = {}  # dedupe_key -> job id, while queued or running
+        self._job_keys: Dict[str, str] = {}  # job id -> dedupe_key
+        self._watchers: Dict[str, Set[asyncio.Queue]] = {}
+        self._order = itertools.count()
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: List[asyncio.Task] = []
+
+    async def submit(self, kind: str, payload: Dict[str, Any], user_id: str,
+                     priority: int = 5, dedupe_key: Optional[str] = None) -> AIJob:
+        """Enqueue a job, or return the identical job already in flight"""
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown AI job kind '{kind}'")
+        self._prune()
+        if dedupe_key is not None and dedupe_key in self._active_keys:
+            return self.jobs[self._active_keys[dedupe_key]]
+
+        self._ensure_workers()
+        if self._queue.qsize() >= self.max_pending:
+            raise Exception("The AI job queue is full, please try again shortly")
+
+        job = AIJob(id=str(uuid.uuid4()), kind=kind, user_id=user_id, priority=priority, created_at=time.time())
+        self.jobs[job.id] = job
+        if dedupe_key is not None:
+            self._active_keys[dedupe_key] = job.id
+            self._job_keys[job.id] = dedupe_key
+        self._queue.put_nowait((priority, next(self._order), job.id, payload))
+        return job
+
+    async def get(self, job_id: str) -> Optional[AIJob]:
+        return self.jobs.get(job_id)
+
+    async def watch(self, job_id: str) -> AsyncIterator[AIJob]:
+        """Yield the job now and after every status change, until it finishes"""
+        job = self.jobs.get(job_id)
+        if job is None:
+            return
+        updates: asyncio.Queue = asyncio.Queue()
+        self._watchers.setdefault(job_id, set()).add(updates)
+        try:
+            # Snapshots, so a change made while the consumer is busy is still delivered
+            snapshot = replace(job)
+            yield snapshot
+            while not snapshot.finished:
+                snapshot = await updates.get()
+                yield snapshot
+        finally:
+            watchers = self._watchers.get(job_id)
+            if watchers is not None:
+                watchers.discard(updates)
+                if not watchers:
+                    del self._watchers[job_id]
+
+    def _notify(self, job: AIJob):
+        for updates in self._watchers.get(job.id, ()):
+            updates.put_nowait(replace(job))
+
+    def _ensure_workers(self):
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+        self._workers = [worker for worker in self._workers if not worker.done()]
+        while len(self._workers) < self.worker_count:
+            self._workers.append(asyncio.create_task(self._work()))
+
+    async def _work(self):
+        while True:
+            _, _, job_id, payload = await self._queue.get()
+            job = self.jobs.get(job_id)
+            if job is None:
+                continue
+            job.status = "running"
+            job.started_at = time.time()
+            self._notify(job)
+            try:
+                job.result = await JOB_HANDLERS[job.kind](payload)
+                job.status = "completed"
+            except Exception as e:
+                print(f"Error running AI job {job.id}: {e}")
+                job.error = str(e)
+                job.status = "failed"
+            job.completed_at = time.time()
+            dedupe_key = self._job_keys.pop(job.id, None)
+            if dedupe_key is not None:
+                self._active_keys.pop(dedupe_key, None)
+            self._notify(job)
+
+    def _prune(self):
+        cutoff = time.time() - self.retention_seconds
+        expired = [job_id for job_id, job in self.jobs.items() if job.finished and job.completed_at < cutoff]
+        for job_id in expired:
+            del self.jobs[job_id]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        for worker in self._workers:
+            try:
+                await worker
+            except asyncio.CancelledError:
+                pass
+        self._workers = []
+
+CELERY_STATUSES = {
+    "PENDING": "queued",
+    "RECEIVED": "queued",
+    "RETRY": "queued",
+    "STARTED": "running",
+    "SUCCESS": "completed",
+    "FAILURE": "failed",
+    "REVOKED": "failed",
+}
+
+class CeleryAIJobQueue:
+    """Same interface as InProcessAIJobQueue, with jobs run by Celery workers (see app/services/ai_celery.py)
+    and job state kept in Redis"""
+
+    def __init__(self, redis_url: str, retention_seconds: int = 3600, poll_seconds: float = 1.0):
+        self.redis_url = redis_url
+        self.retention_seconds = retention_seconds
+        self.poll_seconds = poll_seconds
+        self._redis = None
+
+    def _client(self):
+        if self._redis is None:
+            # Imported lazily so the in-process backend works without a Redis client installed
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.redis_url, decode_responses=True)
+        return self._redis
+
+    async def submit(self, kind: str, payload: Dict[str, Any], user_id: str,
+                     priority: int = 5, dedupe_key: Optional[str] = None) -> AIJob:
+        if kind not in JOB_HANDLERS:
+            raise ValueError(f"Unknown AI job kind '{kind}'")
+        job = AIJob(id=str(uuid.uuid4()), kind=kind, user_id=user_id, priority=priority, created_at=time.time())
+        redis = self._client()
+        if dedupe_key is not None:
+            claimed = await redis.set(DEDUPE_KEY.format(dedupe_key), job.id, nx=True, ex=self.retention_seconds)
+            if not claimed:
+                existing = await self.get(await redis.get(DEDUPE_KEY.format(dedupe_key)) or "")
+                if existing is not None:
+                    return existing
+                await redis.set(DEDUPE_KEY.format(dedupe_key), job.id, ex=self.retention_seconds)
+
+        record = {"kind": kind, "user_id": user_id, "priority": priority, "created_at": job.created_at}
+        await redis.set(JOB_KEY.format(job.id), json.dumps(record), ex=self.retention_seconds)
+        
+        # Imported lazily so the in-process backend works without Celery installed
+        from app.services.ai_celery import run_ai_job
+        # Publishing to the broker is a blocking call
+        await asyncio.to_thread(
+            run_ai_job.apply_async,
+            args=[kind, payload, dedupe_key],
+            task_id=job.id,
+            priority=priority
+        )
+        return job
+
+    async def get(self, job_id: str) -> Optional[AIJob]:
+        record = await self._client().get(JOB_KEY.format(job_id)) if job_id else None
+        if record is None:
+            return None
+        from celery.result import AsyncResult
+        from app.services.ai_celery import celery_app
+        
+        record = json.loads(record)
+        result = AsyncResult(job_id, app=celery_app)
+        # Result backend reads are blocking calls
+        state, value, date_done = await asyncio.to_thread(lambda: (result.state, result.result, result.date_done))
+        job = AIJob(
+            id=job_id,
+            kind=record["kind"],
+            user_id=record["user_id"],
+            priority=record["priority"],
+            status=CELERY_STATUSES.get(state, "queued"),
+            created_at=record["created_at"]
+        )
+        if job.finished:
+            job.completed_at = date_done.timestamp() if date_done else time.time()
+            if job.status == "completed":
+                job.result = value
+            else:
+                job.error = str(value)
+        return job
+
+    async def watch(self, job_id: str) -> AsyncIterator[AIJob]:
+        """Poll the result backend, yielding on every status change until the job finishes"""
+        last_status = None
+        while True:
+            job = await self.get(job_id)
+            if job is None:
+                return
+            if job.status != last_status:
+                last_status = job.status
+                yield job
+            if job.finished:
+                return
+            await asyncio.sleep(self.poll_seconds)
+
+    async def stop(self):
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+def create_ai_job_queue():
+    """Build the job backend selected by AI_JOB_BACKEND ("memory" or "celery")"""
+    if settings.ai_job_backend == "celery":
+        return CeleryAIJobQueue(settings.redis_url, settings.ai_job_retention_seconds)
+    if settings.ai_job_backend != "memory":
+        raise ValueError(f"Unknown AI job backend '{settings.ai_job_backend}'")
+    return InProcessAIJobQueue(settings.ai_job_workers, settings.ai_job_max_pending, settings.ai_job_retention_seconds)
+
+# Global instance
+ai_jobs = create_ai_job_queue()
@@ -0,0 +1,87 @@
+"""
+AI backends, built on first use or warmed in the background at startup
+"""
+import asyncio
+import threading
+import time
+from typing import Callable, Dict, Optional
+from app.core.config import settings
+
+# Backends are imported inside their factories, so importing the registry stays cheap
+def _github_backend():
+    from app.services.ai_service import GitHubLlamaService
+    return GitHubLlamaService()
+
+def _stub_backend():
+    from app.services.ai_service import StubAIService
+    return StubAIService()
+
+class AIProviderUnavailableError(Exception):
+    """Raised when an AI backend cannot be built (e.g. missing GITHUB_TOKEN)"""
+
+class AIProviderRegistry:
+    """Builds AI backends by name the first time they are needed.
+
+    Nothing is constructed at import, so a missing token or model dependency
+    surfaces as an error on AI requests instead of crashing the worker. A failed
+    build is retried on the next request. `warm_up` builds the default backend and
+    opens its connection in the background so the first request does not pay for it.
+    """
+
+    def __init__(self, default: str = "github"):
+        self.default = default
+        self._factories: Dict[str, Callable] = {}
+        self._services: Dict = {}
+        self._lock = threading.Lock()
+        self._warm_up: Optional[asyncio.Task] = None
+        self.build_seconds: Dict[str, float] = {}
+
+    def register(self, name: str, factory: Callable):
+        self._factories[name] = factory
+
+    def get(self, name: Optional[str] = None):
+        """The named backend (AI_PROVIDER by default), built if needed"""
+        name = name or self.default
+        service = self._services.get(name)
+        if service is not None:
+            return service
+        if name not in self._factories:
+            raise AIProviderUnavailableError(f"Unknown AI provider '{name}'")
+
+        # Warm-up builds on a worker thread, so concurrent callers must not build twice
+        with self._lock:
+            if name not in self._services:
+                started = time.perf_counter()
+                try:
+                    self._services[name] = self._factories[name]()
+                except Exception as e:
+                    raise AIProviderUnavailableError(f"AI provider '{name}' is unavailable: {e}")
+                self.build_seconds[name] = time.perf_counter() - started
+            return self._services[name]
+
+    def warm_up(self) -> asyncio.Task:
+        """Build and connect the default backend in the background"""
+        if self._warm_up is None or self._warm_up.done():
+            self._warm_up = asyncio.create_task(self._run_warm_up())
+        return self._warm_up
+
+    async def _run_warm_up(self):
+        try:
+            service = await asyncio.to_thread(self.get)
+            await service.warm_up()
+        except Exception as e:
+            print(f"Error warming up AI provider: {e}")
+
+    async def aclose(self):
+        if self._warm_up is not None:
+            self._warm_up.cancel()
+            self._warm_up = None
+        services = list(self._services.values())
+        self._services.clear()
+        for service in services:
+            await service.aclose()
+
+# Global instance
+ai_providers = AIProviderRegistry(settings.ai_provider)
+ai_providers.register("github", _github_backend)
+ai_providers.register("stub", _stub_backend)
@@ -1,78 +1,154 @@
 import os
+import asyncio
 import httpx
 import json
-from typing import List, Dict, Optional
+from abc import ABC, abstractmethod
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Dict, Optional
 from app.core.config import settings
-from app.services.crypto_api import crypto_api_service
+from app.services.advice_cache import advice_cache
+from app.services.market_context import market_context_service
+from app.services.prompt_builder import portfolio_prompt_builder
 
 
-class GitHubLlamaService:
-    """Service for interacting with GitHub's Llama 3.1 8B model"""
+CHAT_SYSTEM_PROMPT = """You are CryptoAssist, an expert cryptocurrency advisor with access to real-time market data. You provide current, actionable insights about:
+
+- Current cryptocurrency prices, trends, and market movements  
+- Portfolio allocation strategies based on current market conditions
+- DeFi protocols, staking opportunities, and yield farming
+- Trading patterns, market cycles, and entry/exit strategies
+- Blockchain technology, tokenomics, and project evaluation
+- Real-time market sentiment and macro factors
+
+**IMPORTANT**: You have access to current, real-time market data provided in the system messages. Always use this current data in your analysis rather than outdated information from your training. Reference current prices, recent price movements, and today's market sentiment.
+
+You can:
+- Analyze current market conditions and provide timely insights
+- Discuss specific cryptocurrencies using their current prices and trends
+- Explain current market movements and what's driving them today
+- Recommend actions based on real-time market data
+- Share insights about current market cycles and timing
+- Compare current prices to historical levels and trends
+
+Always include this disclaimer: "This is educational information and market analysis based on current data, not personalized financial advice. Cryptocurrency investments carry high risk and volatility. Only invest what you can afford to lose and always conduct your own research (DYOR) before making investment decisions."
+
+Be detailed, analytical, and focus on current market conditions with specific, timely insights."""
+
+
+def portfolio_advice_data(portfolio_model, assets) -> Dict:
+    """Plain portfolio data sent to the model for advice"""
+    return {
+        "total_value": float(portfolio_model.total_value or 0),
+        "assets": [
+            {
+                "symbol": asset.symbol,
+                "amount": float(asset.amount or 0),
+                "current_price": float(asset.current_price or 0),
+                "total_value": float(asset.total_value or 0),
+                "profit_loss": float(asset.profit_loss or 0),
+                "profit_loss_percentage": float(asset.profit_loss_percentage or 0)
+            }
+            for asset in assets
+        ]
+    }
+
+
+class AIServiceBusyError(Exception):
+    """Raised when no AI request slot frees up in time"""
+
+
+class RequestLimiter:
+    """Caps concurrent requests; a bounded number of callers may wait, each up to a deadline"""
     
-    def __init__(self):
-        self.endpoint = "https://models.github.ai/inference"
-        self.model_name = "meta/Meta-Llama-3.1-8B-Instruct"
-        self.token = settings.github_token
-        
-        if not self.token:
-            raise ValueError("GITHUB_TOKEN environment variable is required")
+    def __init__(self, max_concurrent: int, max_waiting: int, wait_timeout: float):
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self.waiting = 0
     
+    @asynccontextmanager
+    async def slot(self):
+        if not self._semaphore.locked():
+            # A free slot is taken without suspending
+            await self._semaphore.acquire()
+        elif self.waiting >= self.max_waiting:
+            # Fail fast rather than queueing behind requests that will not finish in time
+            raise AIServiceBusyError("The AI assistant is handling too many requests right now")
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise AIServiceBusyError("Timed out waiting for the AI assistant to become available")
+            finally:
+                self.waiting -= 1
+        try:
+            yield
+        finally:
+            self._semaphore.release()
+
+
+class BaseAIService(ABC):
+    """Prompting, advice caching and market context shared by every AI backend.
+
+    Backends implement `chat_completion` and `stream_chat_completion`; they are
+    built on first use by the provider registry (see app/services/ai_providers.py).
+    """
+    
+    @abstractmethod
     async def chat_completion(
-        self, 
-        messages: List[Dict[str, str]], 
+        self,
+        messages: List[Dict[str, str]],
         temperature: float = 0.7,
         max_tokens: int = 1000,
         top_p: float = 0.9
     ) -> str:
-        """
-        Send chat completion request to GitHub's Llama model
+        """The model's complete reply to `messages`"""
+    
+    @abstractmethod
+    def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        top_p: float = 0.9
+    ) -> AsyncIterator[str]:
+        """The model's reply to `messages` as an async iterator of text chunks"""
+    
+    async def warm_up(self):
+        """Prepare the backend ahead of the first request"""
+    
+    async def aclose(self):
+        """Release the backend's connections"""
+    
+    def build_chat_messages(
+        self,
+        message: str,
+        market_context: str,
+        context: Optional[str] = None,
+        history: Optional[List[Dict[str, str]]] = None
+    ) -> List[Dict[str, str]]:
+        """Messages for an assistant chat turn, after any earlier turns of the conversation"""
+        messages = [
+            {"role": "system", "content": CHAT_SYSTEM_PROMPT},
+            {"role": "system", "content": market_context}
+        ]
         
-        Args:
-            messages: List of message objects with 'role' and 'content'
-            temperature: Randomness in response (0.0 to 1.0)
-            max_tokens: Maximum tokens in response
-            top_p: Nucleus sampling parameter
-            
-        Returns:
-            Generated response content
-        """
-        headers = {
-            "Authorization": f"Bearer {self.token}",
-            "Content-Type": "application/json"
-        }
+        # Add additional context if provided
+        if context:
+            messages.append({
+                "role": "system", 
+                "content": f"Additional context: {context}"
+            })
         
-        payload = {
-            "messages": messages,
-            "temperature": temperature,
-            "top_p": top_p,
-            "max_tokens": max_tokens,
-            "model": self.model_name
-        }
+        if history:
+            messages.extend(history)
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(
-                    f"{self.endpoint}/chat/completions",
-                    headers=headers,
-                    json=payload,
-                    timeout=30.0
-                )
-                
-                if response.status_code != 200:
-                    error_detail = response.text
-                    raise Exception(f"API request failed with status {response.status_code}: {error_detail}")
-                
-                result = response.json()
-                
-                if "choices" not in result or len(result["choices"]) == 0:
-                    raise Exception("No response choices returned from API")
-                
-                return result["choices"][0]["message"]["content"]
-                
-            except httpx.TimeoutException:
-                raise Exception("Request to AI service timed out")
-            except httpx.RequestError as e:
-                raise Exception(f"Request failed: {str(e)}")
+        messages.append({
+            "role": "user", 
+            "content": message
+        })
+        return messages
     
     async def get_portfolio_advice(
         self, 
@@ -89,6 +165,38 @@ class GitHubLlamaService:
         Returns:
             AI-generated portfolio advice
         """
+        # Same holdings and market snapshot give the same advice, so skip the model call
+        cache_key = advice_cache.key_for(portfolio_data, market_context)
+        cached = await advice_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        messages = self._portfolio_advice_messages(portfolio_data, market_context)
+        advice = await self.chat_completion(messages, temperature=0.7)
+        await advice_cache.set(cache_key, advice)
+        return advice
+    
+    async def stream_portfolio_advice(
+        self,
+        portfolio_data: Dict,
+        market_context: Optional[str] = None
+    ) -> AsyncIterator[str]:
+        """Stream portfolio advice as it is generated (cached advice arrives as one chunk)"""
+        cache_key = advice_cache.key_for(portfolio_data, market_context)
+        cached = await advice_cache.get(cache_key)
+        if cached is not None:
+            yield cached
+            return
+        
+        messages = self._portfolio_advice_messages(portfolio_data, market_context)
+        chunks = []
+        async for chunk in self.stream_chat_completion(messages, temperature=0.7):
+            chunks.append(chunk)
+            yield chunk
+        # Only complete answers are cached
+        await advice_cache.set(cache_key, "".join(chunks))
+    
+    def _portfolio_advice_messages(self, portfolio_data: Dict, market_context: Optional[str] = None) -> List[Dict[str, str]]:
         # Format portfolio data for AI context
         portfolio_summary = self._format_portfolio_for_ai(portfolio_data)
         
@@ -120,82 +228,191 @@ Can you analyze my portfolio and provide suggestions for:
 
 Please keep your advice practical and educational."""
 
-        messages = [
+        return [
             {"role": "system", "content": system_prompt},
             {"role": "user", "content": user_prompt}
         ]
-        
-        return await self.chat_completion(messages, temperature=0.7)
     
     def _format_portfolio_for_ai(self, portfolio_data: Dict) -> str:
-        """Format portfolio data into readable text for AI analysis"""
-        if not portfolio_data or "assets" not in portfolio_data:
-            return "No portfolio data available"
+        """Format portfolio data into readable text for AI analysis, within the prompt token budget"""
+        return portfolio_prompt_builder.build(portfolio_data)
+
+    async def get_current_market_context(self) -> str:
+        """Market data context for the AI, shared across requests and refreshed in the background"""
+        return await market_context_service.get()
+
+
+class GitHubLlamaService(BaseAIService):
+    """Service for interacting with GitHub's Llama 3.1 8B model"""
+    
+    def __init__(self):
+        self.endpoint = settings.ai_endpoint
+        self.model_name = settings.ai_model_name
+        self.token = settings.github_token
         
-        total_value = portfolio_data.get("total_value", 0)
-        assets = portfolio_data.get("assets", [])
+        if not self.token:
+            raise ValueError("GITHUB_TOKEN environment variable is required")
         
-        summary = f"Total Portfolio Value: ${total_value:,.2f}\n\n"
-        summary += "Holdings:\n"
+        self.limiter = RequestLimiter(
+            settings.ai_max_concurrent_requests,
+            settings.ai_max_queued_requests,
+            settings.ai_queue_timeout_seconds
+        )
+        self._client: Optional[httpx.AsyncClient] = None
+    
+    def _get_client(self) -> httpx.AsyncClient:
+        """Shared keep-alive client, so calls reuse pooled TCP/TLS connections"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.endpoint,
+                headers={
+                    "Authorization": f"Bearer {self.token}",
+                    "Content-Type": "application/json"
+                },
+                timeout=settings.ai_request_timeout_seconds,
+                limits=httpx.Limits(
+                    max_connections=settings.ai_max_concurrent_requests,
+                    max_keepalive_connections=settings.ai_max_concurrent_requests
+                )
+            )
+        return self._client
+    
+    async def warm_up(self):
+        """Open a pooled connection now, so the first request skips the TCP/TLS handshake"""
+        try:
+            await self._get_client().head("/")
+        except httpx.HTTPError as e:
+            print(f"Error warming up AI connection: {e}")
+    
+    async def aclose(self):
+        """Close pooled connections"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+    
+    async def chat_completion(
+        self, 
+        messages: List[Dict[str, str]], 
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        top_p: float = 0.9
+    ) -> str:
+        """
+        Send chat completion request to GitHub's Llama model
         
-        for asset in assets:
-            symbol = asset.get("symbol", "Unknown")
-            amount = asset.get("amount", 0)
-            current_price = asset.get("current_price", 0)
-            total_asset_value = asset.get("total_value", 0)
-            profit_loss = asset.get("profit_loss", 0)
-            profit_loss_pct = asset.get("profit_loss_percentage", 0)
-            
-            percentage_of_portfolio = (total_asset_value / total_value * 100) if total_value > 0 else 0
+        Args:
+            messages: List of message objects with 'role' and 'content'
+            temperature: Randomness in response (0.0 to 1.0)
+            max_tokens: Maximum tokens in response
+            top_p: Nucleus sampling parameter
             
-            summary += f"- {symbol}: {amount:.6f} tokens @ ${current_price:.4f} = ${total_asset_value:.2f} ({percentage_of_portfolio:.1f}% of portfolio)\n"
-            summary += f"  P&L: ${profit_loss:.2f} ({profit_loss_pct:+.2f}%)\n"
+        Returns:
+            Generated response content
+        """
+        payload = {
+            "messages": messages,
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_tokens": max_tokens,
+            "model": self.model_name
+        }
         
-        return summary
-
-    async def get_current_market_context(self) -> str:
-        """Fetch current market data to provide context to AI"""
-        try:
-            # Get top 10 cryptocurrencies with current market data
-            market_data = await crypto_api_service.get_cryptocurrencies(10)
-            
-            if not market_data:
-                return "Unable to fetch current market data."
-            
-            context = "**Current Market Data (Real-time):**\n\n"
-            
-            for crypto in market_data[:5]:  # Top 5 for context
-                name = crypto.get('name', 'Unknown')
-                symbol = crypto.get('symbol', '').upper()
-                price = crypto.get('current_price', 0)
-                change_24h = crypto.get('price_change_percentage_24h', 0)
-                market_cap_rank = crypto.get('market_cap_rank', 0)
+        async with self.limiter.slot():
+            try:
+                response = await self._get_client().post("/chat/completions", json=payload)
                 
-                change_indicator = "📈" if change_24h > 0 else "📉" if change_24h < 0 else "➡️"
+                if response.status_code != 200:
+                    error_detail = response.text
+                    raise Exception(f"API request failed with status {response.status_code}: {error_detail}")
                 
-                context += f"**{name} ({symbol})**: ${price:,.2f} {change_indicator} {change_24h:+.2f}% (24h) - Rank #{market_cap_rank}\n"
-            
-            # Calculate market sentiment
-            positive_movers = sum(1 for crypto in market_data if crypto.get('price_change_percentage_24h', 0) > 0)
-            total_cryptos = len(market_data)
-            sentiment_ratio = positive_movers / total_cryptos if total_cryptos > 0 else 0
-            
-            if sentiment_ratio > 0.6:
-                market_sentiment = "Bullish (majority of top cryptos are up)"
-            elif sentiment_ratio < 0.4:
-                market_sentiment = "Bearish (majority of top cryptos are down)"
-            else:
-                market_sentiment = "Mixed (balanced gains and losses)"
-            
-            context += f"\n**Market Sentiment**: {market_sentiment} ({positive_movers}/{total_cryptos} cryptos are positive)\n"
-            context += "\n*This data is current as of now and should inform your analysis.*\n"
-            
-            return context
-            
-        except Exception as e:
-            print(f"Error fetching market context: {e}")
-            return "Unable to fetch current market data for context."
+                result = response.json()
+                
+                if "choices" not in result or len(result["choices"]) == 0:
+                    raise Exception("No response choices returned from API")
+                
+                return result["choices"][0]["message"]["content"]
+                
+            except httpx.TimeoutException:
+                raise Exception("Request to AI service timed out")
+            except httpx.RequestError as e:
+                raise Exception(f"Request failed: {str(e)}")
+    
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        top_p: float = 0.9
+    ) -> AsyncIterator[str]:
+        """
+        Stream a chat completion, yielding content chunks as the model generates them
+        
+        The model answers with Server-Sent Events ("data: {chunk}" lines, ending with
+        "data: [DONE]"); each chunk's choices[0].delta.content is yielded when present.
+        """
+        payload = {
+            "messages": messages,
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_tokens": max_tokens,
+            "model": self.model_name,
+            "stream": True
+        }
+        
+        # The slot is held until the stream finishes or the consumer stops reading
+        async with self.limiter.slot():
+            try:
+                async with self._get_client().stream("POST", "/chat/completions", json=payload) as response:
+                    if response.status_code != 200:
+                        error_detail = (await response.aread()).decode(errors="replace")
+                        raise Exception(f"API request failed with status {response.status_code}: {error_detail}")
+                    
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[len("data:"):].strip()
+                        if data == "[DONE]":
+                            break
+                        chunk = json.loads(data)
+                        choices = chunk.get("choices") or []
+                        content = choices[0].get("delta", {}).get("content") if choices else None
+                        if content:
+                            yield content
+                            
+            except httpx.TimeoutException:
+                raise Exception("Request to AI service timed out")
+            except httpx.RequestError as e:
+                raise Exception(f"Request failed: {str(e)}")
+
+STUB_REPLY = (
+    "This is a canned reply from the local stub AI backend (AI_PROVIDER=stub). "
+    "Set AI_PROVIDER=github and GITHUB_TOKEN to talk to the real model. "
+    "This is educational information, not personalized financial advice."
+)
+
 
+class StubAIService(BaseAIService):
+    """Local backend answering with a canned reply, for development and tests without a model or token"""
+    
+    def __init__(self, reply: str = STUB_REPLY):
+        self.reply = reply
+    
+    async def chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        top_p: float = 0.9
+    ) -> str:
+        return self.reply
+    
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.7,
+        max_tokens: int = 1000,
+        top_p: float = 0.9
+    ) -> AsyncIterator[str]:
+        for index, word in enumerate(self.reply.split(" ")):
+            yield word if index == 0 else f" {word}"
 
-# Singleton instance
-ai_service = GitHubLlamaService()
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""
+Pub/sub brokers that fan real-time updates out to every worker process
+"""
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from app.core.config import settings
+
+# Takes a free lease, or renews it for its current owner, atomically
+_LEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+if redis.call('set', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+    return 1
+end
+return 0
+"""
+
+BrokerHandler = Callable[[str, Dict[str, Any]], Awaitable[None]]
+
+class Broker(ABC):
+    """Publishes messages on named channels; every subscribed worker receives each message once"""
+
+    def __init__(self):
+        self._handlers: List[BrokerHandler] = []
+
+    def add_handler(self, handler: BrokerHandler):
+        """Register a coroutine called with (channel, message) for every delivered message"""
+        self._handlers.append(handler)
+
+    async def _dispatch(self, channel: str, message: Dict[str, Any]):
+        for handler in self._handlers:
+            try:
+                await handler(channel, message)
+            except Exception as e:
+                print(f"Broker handler error on {channel}: {e}")
+
+    @abstractmethod
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        """Deliver a message to the channel's handlers on every worker"""
+
+    @abstractmethod
+    async def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        """Take or renew a lease held by one worker at a time; True while `owner` holds it"""
+
+    async def start(self):
+        """Begin receiving messages"""
+
+    async def stop(self):
+        """Stop receiving messages and release connections"""
+
+class InMemoryBroker(Broker):
+    """Single-process broker: delivers straight to local handlers (default, and for tests)"""
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        await self._dispatch(channel, message)
+
+    async def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        # The only process is always the holder
+        return True
+
+class RedisBroker(Broker):
+    """Redis pub/sub broker so updates published on one worker reach clients on all workers"""
+
+    def __init__(self, url: str, prefix: str = "cryptassist:"):
+        super().__init__()
+        self.url = url
+        self.prefix = prefix
+        self._redis = None
+        self._pubsub = None
+        self._listener: Optional[asyncio.Task] = None
+
+    def _client(self):
+        if self._redis is None:
+            # Imported lazily so the in-memory broker works without a Redis client installed
+            import redis.asyncio as aioredis
+            self._redis = aioredis.from_url(self.url, decode_responses=True)
+        return self._redis
+
+    async def publish(self, channel: str, message: Dict[str, Any]):
+        await self._client().publish(self.prefix + channel, json.dumps(message))
+
+    async def acquire_lease(self, name: str, owner: str, ttl_seconds: float) -> bool:
+        key = f"{self.prefix}lease:{name}"
+        return bool(await self._client().eval(_LEASE_SCRIPT, 1, key, owner, int(ttl_seconds * 1000)))
+
+    async def start(self):
+        if self._listener and not self._listener.done():
+            return
+        self._pubsub = self._client().pubsub(ignore_subscribe_messages=True)
+        await self._pubsub.psubscribe(self.prefix + "*")
+        self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        while True:
+            try:
+                async for item in self._pubsub.listen():
+                    if item.get("type") != "pmessage":
+                        continue
+                    channel = item["channel"][len(self.prefix):]
+                    await self._dispatch(channel, json.loads(item["data"]))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The pubsub connection re-subscribes on reconnect; back off and keep listening
+                print(f"Redis broker error: {e}")
+                await asyncio.sleep(1)
+
+    async def stop(self):
+        if self._listener:
+            self._listener.cancel()
+            try:
+                await self._listener
+            except asyncio.CancelledError:
+                pass
+            self._listener = None
+        if self._pubsub is not None:
+            await self._pubsub.aclose()
+            self._pubsub = None
+        if self._redis is not None:
+            await self._redis.aclose()
+            self._redis = None
+
+def create_broker() -> Broker:
+    """Build the broker selected by BROKER_BACKEND ("memory" or "redis")"""
+    if settings.broker_backend == "redis":
+        return RedisBroker(settings.redis_url)
+    if settings.broker_backend != "memory":
+        raise ValueError(f"Unknown broker backend '{settings.broker_backend}'")
+    return InMemoryBroker()
+
+# Global instance shared by the WebSocket manager, live valuation and the price poller
+broker = create_broker()
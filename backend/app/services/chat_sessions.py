@@ -0,0 +1,168 @@
+"""
+Server-side assistant chat sessions with bounded history
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Dict, List, Optional
+from app.core.config import settings
+from app.services.prompt_builder import estimate_tokens
+
+# Characters of each turn kept when it is rolled into the summary
+SUMMARY_EXCERPT_CHARS = 160
+
+@dataclass
+class ChatTurn:
+    role: str
+    content: str
+    tokens: int
+
+@dataclass
+class ChatSession:
+    id: str
+    user_id: Optional[str] = None
+    turns: List[ChatTurn] = field(default_factory=list)
+    summary: List[str] = field(default_factory=list)  # One line per rolled-up turn, oldest first
+    summary_tokens: int = 0
+    tokens: int = 0  # Turns plus summary
+    last_used: float = 0.0
+
+    def messages(self) -> List[Dict[str, str]]:
+        """History to place before the next user message"""
+        messages = []
+        if self.summary:
+            messages.append({
+                "role": "system",
+                "content": "Earlier in this conversation (summarized):\n" + "\n".join(self.summary)
+            })
+        messages.extend({"role": turn.role, "content": turn.content} for turn in self.turns)
+        return messages
+
+def summarize_turn(turn: ChatTurn) -> str:
+    """One-line excerpt of a turn for the rolling summary"""
+    text = " ".join(turn.content.split())
+    if len(text) > SUMMARY_EXCERPT_CHARS:
+        text = text[:SUMMARY_EXCERPT_CHARS].rsplit(" ", 1)[0] + "..."
+    return f"- {'User' if turn.role == 'user' else 'Assistant'}: {text}"
+
+class ChatSessionStore:
+    """Chat history kept per session, so prompts stay the same size however long a chat runs.
+
+    Each session holds recent turns verbatim within `token_budget`; older turns are
+    rolled into a short extractive summary capped at `summary_token_budget`. Sessions
+    are evicted least recently used first once there are more than `max_sessions` or
+    they hold more than `max_total_tokens` together, and after `idle_seconds` unused.
+    """
+
+    def __init__(self, token_budget: int = 1200, summary_token_budget: int = 300, max_sessions: int = 1000,
+                 max_total_tokens: int = 500000, idle_seconds: int = 3600):
+        self.token_budget = token_budget
+        self.summary_token_budget = summary_token_budget
+        self.max_sessions = max_sessions
+        self.max_total_tokens = max_total_tokens
+        self.idle_seconds = idle_seconds
+        self.sessions: "OrderedDict[str, ChatSession]" = OrderedDict()
+        self.total_tokens = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def start(self, user_id: Optional[str] = None) -> str:
+        """Open a session and return its server-issued id"""
+        session = ChatSession(id=str(uuid.uuid4()), user_id=user_id, last_used=time.monotonic())
+        with self._lock:
+            self._expire()
+            self.sessions[session.id] = session
+            self._evict()
+        return session.id
+
+    def get(self, session_id: str, user_id: Optional[str] = None) -> ChatSession:
+        """A session started by this user; unknown, expired or foreign ids are rejected alike"""
+        with self._lock:
+            self._expire()
+            session = self.sessions.get(session_id)
+            if session is None or session.user_id != user_id:
+                raise Exception(f"Chat session {session_id} not found")
+            session.last_used = time.monotonic()
+            self.sessions.move_to_end(session_id)
+            return session
+
+    def history(self, session_id: str, user_id: Optional[str] = None) -> List[Dict[str, str]]:
+        return self.get(session_id, user_id).messages()
+
+    def record(self, session_id: str, user_id: Optional[str], message: str, reply: str):
+        """Append a completed exchange, compacting the session back within its budget"""
+        with self._lock:
+            session = self.sessions.get(session_id)
+            # The session may have been evicted or ended while the reply was generated
+            if session is None or session.user_id != user_id:
+                return
+            before = session.tokens
+            for role, content in (("user", message), ("assistant", reply)):
+                session.turns.append(ChatTurn(role, content, estimate_tokens(content)))
+                session.tokens += session.turns[-1].tokens
+            self._compact(session)
+            session.last_used = time.monotonic()
+            self.sessions.move_to_end(session_id)
+            self.total_tokens += session.tokens - before
+            self._evict()
+
+    async def recording(self, session_id: str, user_id: Optional[str], message: str,
+                        chunks: AsyncIterator[str]) -> AsyncIterator[str]:
+        """Pass a streamed reply through, recording the exchange once it completes"""
+        parts = []
+        async for chunk in chunks:
+            parts.append(chunk)
+            yield chunk
+        self.record(session_id, user_id, message, "".join(parts))
+
+    def end(self, session_id: str, user_id: Optional[str] = None) -> bool:
+        with self._lock:
+            session = self.sessions.get(session_id)
+            if session is None or session.user_id != user_id:
+                return False
+            self._remove(session_id)
+            return True
+
+    def _compact(self, session: ChatSession):
+        # The latest exchange is always kept verbatim
+        while session.tokens - session.summary_tokens > self.token_budget and len(session.turns) > 2:
+            turn = session.turns.pop(0)
+            line = summarize_turn(turn)
+            session.summary.append(line)
+            session.summary_tokens += estimate_tokens(line)
+            session.tokens += estimate_tokens(line) - turn.tokens
+        while session.summary_tokens > self.summary_token_budget and session.summary:
+            dropped = estimate_tokens(session.summary.pop(0))
+            session.summary_tokens -= dropped
+            session.tokens -= dropped
+
+    def _expire(self):
+        cutoff = time.monotonic() - self.idle_seconds
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if session.last_used >= cutoff:
+                break
+            self._remove(session_id)
+
+    def _evict(self):
+        while len(self.sessions) > 1 and (len(self.sessions) > self.max_sessions or self.total_tokens > self.max_total_tokens):
+            self._remove(next(iter(self.sessions)))
+            self.evictions += 1
+
+    def _remove(self, session_id: str):
+        session = self.sessions.pop(session_id)
+        self.total_tokens -= session.tokens
+
+    def metrics(self) -> Dict[str, int]:
+        return {"sessions": len(self.sessions), "tokens": self.total_tokens, "evictions": self.evictions}
+
+# Global instance
+chat_sessions = ChatSessionStore(
+    token_budget=settings.chat_session_token_budget,
+    summary_token_budget=settings.chat_session_summary_token_budget,
+    max_sessions=settings.chat_session_max_sessions,
+    max_total_tokens=settings.chat_session_max_total_tokens,
+    idle_seconds=settings.chat_session_idle_seconds
+)
@@ -65,12 +65,42 @@ class CryptoAPIService:
             print(f"Error fetching cryptocurrency {crypto_id}: {e}")
             return None
     
+    async def get_simple_prices(self, crypto_ids: List[str]) -> Dict[str, float]:
+        """Fetch current USD prices for many cryptocurrencies in bulk"""
+        url = f"{self.coingecko_base_url}/simple/price"
+        
+        headers = {}
+        if settings.coingecko_api_key:
+            headers["X-CG-Demo-API-Key"] = settings.coingecko_api_key
+        
+        prices: Dict[str, float] = {}
+        ids = sorted(set(crypto_ids))
+        
+        # Chunk ids to keep the query string within CoinGecko's URL limits
+        for start in range(0, len(ids), 250):
+            chunk = ids[start:start + 250]
+            params = {
+                "ids": ",".join(chunk),
+                "vs_currencies": "usd"
+            }
+            try:
+                response = await self.client.get(url, params=params, headers=headers)
+                response.raise_for_status()
+                for crypto_id, quote in response.json().items():
+                    if quote.get("usd") is not None:
+                        prices[crypto_id] = float(quote["usd"])
+            except Exception as e:
+                print(f"CoinGecko simple price error: {e}")
+        
+        return prices
+    
     async def get_price_history(
         self, 
         crypto_id: str, 
-        days: int = 30
+        days: int = 30,
+        mock_on_error: bool = True
     ) -> List[Dict[str, Any]]:
-        """Fetch price history for a cryptocurrency"""
+        """Fetch price history for a cryptocurrency (an empty list on errors when mock_on_error is False)"""
         url = f"{self.coingecko_base_url}/coins/{crypto_id}/market_chart"
         params = {
             "vs_currency": "usd",
@@ -98,6 +128,8 @@ class CryptoAPIService:
             return price_history
         except Exception as e:
             print(f"CoinGecko price history error: {e}")
+            if not mock_on_error:
+                return []
             # Return mock price history data
             return self._get_mock_price_history(crypto_id, days)
     
@@ -1,10 +1,25 @@
+from sqlalchemy import bindparam, case, func, select
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
-from app.database.models import PortfolioModel, PortfolioAssetModel, AssetTransactionModel
+import uuid
+from app.core.config import settings
+from app.database.models import PortfolioModel, PortfolioAssetModel, AssetTransactionModel, TaxLotModel, LotDisposalModel, AssetCheckpointModel
 from app.database.connection import SessionLocal
+from app.services.lot_engine import LotBook, LotConsumption, OpenLot, LOT_EPSILON, DEFAULT_COST_BASIS_METHOD, normalize_cost_basis_method
+from app.services.portfolio_snapshots import AssetState, to_naive_utc
 from app.schemas.types import Portfolio, PortfolioAsset, AssetTransaction
 
+# Open lots are read in consumption order, this many at a time, until a sell is covered
+LOT_PAGE_SIZE = 50
+
+# Consumption order of open lots per cost basis method (id keeps paging stable on ties)
+LOT_CONSUMPTION_ORDER = {
+    "fifo": (TaxLotModel.acquired_at, TaxLotModel.id),
+    "lifo": (TaxLotModel.acquired_at.desc(), TaxLotModel.id.desc()),
+    "hifo": (TaxLotModel.price_per_unit.desc(), TaxLotModel.acquired_at, TaxLotModel.id),
+}
+
 class DatabaseService:
     def __init__(self):
         self.db: Session = SessionLocal()
@@ -20,7 +35,8 @@ class DatabaseService:
         self.db.close()
     
     # Portfolio operations
-    def create_portfolio(self, name: str, description: Optional[str] = None, user_id: Optional[str] = None) -> PortfolioModel:
+    def create_portfolio(self, name: str, description: Optional[str] = None, user_id: Optional[str] = None,
+                         cost_basis_method: str = DEFAULT_COST_BASIS_METHOD) -> PortfolioModel:
         """Create a new portfolio"""
         portfolio = PortfolioModel(
             name=name,
@@ -28,7 +44,8 @@ class DatabaseService:
             total_value=0.0,
             total_profit_loss=0.0,
             total_profit_loss_percentage=0.0,
-            user_id=user_id
+            user_id=user_id,
+            cost_basis_method=normalize_cost_basis_method(cost_basis_method)
         )
         self.db.add(portfolio)
         self.db.commit()
@@ -56,6 +73,22 @@ class DatabaseService:
             return True
         return False
     
+    def set_cost_basis_method(self, portfolio_id: str, cost_basis_method: str) -> Optional[PortfolioModel]:
+        """Change a portfolio's cost basis method and rematch all of its sells against lots"""
+        portfolio = self.get_portfolio(portfolio_id)
+        if not portfolio:
+            return None
+        
+        portfolio.cost_basis_method = normalize_cost_basis_method(cost_basis_method)
+        self.db.flush()
+        
+        for asset in self.get_portfolio_assets(portfolio_id):
+            self.rebuild_lots(asset.id)
+            self.recalculate_asset_from_transactions(asset.id, asset.current_price)
+        
+        self.update_portfolio_totals(portfolio_id)
+        return portfolio
+    
     def update_portfolio_totals(self, portfolio_id: str):
         """Recalculate and update portfolio totals"""
         portfolio = self.get_portfolio(portfolio_id)
@@ -171,7 +204,7 @@ class DatabaseService:
     # Transaction operations
     def create_transaction(self, asset_id: str, transaction_type: str, amount: float,
                           price_per_unit: float, notes: Optional[str] = None) -> AssetTransactionModel:
-        """Create a new transaction"""
+        """Create a new transaction, opening a tax lot for buys and consuming lots for sells"""
         total_value = amount * price_per_unit
         realized_profit_loss = 0.0
         
@@ -180,10 +213,18 @@ class DatabaseService:
         if not asset:
             raise Exception(f"Asset {asset_id} not found")
         
-        # Calculate realized P&L for sell transactions
+        self._ensure_lots(asset)
+        
+        # Calculate realized P&L for sell transactions from the lots they consume
+        consumptions: List[LotConsumption] = []
+        lots_by_id: Dict[str, TaxLotModel] = {}
         if transaction_type == "sell":
-            # Use FIFO method: assume we sell the oldest purchases first
-            realized_profit_loss = amount * (price_per_unit - asset.average_buy_price)
+            book, lots_by_id = self._load_lot_book(asset, amount)
+            try:
+                consumptions = book.consume(amount)
+            except ValueError as e:
+                raise Exception(str(e))
+            realized_profit_loss = sum(c.realized_profit_loss(price_per_unit) for c in consumptions)
         
         transaction = AssetTransactionModel(
             asset_id=asset_id,
@@ -196,12 +237,21 @@ class DatabaseService:
             price_per_unit=price_per_unit,
             total_value=total_value,
             realized_profit_loss=realized_profit_loss,
-            notes=notes
+            notes=notes,
+            timestamp=datetime.utcnow()
         )
-        
         self.db.add(transaction)
+        
+        if transaction_type == "buy":
+            self.db.add(self._new_lot(asset, transaction))
+        elif transaction_type == "sell":
+            self._record_disposals(transaction, consumptions, lots_by_id)
+        asset.transactions_since_checkpoint = (asset.transactions_since_checkpoint or 0) + 1
+        
         self.db.commit()
         self.db.refresh(transaction)
+        
+        self.checkpoint_asset(asset)
         return transaction
     
     def get_asset_transactions(self, asset_id: str) -> List[AssetTransactionModel]:
@@ -220,26 +270,282 @@ class DatabaseService:
         return transactions
     
     def recalculate_asset_from_transactions(self, asset_id: str, current_price: float) -> Optional[PortfolioAssetModel]:
-        """Recalculate asset values based on all transactions"""
+        """Recalculate asset values from its open tax lots"""
         asset = self.get_asset(asset_id)
         if not asset:
             return None
         
-        transactions = self.get_asset_transactions(asset_id)
-        buy_transactions = [t for t in transactions if t.transaction_type == "buy"]
-        sell_transactions = [t for t in transactions if t.transaction_type == "sell"]
-        
-        total_bought = sum(t.amount for t in buy_transactions)
-        total_sold = sum(t.amount for t in sell_transactions)
-        current_amount = total_bought - total_sold
+        self._ensure_lots(asset)
         
-        # Keep the asset even if fully sold (for historical tracking)
-        if current_amount < 0:
-            current_amount = 0  # Prevent negative amounts
+        current_amount, open_cost = (
+            self.db.query(
+                func.coalesce(func.sum(TaxLotModel.remaining_amount), 0.0),
+                func.coalesce(func.sum(TaxLotModel.remaining_amount * TaxLotModel.price_per_unit), 0.0)
+            )
+            .filter(TaxLotModel.asset_id == asset_id, TaxLotModel.remaining_amount > 0)
+            .one()
+        )
         
-        # Calculate weighted average buy price
-        total_cost = sum(t.total_value for t in buy_transactions)
-        average_buy_price = total_cost / total_bought if total_bought > 0 else 0
+        # Keep the asset even if fully sold (for historical tracking) with its last average price
+        if current_amount <= LOT_EPSILON:
+            current_amount = 0
+            average_buy_price = asset.average_buy_price
+        else:
+            # Average cost of the units still held under the portfolio's cost basis method
+            average_buy_price = open_cost / current_amount
         
         # Update asset (even if amount is 0)
-        return self.update_asset(asset_id, current_amount, average_buy_price, current_price)
\ No newline at end of file
+        return self.update_asset(asset_id, current_amount, average_buy_price, current_price)
+    
+    # Tax lot operations
+    def rebuild_lots(self, asset_id: str) -> Optional[PortfolioAssetModel]:
+        """Rebuild an asset's tax lots and realized P&L by replaying its transaction history"""
+        asset = self.get_asset(asset_id)
+        if not asset:
+            return None
+        
+        # Realized P&L of past sells may change, so existing checkpoints are rebuilt too
+        self.db.query(AssetCheckpointModel).filter(AssetCheckpointModel.asset_id == asset_id).delete(synchronize_session=False)
+        
+        lot_ids = select(TaxLotModel.id).where(TaxLotModel.asset_id == asset_id)
+        self.db.query(LotDisposalModel).filter(LotDisposalModel.lot_id.in_(lot_ids)).delete(synchronize_session=False)
+        self.db.query(TaxLotModel).filter(TaxLotModel.asset_id == asset_id).delete(synchronize_session=False)
+        
+        book = LotBook(self._cost_basis_method(asset))
+        lots_by_id: Dict[str, TaxLotModel] = {}
+        transactions = (
+            self.db.query(AssetTransactionModel)
+            .filter(AssetTransactionModel.asset_id == asset_id)
+            .order_by(AssetTransactionModel.timestamp)
+            .all()
+        )
+        for t in transactions:
+            if t.transaction_type == "buy":
+                lot = self._new_lot(asset, t)
+                self.db.add(lot)
+                lots_by_id[lot.id] = lot
+                book.add(OpenLot(lot_id=lot.id, price_per_unit=lot.price_per_unit, remaining_amount=lot.remaining_amount))
+            elif t.transaction_type == "sell":
+                # Older histories may sell more than was bought; match only what is held
+                consumptions = book.consume(min(t.amount, book.total_amount))
+                t.realized_profit_loss = sum(c.realized_profit_loss(t.price_per_unit) for c in consumptions)
+                self._record_disposals(t, consumptions, lots_by_id)
+        asset.transactions_since_checkpoint = len(transactions)
+        
+        self.db.commit()
+        self.checkpoint_asset(asset)
+        return asset
+    
+    def _cost_basis_method(self, asset: PortfolioAssetModel) -> str:
+        return asset.portfolio.cost_basis_method or DEFAULT_COST_BASIS_METHOD
+    
+    def _ensure_lots(self, asset: PortfolioAssetModel):
+        """Build lots for assets created before tax lots existed"""
+        has_lots = self.db.query(TaxLotModel.id).filter(TaxLotModel.asset_id == asset.id).first() is not None
+        if has_lots:
+            return
+        has_transactions = (
+            self.db.query(AssetTransactionModel.id)
+            .filter(AssetTransactionModel.asset_id == asset.id)
+            .first() is not None
+        )
+        if has_transactions:
+            self.rebuild_lots(asset.id)
+    
+    def _load_lot_book(self, asset: PortfolioAssetModel, amount: float):
+        """Load the open lots a sell of `amount` consumes into a LotBook, stopping once they cover it"""
+        method = self._cost_basis_method(asset)
+        query = (
+            self.db.query(TaxLotModel)
+            .filter(TaxLotModel.asset_id == asset.id, TaxLotModel.remaining_amount > 0)
+            .order_by(*LOT_CONSUMPTION_ORDER[method])
+        )
+        open_lots: List[TaxLotModel] = []
+        covered = 0.0
+        while covered + LOT_EPSILON < amount:
+            page = query.offset(len(open_lots)).limit(LOT_PAGE_SIZE).all()
+            open_lots.extend(page)
+            covered += sum(lot.remaining_amount for lot in page)
+            if len(page) < LOT_PAGE_SIZE:
+                break
+        
+        # The book takes lots in acquisition order
+        if method == "lifo":
+            open_lots.reverse()
+        book = LotBook(method)
+        lots_by_id = {}
+        for lot in open_lots:
+            lots_by_id[lot.id] = lot
+            book.add(OpenLot(lot_id=lot.id, price_per_unit=lot.price_per_unit, remaining_amount=lot.remaining_amount))
+        return book, lots_by_id
+    
+    def _new_lot(self, asset: PortfolioAssetModel, transaction: AssetTransactionModel) -> TaxLotModel:
+        return TaxLotModel(
+            id=str(uuid.uuid4()),
+            asset_id=asset.id,
+            portfolio_id=asset.portfolio_id,
+            transaction=transaction,
+            price_per_unit=transaction.price_per_unit,
+            original_amount=transaction.amount,
+            remaining_amount=transaction.amount,
+            acquired_at=transaction.timestamp
+        )
+    
+    def _record_disposals(self, transaction: AssetTransactionModel, consumptions: List[LotConsumption],
+                          lots_by_id: Dict[str, TaxLotModel]):
+        """Persist lot consumption for a sell, with realized P&L per lot"""
+        for consumption in consumptions:
+            lot = lots_by_id[consumption.lot.lot_id]
+            lot.remaining_amount = consumption.lot.remaining_amount
+            self.db.add(LotDisposalModel(
+                lot_id=lot.id,
+                transaction=transaction,
+                amount=consumption.amount,
+                cost_basis=consumption.cost_basis,
+                proceeds=consumption.amount * transaction.price_per_unit,
+                realized_profit_loss=consumption.realized_profit_loss(transaction.price_per_unit),
+                disposed_at=transaction.timestamp
+            ))
+    
+    # Bulk revaluation operations
+    def get_held_crypto_ids(self) -> List[str]:
+        """Get the distinct crypto ids that are currently held in any portfolio"""
+        rows = (
+            self.db.query(PortfolioAssetModel.crypto_id)
+            .filter(PortfolioAssetModel.amount > 0)
+            .distinct()
+            .all()
+        )
+        return [row[0] for row in rows]
+    
+    def revalue_holdings(self, prices: Dict[str, float]) -> int:
+        """Revalue every holding of each priced crypto with one set-based UPDATE per coin"""
+        if not prices:
+            return 0
+        
+        assets = PortfolioAssetModel.__table__
+        price = bindparam("b_price")
+        
+        # Executed as an executemany: one UPDATE per crypto_id, no per-row ORM work
+        stmt = (
+            assets.update()
+            .where(assets.c.crypto_id == bindparam("b_crypto_id"))
+            .values(
+                current_price=price,
+                total_value=assets.c.amount * price,
+                profit_loss=assets.c.amount * price - assets.c.amount * assets.c.average_buy_price,
+                profit_loss_percentage=case(
+                    (
+                        assets.c.average_buy_price > 0,
+                        (price - assets.c.average_buy_price) / assets.c.average_buy_price * 100,
+                    ),
+                    else_=0.0,
+                ),
+            )
+        )
+        params = [
+            {"b_crypto_id": crypto_id, "b_price": float(value)}
+            for crypto_id, value in prices.items()
+        ]
+        result = self.db.execute(stmt, params)
+        
+        self.rollup_portfolio_totals(list(prices.keys()))
+        self.db.commit()
+        return result.rowcount
+    
+    def rollup_portfolio_totals(self, crypto_ids: Optional[List[str]] = None):
+        """Recompute valuation totals in SQL for portfolios holding any of the given cryptos"""
+        assets = PortfolioAssetModel.__table__
+        portfolios = PortfolioModel.__table__
+        
+        active = (assets.c.portfolio_id == portfolios.c.id) & (assets.c.amount > 0)
+        total_value = (
+            select(func.coalesce(func.sum(assets.c.total_value), 0.0))
+            .where(active)
+            .scalar_subquery()
+        )
+        total_profit_loss = (
+            select(func.coalesce(func.sum(assets.c.profit_loss), 0.0))
+            .where(active)
+            .scalar_subquery()
+        )
+        realized_profit_loss = func.coalesce(portfolios.c.total_realized_profit_loss, 0.0)
+        
+        # Realized P&L and cost basis only change with transactions, so they are reused as stored
+        stmt = portfolios.update().values(
+            total_value=total_value,
+            total_profit_loss=total_profit_loss,
+            total_profit_loss_percentage=case(
+                (
+                    portfolios.c.total_cost_basis > 0,
+                    (total_profit_loss + realized_profit_loss) / portfolios.c.total_cost_basis * 100,
+                ),
+                else_=0.0,
+            ),
+            # A market revaluation is not a user edit, so keep updated_at as it was
+            updated_at=portfolios.c.updated_at,
+        )
+        if crypto_ids is not None:
+            affected = select(assets.c.portfolio_id).where(assets.c.crypto_id.in_(crypto_ids))
+            stmt = stmt.where(portfolios.c.id.in_(affected))
+        
+        self.db.execute(stmt)
+    
+    # Checkpoint operations
+    def get_latest_checkpoint(self, asset_id: str, as_of: Optional[datetime] = None) -> Optional[AssetCheckpointModel]:
+        """Get the asset's most recent checkpoint, optionally at or before `as_of`"""
+        query = self.db.query(AssetCheckpointModel).filter(AssetCheckpointModel.asset_id == asset_id)
+        if as_of is not None:
+            query = query.filter(AssetCheckpointModel.as_of <= as_of)
+        return query.order_by(AssetCheckpointModel.as_of.desc()).first()
+    
+    def _transactions_between(self, asset_id: str, after: Optional[datetime] = None, until: Optional[datetime] = None):
+        query = self.db.query(AssetTransactionModel).filter(AssetTransactionModel.asset_id == asset_id)
+        if after is not None:
+            query = query.filter(AssetTransactionModel.timestamp > after)
+        if until is not None:
+            query = query.filter(AssetTransactionModel.timestamp <= until)
+        return query.order_by(AssetTransactionModel.timestamp)
+    
+    def checkpoint_asset(self, asset: PortfolioAssetModel) -> int:
+        """Write a checkpoint for every N transactions since the asset's latest checkpoint"""
+        interval = settings.checkpoint_interval_transactions
+        if interval <= 0:
+            return 0
+        
+        # Counted on the asset row, so most transactions skip the checkpoint queries entirely
+        if (asset.transactions_since_checkpoint or 0) < interval:
+            return 0
+        
+        latest = self.get_latest_checkpoint(asset.id)
+        state = AssetState.from_checkpoint(latest) if latest else AssetState.for_asset(asset)
+        transactions = self._transactions_between(asset.id, latest.as_of if latest else None).all()
+        since_checkpoint = 0
+        created = 0
+        for i, t in enumerate(transactions):
+            state.apply(t)
+            since_checkpoint += 1
+            # Never split transactions sharing a timestamp across a checkpoint boundary
+            next_shares_timestamp = i + 1 < len(transactions) and transactions[i + 1].timestamp == t.timestamp
+            if since_checkpoint >= interval and not next_shares_timestamp:
+                self.db.add(state.to_checkpoint(asset.portfolio_id))
+                since_checkpoint = 0
+                created += 1
+        asset.transactions_since_checkpoint = since_checkpoint
+        
+        self.db.commit()
+        return created
+    
+    def get_portfolio_state_as_of(self, portfolio_id: str, as_of: datetime) -> List[AssetState]:
+        """Reconstruct per-asset holdings at `as_of` from the nearest checkpoint plus later transactions"""
+        as_of = to_naive_utc(as_of)
+        states = []
+        for asset in self.get_portfolio_assets(portfolio_id):
+            checkpoint = self.get_latest_checkpoint(asset.id, as_of)
+            state = AssetState.from_checkpoint(checkpoint) if checkpoint else AssetState.for_asset(asset)
+            state.replay(self._transactions_between(asset.id, checkpoint.as_of if checkpoint else None, as_of))
+            
+            # Skip assets that had no transactions yet at that time
+            if state.transaction_count > 0:
+                states.append(state)
+        return states
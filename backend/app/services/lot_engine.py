@@ -0,0 +1,105 @@
+"""
+Tax-lot engine for FIFO, LIFO and HIFO cost-basis accounting
+"""
+import heapq
+import itertools
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, List, Tuple
+
+COST_BASIS_METHODS = ("fifo", "lifo", "hifo")
+DEFAULT_COST_BASIS_METHOD = "fifo"
+
+# Amounts below this are treated as zero to absorb float rounding
+LOT_EPSILON = 1e-12
+
+def normalize_cost_basis_method(method: str) -> str:
+    """Validate a cost-basis method name and return it in canonical form"""
+    normalized = (method or DEFAULT_COST_BASIS_METHOD).lower()
+    if normalized not in COST_BASIS_METHODS:
+        raise ValueError(f"Unsupported cost basis method '{method}'. Use one of: {', '.join(COST_BASIS_METHODS)}")
+    return normalized
+
+@dataclass
+class OpenLot:
+    """An acquisition with some amount still held"""
+    lot_id: Any
+    price_per_unit: float
+    remaining_amount: float
+
+@dataclass
+class LotConsumption:
+    """The part of a lot consumed by a sell"""
+    lot: OpenLot
+    amount: float
+
+    @property
+    def cost_basis(self) -> float:
+        return self.amount * self.lot.price_per_unit
+
+    def realized_profit_loss(self, sell_price: float) -> float:
+        return self.amount * (sell_price - self.lot.price_per_unit)
+
+class LotBook:
+    """Open lots of a single asset, ordered for consumption by the cost-basis method.
+
+    FIFO and LIFO keep lots in a deque in acquisition order and consume from the
+    left or right end. HIFO keeps a max-heap on price (ties broken by acquisition
+    order). A sell touching k lots costs O(k) for FIFO/LIFO and O(k log n) for HIFO.
+    Lots must be added in acquisition order.
+    """
+
+    def __init__(self, method: str = DEFAULT_COST_BASIS_METHOD):
+        self.method = normalize_cost_basis_method(method)
+        self._lots: deque = deque()
+        self._heap: List[Tuple[float, int, OpenLot]] = []
+        self._sequence = itertools.count()
+        self.total_amount = 0.0
+
+    def __len__(self) -> int:
+        return len(self._heap) if self.method == "hifo" else len(self._lots)
+
+    def add(self, lot: OpenLot):
+        """Add an open lot; lots must arrive in acquisition order"""
+        if lot.remaining_amount <= LOT_EPSILON:
+            return
+        if self.method == "hifo":
+            heapq.heappush(self._heap, (-lot.price_per_unit, next(self._sequence), lot))
+        else:
+            self._lots.append(lot)
+        self.total_amount += lot.remaining_amount
+
+    def _peek(self) -> OpenLot:
+        if self.method == "hifo":
+            return self._heap[0][2]
+        if self.method == "lifo":
+            return self._lots[-1]
+        return self._lots[0]
+
+    def _pop(self):
+        if self.method == "hifo":
+            heapq.heappop(self._heap)
+        elif self.method == "lifo":
+            self._lots.pop()
+        else:
+            self._lots.popleft()
+
+    def consume(self, amount: float) -> List[LotConsumption]:
+        """Consume lots for a sell of `amount`, mutating their remaining amounts"""
+        if amount > self.total_amount + LOT_EPSILON:
+            raise ValueError(f"Cannot sell {amount}: only {self.total_amount} held in open lots")
+
+        consumptions = []
+        remaining = amount
+        while remaining > LOT_EPSILON and len(self):
+            lot = self._peek()
+            taken = min(lot.remaining_amount, remaining)
+            lot.remaining_amount -= taken
+            remaining -= taken
+            consumptions.append(LotConsumption(lot=lot, amount=taken))
+            if lot.remaining_amount <= LOT_EPSILON:
+                lot.remaining_amount = 0.0
+                self._pop()
+
+        self.total_amount = max(self.total_amount - amount, 0.0)
+        return consumptions
@@ -0,0 +1,105 @@
+"""
+Market context for AI prompts, rendered once per market snapshot
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+from app.core.config import settings
+from app.services.crypto_api import crypto_api_service
+
+def render_market_context(market_data: List[Dict[str, Any]]) -> str:
+    """Prompt text describing the top markets and overall sentiment"""
+    if not market_data:
+        return "Unable to fetch current market data."
+
+    context = "**Current Market Data (Real-time):**\n\n"
+
+    for crypto in market_data[:5]:  # Top 5 for context
+        name = crypto.get('name', 'Unknown')
+        symbol = crypto.get('symbol', '').upper()
+        price = crypto.get('current_price', 0)
+        change_24h = crypto.get('price_change_percentage_24h', 0)
+        market_cap_rank = crypto.get('market_cap_rank', 0)
+
+        change_indicator = "📈" if change_24h > 0 else "📉" if change_24h < 0 else "➡️"
+
+        context += f"**{name} ({symbol})**: ${price:,.2f} {change_indicator} {change_24h:+.2f}% (24h) - Rank #{market_cap_rank}\n"
+
+    # Calculate market sentiment
+    positive_movers = sum(1 for crypto in market_data if crypto.get('price_change_percentage_24h', 0) > 0)
+    total_cryptos = len(market_data)
+    sentiment_ratio = positive_movers / total_cryptos if total_cryptos > 0 else 0
+
+    if sentiment_ratio > 0.6:
+        market_sentiment = "Bullish (majority of top cryptos are up)"
+    elif sentiment_ratio < 0.4:
+        market_sentiment = "Bearish (majority of top cryptos are down)"
+    else:
+        market_sentiment = "Mixed (balanced gains and losses)"
+
+    context += f"\n**Market Sentiment**: {market_sentiment} ({positive_movers}/{total_cryptos} cryptos are positive)\n"
+    context += "\n*This data is current as of now and should inform your analysis.*\n"
+
+    return context
+
+class MarketContextService:
+    """Shares one rendered market context between all chats.
+
+    The top markets are fetched at most once per refresh interval and the prompt
+    text is rendered once per snapshot `version`. Once a snapshot exists, callers
+    never wait on the market API: a stale snapshot is served while a single
+    background refresh replaces it.
+    """
+
+    def __init__(self, refresh_seconds: int = 60, limit: int = 10):
+        self.refresh_seconds = refresh_seconds
+        self.limit = limit
+        self.version = 0
+        self.fetched_at = 0.0
+        self._market_data: Optional[List[Dict[str, Any]]] = None
+        self._rendered: Optional[str] = None
+        self._rendered_version = 0
+        self._refresh: Optional[asyncio.Task] = None
+
+    @property
+    def is_fresh(self) -> bool:
+        return self._market_data is not None and time.monotonic() - self.fetched_at < self.refresh_seconds
+
+    async def get(self) -> str:
+        """Current market context text"""
+        if self.is_fresh:
+            return self._render()
+        refresh = self.refresh()
+        if self._market_data is not None:
+            # Stale-while-revalidate: this request keeps the previous snapshot
+            return self._render()
+        await asyncio.shield(refresh)
+        if self._market_data is None:
+            return "Unable to fetch current market data for context."
+        return self._render()
+
+    def _render(self) -> str:
+        # Re-rendered only when a new snapshot version has arrived
+        if self._rendered_version != self.version:
+            self._rendered = render_market_context(self._market_data)
+            self._rendered_version = self.version
+        return self._rendered
+
+    def refresh(self) -> asyncio.Task:
+        """Start a refresh unless one is already running (all callers share it)"""
+        if self._refresh is None or self._refresh.done():
+            self._refresh = asyncio.create_task(self._fetch())
+        return self._refresh
+
+    async def _fetch(self):
+        try:
+            market_data = await crypto_api_service.get_cryptocurrencies(self.limit)
+        except Exception as e:
+            print(f"Error fetching market context: {e}")
+            return
+        self._market_data = market_data
+        self.version += 1
+        self.fetched_at = time.monotonic()
+
+# Global instance
+market_context_service = MarketContextService(settings.market_context_refresh_seconds)
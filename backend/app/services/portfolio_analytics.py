@@ -0,0 +1,151 @@
+"""
+Portfolio risk analytics over daily price histories
+"""
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+import numpy as np
+from app.core.config import settings
+from app.services.price_history import PriceHistoryCache, fill_gaps, price_history_cache, utc_day
+from app.utils.cache import TTLCache
+
+# Crypto trades every day of the year
+PERIODS_PER_YEAR = 365
+BENCHMARK_ID = "bitcoin"
+
+@dataclass
+class AllocationWeightResult:
+    crypto_id: str
+    symbol: str
+    value: float
+    weight: float
+
+@dataclass
+class PortfolioAnalyticsResult:
+    portfolio_id: str
+    window: int
+    total_value: float
+    weights: List[AllocationWeightResult]
+    observations: int  # Daily returns the statistics are computed from
+    annualized_return: Optional[float] = None
+    annualized_volatility: Optional[float] = None
+    max_drawdown: Optional[float] = None
+    sharpe_ratio: Optional[float] = None
+    sortino_ratio: Optional[float] = None
+    value_at_risk: Optional[float] = None
+    conditional_value_at_risk: Optional[float] = None
+    beta: Optional[float] = None
+    missing_history: Optional[List[str]] = None
+
+def risk_metrics(values: np.ndarray, benchmark: Optional[np.ndarray] = None, risk_free_rate: float = 0.0,
+                 confidence: float = 0.95) -> Dict[str, Optional[float]]:
+    """Return and risk statistics of a daily value series, annualized over PERIODS_PER_YEAR"""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        returns = values[1:] / values[:-1] - 1
+    returns = returns[np.isfinite(returns)]
+    if len(returns) < 2:
+        return {}
+
+    daily_risk_free = risk_free_rate / PERIODS_PER_YEAR
+    excess = returns - daily_risk_free
+    volatility = float(np.std(returns, ddof=1) * np.sqrt(PERIODS_PER_YEAR))
+    downside = float(np.sqrt(np.mean(np.minimum(excess, 0.0) ** 2)) * np.sqrt(PERIODS_PER_YEAR))
+    annualized_excess = float(np.mean(excess) * PERIODS_PER_YEAR)
+    drawdowns = values / np.maximum.accumulate(values) - 1
+    # Historical VaR/CVaR: the loss at the tail quantile and the mean loss beyond it, as positive fractions
+    cutoff = np.quantile(returns, 1 - confidence)
+
+    metrics = {
+        "annualized_return": float(np.mean(returns) * PERIODS_PER_YEAR),
+        "annualized_volatility": volatility,
+        "max_drawdown": float(-np.nanmin(drawdowns)),
+        "sharpe_ratio": annualized_excess / volatility if volatility > 0 else None,
+        "sortino_ratio": annualized_excess / downside if downside > 0 else None,
+        "value_at_risk": float(-cutoff),
+        "conditional_value_at_risk": float(-np.mean(returns[returns <= cutoff])),
+        "beta": None
+    }
+
+    if benchmark is not None:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            series = np.column_stack((values[1:] / values[:-1] - 1, benchmark[1:] / benchmark[:-1] - 1))
+        series = series[np.isfinite(series).all(axis=1)]
+        if len(series) >= 2:
+            covariance = np.cov(series, rowvar=False)
+            metrics["beta"] = float(covariance[0, 1] / covariance[1, 1]) if covariance[1, 1] > 0 else None
+    return metrics
+
+class PortfolioAnalyticsService:
+    """Risk analytics of a portfolio's current holdings over a trailing window of daily prices.
+
+    Holdings are held constant across the window and valued with one matrix-vector
+    product over the aligned price matrix. Results are memoized per portfolio
+    version (its `updated_at`), window and UTC price day.
+    """
+
+    def __init__(self, histories: PriceHistoryCache, max_entries: int = 1000,
+                 risk_free_rate: float = 0.0, confidence: float = 0.95):
+        self.histories = histories
+        self.risk_free_rate = risk_free_rate
+        self.confidence = confidence
+        self._results = TTLCache(max_entries, 86400)
+
+    async def analyze(self, portfolio_model, assets: List, window: int) -> PortfolioAnalyticsResult:
+        key = (portfolio_model.id, portfolio_model.updated_at, window, utc_day())
+        cached = self._results.get(key)
+        if cached is not None:
+            return cached
+
+        holdings = [asset for asset in assets if (asset.amount or 0) > 0]
+        crypto_ids = list(dict.fromkeys(asset.crypto_id for asset in holdings))
+        columns = crypto_ids + ([BENCHMARK_ID] if BENCHMARK_ID not in crypto_ids else [])
+        _, prices = await self.histories.matrix(columns, window)
+
+        # Amounts per coin column (a coin held in several rows is summed)
+        column_index = {crypto_id: index for index, crypto_id in enumerate(crypto_ids)}
+        amounts = np.zeros(len(crypto_ids))
+        np.add.at(amounts, [column_index[asset.crypto_id] for asset in holdings], [float(asset.amount) for asset in holdings])
+
+        held_prices = prices[:, :len(crypto_ids)]
+        priced = ~np.isnan(held_prices).all(axis=0)
+        # Coins without any history are valued at their stored price and left out of the return series
+        stored_prices = {asset.crypto_id: float(asset.current_price or 0) for asset in holdings}
+        latest = np.array([
+            held_prices[~np.isnan(held_prices[:, index]), index][-1] if priced[index] else stored_prices[crypto_id]
+            for index, crypto_id in enumerate(crypto_ids)
+        ])
+        values = amounts * latest
+        total_value = float(values.sum())
+        symbols = {asset.crypto_id: asset.symbol for asset in holdings}
+        weights = [
+            AllocationWeightResult(crypto_id, symbols[crypto_id], float(value), float(value / total_value) if total_value > 0 else 0.0)
+            for crypto_id, value in zip(crypto_ids, values)
+        ]
+        weights.sort(key=lambda weight: weight.value, reverse=True)
+
+        result = PortfolioAnalyticsResult(
+            portfolio_id=portfolio_model.id,
+            window=window,
+            total_value=total_value,
+            weights=weights,
+            observations=0,
+            missing_history=[crypto_id for crypto_id, has_history in zip(crypto_ids, priced) if not has_history]
+        )
+        if priced.any():
+            series = fill_gaps(held_prices[:, priced]) @ amounts[priced]
+            benchmark = prices[:, columns.index(BENCHMARK_ID)]
+            benchmark = None if np.isnan(benchmark).all() else fill_gaps(benchmark[:, None])[:, 0]
+            metrics = risk_metrics(series, benchmark, self.risk_free_rate, self.confidence)
+            for name, value in metrics.items():
+                setattr(result, name, value)
+            result.observations = len(series) - 1 if metrics else 0
+
+        self._results.set(key, result)
+        return result
+
+# Global instance
+portfolio_analytics = PortfolioAnalyticsService(
+    price_history_cache,
+    max_entries=settings.analytics_cache_max_entries,
+    risk_free_rate=settings.analytics_risk_free_rate,
+    confidence=settings.analytics_var_confidence
+)
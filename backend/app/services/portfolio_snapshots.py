@@ -0,0 +1,81 @@
+"""
+Per-asset state replay used by checkpoints and as-of portfolio queries
+"""
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Iterable, Optional
+from app.database.models import AssetCheckpointModel, AssetTransactionModel, PortfolioAssetModel
+
+@dataclass
+class AssetState:
+    """Holdings of one asset after replaying its transactions up to `as_of`"""
+    asset_id: str
+    crypto_id: str
+    symbol: str
+    name: str
+    amount: float = 0.0
+    cost_basis: float = 0.0
+    realized_profit_loss: float = 0.0
+    transaction_count: int = 0
+    as_of: Optional[datetime] = None
+
+    @classmethod
+    def for_asset(cls, asset: PortfolioAssetModel) -> "AssetState":
+        return cls(asset_id=asset.id, crypto_id=asset.crypto_id, symbol=asset.symbol, name=asset.name)
+
+    @classmethod
+    def from_checkpoint(cls, checkpoint: AssetCheckpointModel) -> "AssetState":
+        return cls(
+            asset_id=checkpoint.asset_id,
+            crypto_id=checkpoint.crypto_id,
+            symbol=checkpoint.symbol,
+            name=checkpoint.name,
+            amount=checkpoint.amount,
+            cost_basis=checkpoint.cost_basis,
+            realized_profit_loss=checkpoint.realized_profit_loss,
+            transaction_count=checkpoint.transaction_count,
+            as_of=checkpoint.as_of
+        )
+
+    @property
+    def average_buy_price(self) -> float:
+        return self.cost_basis / self.amount if self.amount > 0 else 0.0
+
+    def apply(self, transaction: AssetTransactionModel):
+        """Fold one transaction into the state"""
+        if transaction.transaction_type == "buy":
+            self.amount += transaction.amount
+            self.cost_basis += transaction.total_value
+        elif transaction.transaction_type == "sell":
+            # Sells persist their lot-matched realized P&L, so proceeds minus P&L is the cost released
+            realized = transaction.realized_profit_loss or 0.0
+            self.amount = max(self.amount - transaction.amount, 0.0)
+            self.cost_basis = max(self.cost_basis - (transaction.total_value - realized), 0.0)
+            self.realized_profit_loss += realized
+        self.transaction_count += 1
+        self.as_of = transaction.timestamp
+
+    def replay(self, transactions: Iterable[AssetTransactionModel]) -> "AssetState":
+        for transaction in transactions:
+            self.apply(transaction)
+        return self
+
+    def to_checkpoint(self, portfolio_id: str) -> AssetCheckpointModel:
+        return AssetCheckpointModel(
+            asset_id=self.asset_id,
+            portfolio_id=portfolio_id,
+            crypto_id=self.crypto_id,
+            symbol=self.symbol,
+            name=self.name,
+            as_of=self.as_of,
+            transaction_count=self.transaction_count,
+            amount=self.amount,
+            cost_basis=self.cost_basis,
+            realized_profit_loss=self.realized_profit_loss
+        )
+
+def to_naive_utc(value: datetime) -> datetime:
+    """Transactions are stored as naive UTC; normalize timezone-aware inputs to match"""
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
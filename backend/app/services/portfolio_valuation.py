@@ -0,0 +1,231 @@
+"""
+Live portfolio valuation driven by price hub ticks
+"""
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional, Set
+from app.core.config import settings
+from app.services.broker import Broker, broker as shared_broker
+from app.services.database_service import DatabaseService
+from app.services.price_hub import PriceHub, PriceSubscription, PriceTick, price_hub
+
+ValuationListener = Callable[[Dict[str, Any]], None]
+
+def portfolio_deleted_message(portfolio_id: str) -> Dict[str, Any]:
+    """The last message a portfolio's listeners get, once it has been deleted"""
+    return {"portfolio_id": portfolio_id, "deleted": True, "timestamp": int(time.time() * 1000)}
+
+@dataclass
+class LiveHolding:
+    amount: float
+    cost_basis: float
+    price: float
+
+@dataclass
+class LivePortfolio:
+    """In-memory holdings of a watched portfolio and its running value"""
+    portfolio_id: str
+    user_id: str
+    holdings: Dict[str, LiveHolding]  # crypto_id -> holding
+    realized_profit_loss: float
+    total_cost_basis: float
+    value: float = 0.0
+    last_pushed_value: Optional[float] = None
+    listeners: Set[ValuationListener] = field(default_factory=set)
+
+    def recompute(self):
+        self.value = sum(holding.amount * holding.price for holding in self.holdings.values())
+
+    def to_message(self) -> Dict[str, Any]:
+        # Same formulas as DatabaseService.update_portfolio_totals, with live prices
+        open_cost_basis = sum(holding.cost_basis for holding in self.holdings.values())
+        total_profit_loss = self.value - open_cost_basis
+        total_profit_loss_percentage = (
+            ((total_profit_loss + self.realized_profit_loss) / self.total_cost_basis * 100)
+            if self.total_cost_basis > 0 else 0
+        )
+        return {
+            "portfolio_id": self.portfolio_id,
+            "total_value": self.value,
+            "total_profit_loss": total_profit_loss,
+            "total_profit_loss_percentage": total_profit_loss_percentage,
+            "timestamp": int(time.time() * 1000)
+        }
+
+class PortfolioValuationEngine:
+    """Keeps watched portfolios' holdings in memory and revalues them on each price tick.
+
+    Only portfolios with at least one listener are loaded. A crypto_id -> portfolio
+    index means a tick touches just the portfolios holding that coin, and listeners
+    are notified only when the value has moved by at least `threshold_pct` percent
+    since the last push.
+    """
+
+    def __init__(self, hub: PriceHub, broker: Broker, threshold_pct: float = 0.5):
+        self.hub = hub
+        self.broker = broker
+        self.threshold_pct = threshold_pct
+        self.portfolios: Dict[str, LivePortfolio] = {}
+        self.holders: Dict[str, Set[str]] = {}  # crypto_id -> portfolio_ids
+        self._prices: Optional[PriceSubscription] = None
+        self._consumer: Optional[asyncio.Task] = None
+        self.broker.add_handler(self._on_broker_message)
+
+    def get_owner(self, portfolio_id: str) -> Optional[str]:
+        """User id owning a portfolio, or None if it does not exist"""
+        live = self.portfolios.get(portfolio_id)
+        if live:
+            return live.user_id
+        with DatabaseService() as db_service:
+            portfolio = db_service.get_portfolio(portfolio_id)
+            return portfolio.user_id if portfolio else None
+
+    def add_listener(self, portfolio_id: str, listener: ValuationListener) -> bool:
+        """Watch a portfolio; the listener gets the current valuation right away. False if not found"""
+        live = self.portfolios.get(portfolio_id)
+        if live is None:
+            live = self._load(portfolio_id)
+            if live is None:
+                return False
+        live.listeners.add(listener)
+        listener(live.to_message())
+        return True
+
+    def remove_listener(self, portfolio_id: str, listener: ValuationListener):
+        live = self.portfolios.get(portfolio_id)
+        if live is None:
+            return
+        live.listeners.discard(listener)
+        if not live.listeners:
+            self._unload(portfolio_id)
+
+    async def holdings_changed(self, portfolio_id: str):
+        """Tell every worker to reload a portfolio after its assets or transactions change"""
+        await self.broker.publish("portfolio_holdings", {"portfolio_id": portfolio_id})
+
+    async def _on_broker_message(self, channel: str, message: Dict[str, Any]):
+        if channel == "portfolio_holdings":
+            self.reload(message["portfolio_id"])
+
+    def reload(self, portfolio_id: str):
+        """Reload a watched portfolio from the database and push its new valuation"""
+        live = self.portfolios.get(portfolio_id)
+        if live is None:
+            return
+        listeners = live.listeners
+        self._unload(portfolio_id)
+        reloaded = self._load(portfolio_id)
+        if reloaded is None:
+            # Portfolio was deleted: its listeners hear it once and are dropped
+            self._notify(portfolio_id, listeners, portfolio_deleted_message(portfolio_id))
+            return
+        reloaded.listeners = listeners
+        self._push(reloaded)
+
+    def _load(self, portfolio_id: str) -> Optional[LivePortfolio]:
+        with DatabaseService() as db_service:
+            portfolio = db_service.get_portfolio(portfolio_id)
+            if not portfolio:
+                return None
+            holdings = {}
+            for asset in db_service.get_active_portfolio_assets(portfolio_id):
+                tick = self.hub.latest.get(asset.crypto_id)
+                holding = holdings.get(asset.crypto_id)
+                if holding is None:
+                    holdings[asset.crypto_id] = LiveHolding(
+                        amount=asset.amount,
+                        cost_basis=asset.amount * asset.average_buy_price,
+                        price=tick.price if tick else asset.current_price
+                    )
+                else:
+                    holding.amount += asset.amount
+                    holding.cost_basis += asset.amount * asset.average_buy_price
+            live = LivePortfolio(
+                portfolio_id=portfolio_id,
+                user_id=portfolio.user_id,
+                holdings=holdings,
+                realized_profit_loss=portfolio.total_realized_profit_loss or 0.0,
+                total_cost_basis=portfolio.total_cost_basis or 0.0
+            )
+        live.recompute()
+        live.last_pushed_value = live.value
+        self.portfolios[portfolio_id] = live
+
+        new_ids = [crypto_id for crypto_id in holdings if crypto_id not in self.holders]
+        for crypto_id in holdings:
+            self.holders.setdefault(crypto_id, set()).add(portfolio_id)
+        self._ensure_price_subscription()
+        self.hub.update_subscription(self._prices, add=new_ids)
+        return live
+
+    def _unload(self, portfolio_id: str):
+        live = self.portfolios.pop(portfolio_id, None)
+        if live is None:
+            return
+        unheld = []
+        for crypto_id in live.holdings:
+            portfolio_ids = self.holders.get(crypto_id)
+            if portfolio_ids is None:
+                continue
+            portfolio_ids.discard(portfolio_id)
+            if not portfolio_ids:
+                del self.holders[crypto_id]
+                unheld.append(crypto_id)
+        if self._prices is not None:
+            self.hub.update_subscription(self._prices, remove=unheld)
+
+    def _ensure_price_subscription(self):
+        if self._prices is None:
+            # One hub subscription covering every held coin; sized so a full poll never drops ticks
+            self._prices = self.hub.subscribe((), maxsize=10000)
+        if self._consumer is None or self._consumer.done():
+            self._consumer = asyncio.create_task(self._consume())
+
+    async def _consume(self):
+        async for tick in self._prices:
+            try:
+                self.on_tick(tick)
+            except Exception as e:
+                print(f"Error revaluing portfolios for {tick.crypto_id}: {e}")
+
+    def on_tick(self, tick: PriceTick):
+        """Revalue only the portfolios holding the ticked coin"""
+        for portfolio_id in self.holders.get(tick.crypto_id, ()):
+            live = self.portfolios[portfolio_id]
+            holding = live.holdings[tick.crypto_id]
+            live.value += holding.amount * (tick.price - holding.price)
+            holding.price = tick.price
+            if self._moved_past_threshold(live):
+                self._push(live)
+
+    def _moved_past_threshold(self, live: LivePortfolio) -> bool:
+        last = live.last_pushed_value
+        if last is None:
+            return True
+        if last == 0:
+            return live.value != 0
+        return abs(live.value - last) / abs(last) * 100 >= self.threshold_pct
+
+    def _push(self, live: LivePortfolio):
+        live.last_pushed_value = live.value
+        self._notify(live.portfolio_id, live.listeners, live.to_message())
+
+    def _notify(self, portfolio_id: str, listeners: Set[ValuationListener], message: Dict[str, Any]):
+        for listener in list(listeners):
+            try:
+                listener(message)
+            except Exception as e:
+                print(f"Error pushing valuation for portfolio {portfolio_id}: {e}")
+
+    async def stop(self):
+        if self._consumer:
+            self._consumer.cancel()
+            try:
+                await self._consumer
+            except asyncio.CancelledError:
+                pass
+            self._consumer = None
+
+# Global instance
+portfolio_valuations = PortfolioValuationEngine(price_hub, shared_broker, settings.portfolio_update_threshold_pct)
@@ -0,0 +1,78 @@
+"""
+Cached daily price histories, aligned into price matrices for portfolio analytics
+"""
+import asyncio
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.crypto_api import crypto_api_service
+from app.utils.cache import TTLCache
+
+DAY_MS = 86_400_000
+
+def utc_day(timestamp_ms: Optional[float] = None) -> int:
+    """Days since the epoch (UTC) of a millisecond timestamp, or of now"""
+    if timestamp_ms is None:
+        timestamp_ms = time.time() * 1000
+    return int(timestamp_ms // DAY_MS)
+
+def align_daily(days: np.ndarray, prices: np.ndarray, grid: np.ndarray) -> np.ndarray:
+    """Price on each grid day: the last observation on or before it, NaN before the first one"""
+    if len(days) == 0:
+        return np.full(len(grid), np.nan)
+    index = np.searchsorted(days, grid, side="right") - 1
+    return np.where(index >= 0, prices[np.maximum(index, 0)], np.nan)
+
+def fill_gaps(prices: np.ndarray) -> np.ndarray:
+    """Backfill each column's leading NaNs with its first price, so coins listed mid-window contribute no returns before it"""
+    first = np.argmax(~np.isnan(prices), axis=0)
+    first_prices = prices[first, np.arange(prices.shape[1])]
+    return np.where(np.isnan(prices), first_prices, prices)
+
+class PriceHistoryCache:
+    """Daily price histories fetched at most once per coin and window per UTC day.
+
+    Histories are kept as (day, price) arrays with one point per day; failed fetches
+    are not cached so the next request retries them. Fetches for many coins run
+    concurrently, at most `max_concurrent_fetches` at a time.
+    """
+
+    def __init__(self, max_entries: int = 2000, max_concurrent_fetches: int = 5):
+        self._cache = TTLCache(max_entries, DAY_MS / 1000)
+        self._semaphore = asyncio.Semaphore(max_concurrent_fetches)
+
+    async def daily(self, crypto_id: str, days: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(UTC day numbers, closing prices) for the last `days` days"""
+        today = utc_day()
+        key = (crypto_id, days, today)
+        cached = self._cache.get(key)
+        if cached is not None:
+            return cached
+
+        async with self._semaphore:
+            history = await crypto_api_service.get_price_history(crypto_id, days, mock_on_error=False)
+        if not history:
+            return np.array([], dtype=np.int64), np.array([], dtype=float)
+
+        timestamps = np.array([float(point["timestamp"]) for point in history])
+        prices = np.array([point["price"] for point in history], dtype=float)
+        day_numbers = (timestamps // DAY_MS).astype(np.int64)
+        # CoinGecko ends with a point for "now" on top of today's midnight close: keep the last point per day
+        last_of_day = np.append(day_numbers[1:] != day_numbers[:-1], True)
+        result = (day_numbers[last_of_day], prices[last_of_day])
+        self._cache.set(key, result, expires_at=(today + 1) * DAY_MS / 1000)
+        return result
+
+    async def matrix(self, crypto_ids: List[str], days: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(grid of the last `days` + 1 UTC days, prices with one row per day and one column per coin)"""
+        histories = await asyncio.gather(*(self.daily(crypto_id, days) for crypto_id in crypto_ids))
+        today = utc_day()
+        grid = np.arange(today - days, today + 1, dtype=np.int64)
+        prices = np.empty((len(grid), len(crypto_ids)))
+        for column, (day_numbers, closes) in enumerate(histories):
+            prices[:, column] = align_daily(day_numbers, closes, grid)
+        return grid, prices
+
+# Global instance
+price_history_cache = PriceHistoryCache(max_concurrent_fetches=settings.price_history_max_concurrent_fetches)
@@ -0,0 +1,216 @@
+"""
+Price hub: one upstream producer shared by all workers, many subscribers per worker
+"""
+import asyncio
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, replace
+from typing import Dict, Iterable, List, Optional, Set
+from app.core.config import settings
+from app.services.broker import Broker, broker as shared_broker
+from app.services.crypto_api import crypto_api_service
+
+@dataclass(frozen=True)
+class PriceTick:
+    crypto_id: str
+    price: float
+    timestamp: int  # Milliseconds since epoch, like CoinGecko price history
+    seq: int = 0  # Hub-wide publish order, assigned by PriceHub.publish (part of the SSE event id)
+
+class PriceSubscription:
+    """A subscriber's bounded queue of ticks for a set of crypto ids"""
+
+    def __init__(self, hub: "PriceHub", crypto_ids: Iterable[str], maxsize: int):
+        self.hub = hub
+        self.crypto_ids: Set[str] = set(crypto_ids)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def offer(self, tick: PriceTick):
+        """Enqueue without blocking the producer; a full queue drops its oldest tick"""
+        if self.queue.full():
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(tick)
+
+    async def get(self) -> PriceTick:
+        return await self.queue.get()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> PriceTick:
+        return await self.queue.get()
+
+    def close(self):
+        self.hub.unsubscribe(self)
+
+class PriceHub:
+    """Fans price ticks out to subscribers, indexed by crypto_id"""
+
+    def __init__(self, queue_size: int = 100, history_size: int = 64):
+        self.queue_size = queue_size
+        self.history_size = history_size
+        self._subscribers: Dict[str, Set[PriceSubscription]] = {}
+        self._seq = 0
+        # Sequence numbers only mean something within one hub, so event ids carry this too
+        self.epoch = uuid.uuid4().hex[:12]
+        self.latest: Dict[str, PriceTick] = {}
+        self.history: Dict[str, deque] = {}  # crypto_id -> ring buffer of recent ticks
+
+    def subscribe(self, crypto_ids: Iterable[str], maxsize: Optional[int] = None) -> PriceSubscription:
+        """Register for ticks of the given crypto ids"""
+        subscription = PriceSubscription(self, crypto_ids, maxsize or self.queue_size)
+        for crypto_id in subscription.crypto_ids:
+            self._subscribers.setdefault(crypto_id, set()).add(subscription)
+        return subscription
+
+    def update_subscription(self, subscription: PriceSubscription,
+                            add: Iterable[str] = (), remove: Iterable[str] = ()):
+        """Change the crypto ids of an existing subscription"""
+        for crypto_id in remove:
+            if crypto_id in subscription.crypto_ids:
+                subscription.crypto_ids.discard(crypto_id)
+                self._remove_subscriber(crypto_id, subscription)
+        for crypto_id in add:
+            subscription.crypto_ids.add(crypto_id)
+            self._subscribers.setdefault(crypto_id, set()).add(subscription)
+
+    def unsubscribe(self, subscription: PriceSubscription):
+        for crypto_id in subscription.crypto_ids:
+            self._remove_subscriber(crypto_id, subscription)
+
+    def _remove_subscriber(self, crypto_id: str, subscription: PriceSubscription):
+        subscribers = self._subscribers.get(crypto_id)
+        if subscribers is None:
+            return
+        subscribers.discard(subscription)
+        if not subscribers:
+            del self._subscribers[crypto_id]
+
+    def subscribed_crypto_ids(self) -> Set[str]:
+        """Crypto ids with at least one subscriber"""
+        return set(self._subscribers)
+
+    def subscriber_count(self, crypto_id: str) -> int:
+        return len(self._subscribers.get(crypto_id, ()))
+
+    def latest_ticks(self, crypto_ids: Iterable[str]) -> List[PriceTick]:
+        return [self.latest[crypto_id] for crypto_id in crypto_ids if crypto_id in self.latest]
+
+    def ticks_since(self, crypto_ids: Iterable[str], seq: int) -> List[PriceTick]:
+        """Buffered ticks published after `seq`, in publish order"""
+        ticks = [
+            tick
+            for crypto_id in crypto_ids
+            for tick in self.history.get(crypto_id, ())
+            if tick.seq > seq
+        ]
+        return sorted(ticks, key=lambda tick: tick.seq)
+
+    @property
+    def last_seq(self) -> int:
+        return self._seq
+
+    def publish(self, tick: PriceTick):
+        """Deliver a tick to the subscribers of its crypto only"""
+        self._seq += 1
+        tick = replace(tick, seq=self._seq)
+        self.latest[tick.crypto_id] = tick
+        history = self.history.get(tick.crypto_id)
+        if history is None:
+            history = self.history[tick.crypto_id] = deque(maxlen=self.history_size)
+        history.append(tick)
+        for subscription in self._subscribers.get(tick.crypto_id, ()):
+            subscription.offer(tick)
+
+    def publish_prices(self, prices: Dict[str, float], timestamp: Optional[int] = None):
+        """Publish a crypto_id -> USD price map from a bulk fetch"""
+        timestamp = timestamp or int(time.time() * 1000)
+        for crypto_id, price in prices.items():
+            self.publish(PriceTick(crypto_id=crypto_id, price=float(price), timestamp=timestamp))
+
+class PricePoller:
+    """The hubs' single upstream producer: one bulk fetch per interval for every id subscribed on any worker.
+
+    Each worker announces its subscribed ids on the broker every interval. Only the
+    worker holding the "price_poller" lease fetches prices, for its own ids and the
+    ones announced recently, and publishes them back through the broker so every
+    worker's hub gets the same ticks. With the in-memory broker the one process
+    always holds the lease.
+    """
+
+    def __init__(self, hub: PriceHub, broker: Broker, interval_seconds: int = 10):
+        self.hub = hub
+        self.broker = broker
+        self.interval_seconds = interval_seconds
+        self.worker_id = uuid.uuid4().hex
+        self._announced: Dict[str, float] = {}  # crypto_id -> monotonic time another worker last announced it
+        self._task: Optional[asyncio.Task] = None
+        broker.add_handler(self._on_broker_message)
+
+    @property
+    def lease_seconds(self) -> float:
+        # Outlives a missed renewal, so one slow poll does not hand the lease to another worker
+        return self.interval_seconds * 3
+
+    async def _on_broker_message(self, channel: str, message: Dict):
+        if channel == "price_interest" and message["worker_id"] != self.worker_id:
+            now = time.monotonic()
+            for crypto_id in message["crypto_ids"]:
+                self._announced[crypto_id] = now
+        elif channel == "price_ticks":
+            self.hub.publish_prices(message["prices"], message["timestamp"])
+
+    def wanted_crypto_ids(self) -> Set[str]:
+        """Ids subscribed on this worker, or announced by another within the lease period"""
+        cutoff = time.monotonic() - self.lease_seconds
+        for crypto_id, announced_at in list(self._announced.items()):
+            if announced_at < cutoff:
+                del self._announced[crypto_id]
+        return self.hub.subscribed_crypto_ids() | set(self._announced)
+
+    async def poll_once(self) -> int:
+        """Announce this worker's ids; on the lease holder, fetch and publish prices. Returns ticks published"""
+        subscribed = self.hub.subscribed_crypto_ids()
+        if subscribed:
+            await self.broker.publish("price_interest", {"worker_id": self.worker_id, "crypto_ids": sorted(subscribed)})
+        if not await self.broker.acquire_lease("price_poller", self.worker_id, self.lease_seconds):
+            return 0
+
+        crypto_ids = self.wanted_crypto_ids()
+        if not crypto_ids:
+            return 0
+        prices = await crypto_api_service.get_simple_prices(sorted(crypto_ids))
+        if prices:
+            await self.broker.publish("price_ticks", {"prices": prices, "timestamp": int(time.time() * 1000)})
+        return len(prices)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except Exception as e:
+                print(f"Error polling prices: {e}")
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self):
+        """Start the polling loop (no-op if disabled or already running)"""
+        if self.interval_seconds <= 0 or (self._task and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the polling loop"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+# Global instances
+price_hub = PriceHub(settings.price_hub_queue_size, settings.price_hub_history_size)
+price_poller = PricePoller(price_hub, shared_broker, settings.price_poll_interval_seconds)
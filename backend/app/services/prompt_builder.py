@@ -0,0 +1,95 @@
+"""
+Token-budgeted portfolio summaries for AI prompts
+"""
+from typing import Dict, List
+from app.core.config import settings
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token for English and numbers)"""
+    return (len(text) + 3) // 4
+
+def format_holding(asset: Dict, weight: float) -> str:
+    symbol = asset.get("symbol", "Unknown")
+    amount = asset.get("amount", 0)
+    current_price = asset.get("current_price", 0)
+    total_value = asset.get("total_value", 0)
+    profit_loss = asset.get("profit_loss", 0)
+    profit_loss_pct = asset.get("profit_loss_percentage", 0)
+    return (
+        f"- {symbol}: {amount:.6f} tokens @ ${current_price:.4f} = ${total_value:.2f} ({weight:.1f}% of portfolio)\n"
+        f"  P&L: ${profit_loss:.2f} ({profit_loss_pct:+.2f}%)\n"
+    )
+
+class PortfolioPromptBuilder:
+    """Summarizes a portfolio within a token budget, however many positions it has.
+
+    Closed positions are skipped, holdings are ranked by value, and the largest
+    `max_holdings` are listed individually while they fit in `token_budget`; the
+    remaining tail is folded into one "Others" line. Summary statistics computed
+    over all holdings lead the text so the model sees the full picture.
+    """
+
+    def __init__(self, max_holdings: int = 25, token_budget: int = 1500):
+        self.max_holdings = max_holdings
+        self.token_budget = token_budget
+
+    def build(self, portfolio_data: Dict) -> str:
+        if not portfolio_data or "assets" not in portfolio_data:
+            return "No portfolio data available"
+
+        holdings = [asset for asset in portfolio_data.get("assets", []) if asset.get("amount", 0) > 0]
+        holdings.sort(key=lambda asset: asset.get("total_value", 0), reverse=True)
+        total_value = sum(asset.get("total_value", 0) for asset in holdings)
+        weights = [(asset.get("total_value", 0) / total_value * 100) if total_value > 0 else 0 for asset in holdings]
+
+        summary = self._summary(holdings, weights, total_value)
+        if not holdings:
+            return summary
+        used = estimate_tokens(summary)
+
+        lines: List[str] = []
+        listed = 0
+        for asset, weight in zip(holdings, weights):
+            if listed >= self.max_holdings:
+                break
+            line = format_holding(asset, weight)
+            # Keep room for the "Others" line that covers whatever is left out
+            if used + estimate_tokens(line) > self.token_budget - 40 and listed > 0:
+                break
+            lines.append(line)
+            used += estimate_tokens(line)
+            listed += 1
+
+        others = holdings[listed:]
+        if others:
+            others_value = sum(asset.get("total_value", 0) for asset in others)
+            others_profit_loss = sum(asset.get("profit_loss", 0) for asset in others)
+            lines.append(
+                f"- Others ({len(others)} smaller holdings): ${others_value:.2f} "
+                f"({sum(weights[listed:]):.1f}% of portfolio), P&L: ${others_profit_loss:.2f}\n"
+            )
+
+        return summary + "Holdings:\n" + "".join(lines)
+
+    def _summary(self, holdings: List[Dict], weights: List[float], total_value: float) -> str:
+        summary = f"Total Portfolio Value: ${total_value:,.2f}\n"
+        if not holdings:
+            return summary + "No open positions.\n\n"
+
+        total_profit_loss = sum(asset.get("profit_loss", 0) for asset in holdings)
+        cost_basis = total_value - total_profit_loss
+        profit_loss_pct = (total_profit_loss / cost_basis * 100) if cost_basis > 0 else 0
+        winners = sum(1 for asset in holdings if asset.get("profit_loss", 0) > 0)
+        losers = sum(1 for asset in holdings if asset.get("profit_loss", 0) < 0)
+        # Herfindahl index of weights; its inverse is the effective number of equally sized holdings
+        concentration = sum((weight / 100) ** 2 for weight in weights)
+        effective_holdings = (1 / concentration) if concentration > 0 else 0
+
+        summary += f"Open Positions: {len(holdings)} ({winners} in profit, {losers} at a loss)\n"
+        summary += f"Unrealized P&L: ${total_profit_loss:,.2f} ({profit_loss_pct:+.2f}%)\n"
+        summary += f"Largest Holding: {holdings[0].get('symbol', 'Unknown')} ({weights[0]:.1f}%), Top 5: {sum(weights[:5]):.1f}% of value\n"
+        summary += f"Effective Number of Holdings: {effective_holdings:.1f}\n\n"
+        return summary
+
+# Global instance
+portfolio_prompt_builder = PortfolioPromptBuilder(settings.ai_prompt_max_holdings, settings.ai_prompt_token_budget)
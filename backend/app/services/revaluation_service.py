@@ -0,0 +1,64 @@
+"""
+Background revaluation of stored portfolio valuations from bulk price fetches
+"""
+import asyncio
+from typing import Dict, Optional
+from app.core.config import settings
+from app.services.crypto_api import crypto_api_service
+from app.services.database_service import DatabaseService
+from app.services.price_hub import price_hub
+
+class RevaluationJob:
+    """Keeps every holding and portfolio total current with the latest market prices"""
+    
+    def __init__(self, interval_seconds: int = 60):
+        self.interval_seconds = interval_seconds
+        self._task: Optional[asyncio.Task] = None
+    
+    def revalue(self, prices: Dict[str, float]) -> int:
+        """Apply a crypto_id -> USD price map to all holdings and roll up portfolio totals"""
+        with DatabaseService() as db_service:
+            return db_service.revalue_holdings(prices)
+    
+    async def run_once(self) -> int:
+        """Fetch prices for all held cryptos in bulk and revalue; returns rows updated"""
+        with DatabaseService() as db_service:
+            crypto_ids = db_service.get_held_crypto_ids()
+        
+        if not crypto_ids:
+            return 0
+        
+        prices = await crypto_api_service.get_simple_prices(crypto_ids)
+        
+        # Share the fetch with live price subscribers
+        price_hub.publish_prices(prices)
+        
+        # The set-based UPDATEs are synchronous, keep them off the event loop
+        return await asyncio.to_thread(self.revalue, prices)
+    
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                print(f"Error revaluing portfolios: {e}")
+            await asyncio.sleep(self.interval_seconds)
+    
+    def start(self):
+        """Start the periodic revaluation loop (no-op if disabled or already running)"""
+        if self.interval_seconds <= 0 or (self._task and not self._task.done()):
+            return
+        self._task = asyncio.create_task(self._run())
+    
+    async def stop(self):
+        """Stop the periodic revaluation loop"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+# Global instance
+revaluation_job = RevaluationJob(settings.revaluation_interval_seconds)
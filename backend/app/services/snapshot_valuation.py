@@ -0,0 +1,94 @@
+"""
+Revaluation of stored holdings from the in-memory price snapshot at read time
+"""
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+from app.core.config import settings
+from app.services.crypto_api import crypto_api_service
+from app.services.price_hub import PriceHub, price_hub
+
+@dataclass
+class HoldingValuations:
+    """Per-holding and per-portfolio valuations, aligned with the holdings passed in"""
+    current_price: np.ndarray
+    total_value: np.ndarray
+    profit_loss: np.ndarray
+    profit_loss_percentage: np.ndarray
+    portfolio_total_value: np.ndarray
+    portfolio_profit_loss: np.ndarray
+
+def value_holdings(amounts: np.ndarray, average_buy_prices: np.ndarray, prices: np.ndarray,
+                   portfolio_index: np.ndarray, portfolio_count: int) -> HoldingValuations:
+    """Value every holding and sum portfolio totals in a few array operations, matching the revaluation job"""
+    total_value = amounts * prices
+    profit_loss = total_value - amounts * average_buy_prices
+    with np.errstate(divide="ignore", invalid="ignore"):
+        profit_loss_percentage = np.where(
+            average_buy_prices > 0, (prices - average_buy_prices) / average_buy_prices * 100, 0.0
+        )
+    return HoldingValuations(
+        current_price=prices,
+        total_value=total_value,
+        profit_loss=profit_loss,
+        profit_loss_percentage=profit_loss_percentage,
+        portfolio_total_value=np.bincount(portfolio_index, weights=total_value, minlength=portfolio_count),
+        portfolio_profit_loss=np.bincount(portfolio_index, weights=profit_loss, minlength=portfolio_count)
+    )
+
+class SnapshotValuer:
+    """Values holdings at the prices in the shared price hub.
+
+    Prices come from the hub's latest ticks, which the revaluation job and live
+    subscriptions keep current. Ids with no tick, or one older than
+    `max_price_age_seconds`, are fetched together in one bulk request and published
+    to the hub so the next reader finds them there.
+    """
+
+    def __init__(self, hub: PriceHub, max_price_age_seconds: int = 120):
+        self.hub = hub
+        self.max_price_age_seconds = max_price_age_seconds
+
+    async def prices(self, crypto_ids: Iterable[str]) -> Dict[str, float]:
+        """crypto_id -> USD price for every id that can be priced"""
+        crypto_ids = set(crypto_ids)
+        cutoff = (time.time() - self.max_price_age_seconds) * 1000
+        prices = {}
+        for crypto_id in crypto_ids:
+            tick = self.hub.latest.get(crypto_id)
+            if tick is not None and tick.timestamp >= cutoff:
+                prices[crypto_id] = tick.price
+
+        missing = sorted(crypto_ids - prices.keys())
+        if missing:
+            fetched = await crypto_api_service.get_simple_prices(missing)
+            self.hub.publish_prices(fetched)
+            prices.update(fetched)
+            # Anything the API could not price keeps its last known tick, however old
+            for crypto_id in missing:
+                if crypto_id not in prices and crypto_id in self.hub.latest:
+                    prices[crypto_id] = self.hub.latest[crypto_id].price
+        return prices
+
+    async def value(self, holdings: List, portfolio_index: List[int], portfolio_count: int) -> HoldingValuations:
+        """Value asset rows (amount, average_buy_price, crypto_id, current_price) at snapshot prices"""
+        prices = await self.prices(asset.crypto_id for asset in holdings)
+        # Holdings the snapshot cannot price keep their stored price
+        price_array = np.array(
+            [prices.get(asset.crypto_id, asset.current_price or 0.0) for asset in holdings], dtype=float
+        )
+        return value_holdings(
+            np.array([asset.amount or 0.0 for asset in holdings], dtype=float),
+            np.array([asset.average_buy_price or 0.0 for asset in holdings], dtype=float),
+            price_array,
+            np.array(portfolio_index, dtype=np.intp),
+            portfolio_count
+        )
+
+def profit_loss_percentage(unrealized: float, realized: Optional[float], cost_basis: Optional[float]) -> float:
+    """Portfolio P&L percentage, as rolled up by the revaluation job"""
+    return (unrealized + (realized or 0.0)) / cost_basis * 100 if cost_basis and cost_basis > 0 else 0.0
+
+# Global instance
+snapshot_valuer = SnapshotValuer(price_hub, settings.live_valuation_max_price_age_seconds)
@@ -0,0 +1,139 @@
+"""
+Portfolio value over time, replayed from transactions against daily prices
+"""
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Set
+import numpy as np
+from app.core.config import settings
+from app.services.broker import Broker, broker as shared_broker
+from app.services.database_service import DatabaseService
+from app.services.price_history import DAY_MS, PriceHistoryCache, price_history_cache, utc_day
+from app.utils.cache import TTLCache
+
+# Grid spacing in days for each supported resolution
+RESOLUTIONS = {"daily": 1, "weekly": 7}
+
+class TransactionRow(NamedTuple):
+    """The transaction fields the replay needs, detached from the database session"""
+    crypto_id: str
+    transaction_type: str
+    amount: float
+    total_value: float
+    realized_profit_loss: Optional[float]
+    timestamp: datetime
+
+@dataclass
+class ValueHistoryResult:
+    portfolio_id: str
+    days: int
+    resolution: str
+    timestamps: np.ndarray  # Milliseconds since epoch, UTC midnight of each point's day (the last is today)
+    value: np.ndarray
+    cost_basis: np.ndarray
+    realized_profit_loss: np.ndarray
+    missing_history: List[str]
+
+    @property
+    def unrealized_profit_loss(self) -> np.ndarray:
+        return self.value - self.cost_basis
+
+def replay_transactions(transactions: List, crypto_ids: List[str], grid: np.ndarray):
+    """Holdings (days x coins), cost basis and realized P&L at the end of each grid day, without a per-day loop.
+
+    Each transaction adds its deltas to the row of its UTC day (earlier ones to the
+    first row), and cumulative sums carry them forward, following AssetState.apply:
+    a buy adds its amount and cost, a sell removes its amount and the cost it released.
+    """
+    column_index = {crypto_id: index for index, crypto_id in enumerate(crypto_ids)}
+    buys = np.array([t.transaction_type == "buy" for t in transactions], dtype=bool)
+    sells = np.array([t.transaction_type == "sell" for t in transactions], dtype=bool)
+    amounts = np.array([t.amount for t in transactions], dtype=float)
+    totals = np.array([t.total_value for t in transactions], dtype=float)
+    realized = np.array([t.realized_profit_loss or 0.0 for t in transactions], dtype=float) * sells
+    # Naive datetimes are UTC, so datetime64[D] is the UTC day
+    days = np.array([t.timestamp for t in transactions], dtype="datetime64[D]").astype(np.int64)
+    rows = np.clip(days - grid[0], 0, len(grid) - 1)
+    columns = np.array([column_index[t.crypto_id] for t in transactions], dtype=np.intp)
+
+    amount_deltas = np.zeros((len(grid), len(crypto_ids)))
+    np.add.at(amount_deltas, (rows, columns), amounts * buys - amounts * sells)
+    cost_deltas = totals * buys - (totals - realized) * sells
+    holdings = np.maximum(np.cumsum(amount_deltas, axis=0), 0.0)
+    cost_basis = np.maximum(np.cumsum(np.bincount(rows, weights=cost_deltas, minlength=len(grid))), 0.0)
+    realized_profit_loss = np.cumsum(np.bincount(rows, weights=realized, minlength=len(grid)))
+    return holdings, cost_basis, realized_profit_loss
+
+class PortfolioValueHistoryService:
+    """Equity curves of portfolios, cached until their transactions change.
+
+    Series are cached per portfolio, window, resolution and UTC price day. Any
+    "portfolio_holdings" broker message (published after every mutation that writes
+    transactions) drops the portfolio's entries on every worker.
+    """
+
+    def __init__(self, histories: PriceHistoryCache, broker: Broker, max_entries: int = 1000):
+        self.histories = histories
+        self._results = TTLCache(max_entries, 86400)
+        self._keys: Dict[str, Set[tuple]] = {}  # portfolio_id -> cached keys
+        self._generations: Dict[str, int] = {}  # Bumped on invalidation, so results computed meanwhile are not cached
+        broker.add_handler(self._on_broker_message)
+
+    async def _on_broker_message(self, channel: str, message: Dict[str, Any]):
+        if channel == "portfolio_holdings":
+            self.invalidate(message["portfolio_id"])
+
+    def invalidate(self, portfolio_id: str):
+        self._generations[portfolio_id] = self._generations.get(portfolio_id, 0) + 1
+        for key in self._keys.pop(portfolio_id, ()):
+            self._results.pop(key)
+
+    async def history(self, portfolio_id: str, days: int, resolution: str = "daily") -> ValueHistoryResult:
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution '{resolution}', expected one of: {', '.join(RESOLUTIONS)}")
+        key = (portfolio_id, days, resolution, utc_day())
+        cached = self._results.get(key)
+        if cached is not None:
+            return cached
+
+        generation = self._generations.get(portfolio_id, 0)
+        with DatabaseService() as db_service:
+            # Includes transactions of assets removed since, which still shape the past
+            transactions = [
+                TransactionRow(t.crypto_id, t.transaction_type, t.amount, t.total_value, t.realized_profit_loss, t.timestamp)
+                for t in db_service.get_portfolio_transactions(portfolio_id)
+            ]
+        crypto_ids = sorted({transaction.crypto_id for transaction in transactions})
+        grid, prices = await self.histories.matrix(crypto_ids, days)
+        unpriced = np.isnan(prices)
+
+        if transactions:
+            holdings, cost_basis, realized = replay_transactions(transactions, crypto_ids, grid)
+            # Days without a price (before a coin's first one, or all of them) count as zero value
+            value = np.einsum("ij,ij->i", holdings, np.nan_to_num(prices))
+            missing = (unpriced & (holdings > 0)).any(axis=0)
+        else:
+            value = cost_basis = realized = np.zeros(len(grid))
+            missing = unpriced.all(axis=0)
+
+        # Coarser resolutions sample the daily series, always ending on today
+        points = np.arange(len(grid) - 1, -1, -RESOLUTIONS[resolution])[::-1]
+        result = ValueHistoryResult(
+            portfolio_id=portfolio_id,
+            days=days,
+            resolution=resolution,
+            timestamps=grid[points] * DAY_MS,
+            value=value[points],
+            cost_basis=cost_basis[points],
+            realized_profit_loss=realized[points],
+            missing_history=[crypto_id for crypto_id, absent in zip(crypto_ids, missing) if absent]
+        )
+        if self._generations.get(portfolio_id, 0) == generation:
+            self._results.set(key, result)
+            self._keys.setdefault(portfolio_id, set()).add(key)
+        return result
+
+# Global instance
+portfolio_value_history = PortfolioValueHistoryService(
+    price_history_cache, shared_broker, settings.value_history_cache_max_entries
+)
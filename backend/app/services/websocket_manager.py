@@ -3,72 +3,429 @@ WebSocket manager for real-time updates
 """
 import asyncio
 import json
-from typing import Dict, Set, Any
+import time
+from collections import deque
+from typing import Callable, Dict, Optional, Set, Any, Iterable
 from websockets.server import WebSocketServerProtocol
+from app.core.config import settings
+from app.services.broker import Broker, broker as shared_broker
 from app.services.crypto_api import crypto_api_service
+from app.services.portfolio_valuation import PortfolioValuationEngine, portfolio_valuations
+
+_MISSING = object()
+
+class ConnectionWriter:
+    """Owns one websocket's outbound messages and drains them on its own task.
+
+    Regular messages go through a bounded FIFO queue. Price updates are staged
+    per crypto (latest value wins) and sent as one batched frame per flush,
+    carrying only the fields that changed since the previous frame, so a slow
+    reader gets fresh prices instead of a backlog. A send that fails or exceeds
+    the slow-consumer timeout hands the connection to `on_failure` for eviction.
+    """
+    
+    def __init__(self, websocket: WebSocketServerProtocol, connection_id: str,
+                 on_failure: Callable[["ConnectionWriter"], None],
+                 max_queue: int = 256, slow_consumer_timeout: float = 10.0,
+                 user_id: Optional[str] = None):
+        self.websocket = websocket
+        self.connection_id = connection_id
+        self.user_id = user_id
+        self.last_activity = time.monotonic()
+        self.on_failure = on_failure
+        self.max_queue = max_queue
+        self.slow_consumer_timeout = slow_consumer_timeout
+        self.full_since: Optional[float] = None
+        self._queue: deque = deque()
+        self._pending_prices: Dict[str, Dict[str, Any]] = {}  # crypto_id -> fields staged since the last frame
+        self._sent_prices: Dict[str, Dict[str, Any]] = {}  # crypto_id -> fields as the client last saw them
+        self._prices_due = False
+        self._ready = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+    
+    @property
+    def depth(self) -> int:
+        """Messages waiting to be sent"""
+        return len(self._queue) + len(self._pending_prices)
+    
+    def touch(self):
+        """Record inbound traffic from the client"""
+        self.last_activity = time.monotonic()
+    
+    def enqueue(self, message: str) -> bool:
+        """Queue a message; returns False once the queue has stayed full past the timeout"""
+        if len(self._queue) >= self.max_queue:
+            now = time.monotonic()
+            if self.full_since is None:
+                self.full_since = now
+            # Drop the message; the caller evicts the connection when we report False
+            return now - self.full_since < self.slow_consumer_timeout
+        self._queue.append(message)
+        self._ready.set()
+        return True
+    
+    def stage_price(self, crypto_id: str, price_data: Dict[str, Any]):
+        """Stage a price update for the next batched frame"""
+        self._pending_prices.setdefault(crypto_id, {}).update(price_data)
+    
+    def flush_prices(self):
+        """Mark staged prices ready to go out as one frame"""
+        if self._pending_prices:
+            self._prices_due = True
+            self._ready.set()
+    
+    def forget_price(self, crypto_id: str):
+        """Drop delta state so a re-subscription starts from a full snapshot"""
+        self._pending_prices.pop(crypto_id, None)
+        self._sent_prices.pop(crypto_id, None)
+    
+    def _build_price_frame(self) -> Optional[str]:
+        # Built at send time, so frames skipped by a slow reader fold into this one
+        updates = {}
+        for crypto_id, data in self._pending_prices.items():
+            sent = self._sent_prices.setdefault(crypto_id, {})
+            changed = {field: value for field, value in data.items() if sent.get(field, _MISSING) != value}
+            if changed:
+                updates[crypto_id] = changed
+                sent.update(changed)
+        self._pending_prices.clear()
+        self._prices_due = False
+        if not updates:
+            return None
+        return json.dumps({"type": "price_batch", "updates": updates})
+    
+    async def _run(self):
+        try:
+            while True:
+                await self._ready.wait()
+                self._ready.clear()
+                while self._queue or self._prices_due:
+                    if self._queue:
+                        message = self._queue.popleft()
+                    else:
+                        message = self._build_price_frame()
+                        if message is None:
+                            continue
+                    await asyncio.wait_for(self.websocket.send(message), self.slow_consumer_timeout)
+                    self.full_since = None
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Send failed or the peer is too slow to keep up
+            self.on_failure(self)
+    
+    def close(self):
+        """Stop the writer; pending messages are discarded"""
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
 
 class WebSocketManager:
     """Manages WebSocket connections for real-time updates"""
     
-    def __init__(self):
+    def __init__(self, broker: Optional[Broker] = None, valuations: Optional[PortfolioValuationEngine] = None):
         self.connections: Dict[str, Set[WebSocketServerProtocol]] = {}
         self.price_subscriptions: Dict[str, Set[str]] = {}  # connection_id -> crypto_ids
+        self.price_subscribers: Dict[str, Set[str]] = {}  # crypto_id -> connection_ids (inverted index)
+        self.portfolio_subscriptions: Dict[str, Set[str]] = {}  # connection_id -> portfolio_ids
+        self.portfolio_subscribers: Dict[str, Set[str]] = {}  # portfolio_id -> connection_ids
+        self._portfolio_listeners: Dict[str, Callable[[Dict[str, Any]], None]] = {}  # portfolio_id -> valuation listener
+        self.valuations = valuations or portfolio_valuations
+        self.writers: Dict[WebSocketServerProtocol, ConnectionWriter] = {}
+        self.user_connections: Dict[str, Set[WebSocketServerProtocol]] = {}  # user_id -> websockets
+        self.evictions: Dict[str, int] = {}  # close reason -> count
+        self.heartbeat_interval = settings.ws_heartbeat_interval_seconds
+        self._heartbeat: Optional[asyncio.Task] = None
+        self.batch_window = settings.ws_tick_batch_ms / 1000
+        self._dirty_writers: Set[ConnectionWriter] = set()
+        self._batcher: Optional[asyncio.Task] = None
+        
+        # Broadcasts are published once through the broker; every worker delivers to its own sockets
+        self.broker = broker or shared_broker
+        self.broker.add_handler(self._on_broker_message)
+    
+    async def start(self):
+        """Start receiving broadcasts published by any worker, and the heartbeat"""
+        await self.broker.start()
+        if self.heartbeat_interval > 0 and (self._heartbeat is None or self._heartbeat.done()):
+            self._heartbeat = asyncio.create_task(self._run_heartbeat())
+    
+    async def stop(self):
+        if self._heartbeat:
+            self._heartbeat.cancel()
+            try:
+                await self._heartbeat
+            except asyncio.CancelledError:
+                pass
+            self._heartbeat = None
+        await self.broker.stop()
+    
+    async def _on_broker_message(self, channel: str, message: Dict[str, Any]):
+        if channel == "price_update":
+            self._deliver_price_update(message["crypto_id"], message["data"])
+        elif channel == "portfolio_update":
+            self._deliver_portfolio_update(message["portfolio_id"], message["data"])
         
-    async def connect(self, websocket: WebSocketServerProtocol, connection_id: str):
-        """Register a new WebSocket connection"""
+    async def connect(self, websocket: WebSocketServerProtocol, connection_id: str,
+                      user_id: Optional[str] = None) -> bool:
+        """Register a new WebSocket connection; False if the user is at the connection cap"""
+        if user_id is not None:
+            user_sockets = self.user_connections.setdefault(user_id, set())
+            if len(user_sockets) >= settings.ws_max_connections_per_user:
+                if not user_sockets:
+                    del self.user_connections[user_id]
+                return False
+            user_sockets.add(websocket)
         if connection_id not in self.connections:
             self.connections[connection_id] = set()
         self.connections[connection_id].add(websocket)
+        self.writers[websocket] = ConnectionWriter(
+            websocket,
+            connection_id,
+            on_failure=self._on_writer_failure,
+            max_queue=settings.ws_send_queue_size,
+            slow_consumer_timeout=settings.ws_slow_consumer_timeout_seconds,
+            user_id=user_id
+        )
+        return True
+    
+    def touch(self, websocket: WebSocketServerProtocol):
+        """Record that a message was received from the client"""
+        writer = self.writers.get(websocket)
+        if writer:
+            writer.touch()
+    
+    async def receive(self, websocket: WebSocketServerProtocol) -> str:
+        """Wait for the client's next message, which keeps an unsubscribed connection from idling out"""
+        message = await websocket.recv()
+        self.touch(websocket)
+        return message
         
     async def disconnect(self, websocket: WebSocketServerProtocol, connection_id: str):
         """Unregister a WebSocket connection"""
+        writer = self.writers.pop(websocket, None)
+        if writer:
+            writer.close()
+            self._dirty_writers.discard(writer)
+            if writer.user_id is not None:
+                user_sockets = self.user_connections.get(writer.user_id)
+                if user_sockets is not None:
+                    user_sockets.discard(websocket)
+                    if not user_sockets:
+                        del self.user_connections[writer.user_id]
         if connection_id in self.connections:
             self.connections[connection_id].discard(websocket)
             if not self.connections[connection_id]:
                 del self.connections[connection_id]
                 # Clean up subscriptions
-                if connection_id in self.price_subscriptions:
-                    del self.price_subscriptions[connection_id]
+                self._unindex(connection_id, self.price_subscriptions.pop(connection_id, set()))
+                for portfolio_id in list(self.portfolio_subscriptions.get(connection_id, ())):
+                    await self.unsubscribe_from_portfolio(connection_id, portfolio_id)
     
     async def subscribe_to_prices(self, connection_id: str, crypto_ids: list[str]):
-        """Subscribe connection to price updates for specific cryptos"""
-        self.price_subscriptions[connection_id] = set(crypto_ids)
+        """Replace a connection's price subscriptions with the given cryptos"""
+        current = self.price_subscriptions.get(connection_id, set())
+        wanted = set(crypto_ids)
+        await self.unsubscribe_from_prices(connection_id, current - wanted)
+        await self.add_price_subscriptions(connection_id, wanted - current)
+    
+    async def add_price_subscriptions(self, connection_id: str, crypto_ids: Iterable[str]):
+        """Add cryptos to a connection's price subscriptions"""
+        subscribed = self.price_subscriptions.setdefault(connection_id, set())
+        for crypto_id in crypto_ids:
+            subscribed.add(crypto_id)
+            self.price_subscribers.setdefault(crypto_id, set()).add(connection_id)
+    
+    async def unsubscribe_from_prices(self, connection_id: str, crypto_ids: Iterable[str]):
+        """Remove cryptos from a connection's price subscriptions"""
+        subscribed = self.price_subscriptions.get(connection_id)
+        if subscribed is None:
+            return
+        removed = subscribed.intersection(crypto_ids)
+        subscribed -= removed
+        self._unindex(connection_id, removed)
+        for websocket in self.connections.get(connection_id, ()):
+            writer = self.writers.get(websocket)
+            if writer:
+                for crypto_id in removed:
+                    writer.forget_price(crypto_id)
+        if not subscribed:
+            del self.price_subscriptions[connection_id]
+    
+    async def subscribe_to_portfolio(self, connection_id: str, portfolio_id: str, user_id: str) -> bool:
+        """Subscribe a connection to live valuation of a portfolio owned by `user_id`"""
+        if self.valuations.get_owner(portfolio_id) != user_id:
+            return False
+        # Index first so the connection receives the current valuation pushed on subscribe
+        self.portfolio_subscriptions.setdefault(connection_id, set()).add(portfolio_id)
+        self.portfolio_subscribers.setdefault(portfolio_id, set()).add(connection_id)
+        listener = self._portfolio_listeners.get(portfolio_id)
+        if listener is None:
+            # One valuation listener per portfolio, shared by every subscribed connection on this worker
+            listener = lambda valuation: self._on_valuation(portfolio_id, valuation)
+            self._portfolio_listeners[portfolio_id] = listener
+            if not self.valuations.add_listener(portfolio_id, listener):
+                await self.unsubscribe_from_portfolio(connection_id, portfolio_id)
+                return False
+        else:
+            current = self.valuations.portfolios[portfolio_id].to_message()
+            self._deliver_portfolio_update(portfolio_id, current, connection_ids=[connection_id])
+        return True
+    
+    async def unsubscribe_from_portfolio(self, connection_id: str, portfolio_id: str):
+        """Stop live valuation updates of a portfolio for a connection"""
+        subscribed = self.portfolio_subscriptions.get(connection_id)
+        if subscribed is not None:
+            subscribed.discard(portfolio_id)
+            if not subscribed:
+                del self.portfolio_subscriptions[connection_id]
+        subscribers = self.portfolio_subscribers.get(portfolio_id)
+        if subscribers is None:
+            return
+        subscribers.discard(connection_id)
+        if not subscribers:
+            del self.portfolio_subscribers[portfolio_id]
+            listener = self._portfolio_listeners.pop(portfolio_id, None)
+            if listener:
+                self.valuations.remove_listener(portfolio_id, listener)
+    
+    def _on_valuation(self, portfolio_id: str, valuation: Dict[str, Any]):
+        self._deliver_portfolio_update(portfolio_id, valuation)
+        if valuation.get("deleted"):
+            # The valuation engine has already dropped the listener; forget the portfolio's subscribers
+            self._portfolio_listeners.pop(portfolio_id, None)
+            for connection_id in self.portfolio_subscribers.pop(portfolio_id, ()):
+                subscribed = self.portfolio_subscriptions.get(connection_id)
+                if subscribed is not None:
+                    subscribed.discard(portfolio_id)
+                    if not subscribed:
+                        del self.portfolio_subscriptions[connection_id]
+    
+    def _on_writer_failure(self, writer: ConnectionWriter):
+        asyncio.create_task(self.evict(writer.websocket, writer.connection_id))
+    
+    async def evict(self, websocket: WebSocketServerProtocol, connection_id: str,
+                    code: int = 1013, reason: str = "Slow consumer"):
+        """Disconnect a dead, idle or slow consumer and close its socket"""
+        if websocket not in self.writers:
+            return
+        self.evictions[reason] = self.evictions.get(reason, 0) + 1
+        await self.disconnect(websocket, connection_id)
+        try:
+            # 1013: try again later
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), 1.0)
+        except Exception:
+            pass
+    
+    async def _run_heartbeat(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.check_connections()
+            except Exception as e:
+                print(f"Error checking WebSocket connections: {e}")
+    
+    async def check_connections(self):
+        """Reap idle connections and ping the rest, evicting peers that miss the pong"""
+        now = time.monotonic()
+        checks = []
+        for websocket, writer in list(self.writers.items()):
+            if self._is_idle(writer, now):
+                checks.append(self.evict(websocket, writer.connection_id, code=1001, reason="Idle timeout"))
+            else:
+                checks.append(self._ping(writer))
+        await asyncio.gather(*checks)
+    
+    def _is_idle(self, writer: ConnectionWriter, now: float) -> bool:
+        # Subscribed connections are listening, not idle; the heartbeat proves they are alive
+        subscribed = writer.connection_id in self.price_subscriptions or writer.connection_id in self.portfolio_subscriptions
+        return not subscribed and now - writer.last_activity > settings.ws_idle_timeout_seconds
+    
+    async def _ping(self, writer: ConnectionWriter):
+        timeout = settings.ws_heartbeat_timeout_seconds
+        try:
+            pong_waiter = await asyncio.wait_for(writer.websocket.ping(), timeout)
+            await asyncio.wait_for(pong_waiter, timeout)
+        except Exception:
+            await self.evict(writer.websocket, writer.connection_id, code=1011, reason="Heartbeat timeout")
+    
+    def metrics(self) -> Dict[str, Any]:
+        """Gauges for monitoring fan-out load"""
+        depths = [writer.depth for writer in self.writers.values()]
+        return {
+            "connections": len(self.writers),
+            "connection_ids": len(self.connections),
+            "users": len(self.user_connections),
+            "subscriptions_per_coin": {crypto_id: len(ids) for crypto_id, ids in self.price_subscribers.items()},
+            "portfolio_subscriptions": {portfolio_id: len(ids) for portfolio_id, ids in self.portfolio_subscribers.items()},
+            "send_queue_depth": {"total": sum(depths), "max": max(depths, default=0)},
+            "evictions": dict(self.evictions)
+        }
+    
+    def _unindex(self, connection_id: str, crypto_ids: Iterable[str]):
+        for crypto_id in crypto_ids:
+            subscribers = self.price_subscribers.get(crypto_id)
+            if subscribers is None:
+                continue
+            subscribers.discard(connection_id)
+            if not subscribers:
+                del self.price_subscribers[crypto_id]
     
     async def broadcast_price_update(self, crypto_id: str, price_data: Dict[str, Any]):
-        """Broadcast price update to subscribed connections"""
-        message = json.dumps({
-            "type": "price_update",
-            "crypto_id": crypto_id,
-            "data": price_data
-        })
+        """Broadcast price update to subscribed connections on every worker"""
+        await self.broker.publish("price_update", {"crypto_id": crypto_id, "data": price_data})
+    
+    def _deliver_price_update(self, crypto_id: str, price_data: Dict[str, Any]):
+        """Deliver a price update to this worker's subscribed connections.
         
-        # Find connections subscribed to this crypto
-        for connection_id, crypto_ids in self.price_subscriptions.items():
-            if crypto_id in crypto_ids and connection_id in self.connections:
-                # Send to all websockets for this connection
-                for websocket in self.connections[connection_id].copy():
-                    try:
-                        await websocket.send(message)
-                    except Exception:
-                        # Remove failed connection
-                        await self.disconnect(websocket, connection_id)
+        Updates are coalesced per connection over the batch window and sent as a
+        "price_batch" frame: {"type": "price_batch", "updates": {crypto_id: {changed fields}}}.
+        The first frame for a crypto carries all fields.
+        """
+        # Only visit connections subscribed to this crypto
+        for connection_id in self.price_subscribers.get(crypto_id, ()):
+            for websocket in self.connections.get(connection_id, ()):
+                writer = self.writers.get(websocket)
+                if writer:
+                    writer.stage_price(crypto_id, price_data)
+                    self._dirty_writers.add(writer)
+        
+        if self.batch_window <= 0:
+            self._flush_price_batches()
+        elif self._batcher is None or self._batcher.done():
+            self._batcher = asyncio.create_task(self._run_batcher())
+    
+    def _flush_price_batches(self):
+        dirty, self._dirty_writers = self._dirty_writers, set()
+        for writer in dirty:
+            writer.flush_prices()
+    
+    async def _run_batcher(self):
+        # Runs while updates keep arriving; exits after an idle window
+        while self._dirty_writers:
+            await asyncio.sleep(self.batch_window)
+            self._flush_price_batches()
     
     async def broadcast_portfolio_update(self, portfolio_id: str, portfolio_data: Dict[str, Any]):
-        """Broadcast portfolio update to relevant connections"""
+        """Broadcast portfolio update to relevant connections on every worker"""
+        await self.broker.publish("portfolio_update", {"portfolio_id": portfolio_id, "data": portfolio_data})
+    
+    def _deliver_portfolio_update(self, portfolio_id: str, portfolio_data: Dict[str, Any],
+                                  connection_ids: Optional[Iterable[str]] = None):
+        """Deliver a portfolio update to this worker's connections subscribed to that portfolio"""
         message = json.dumps({
             "type": "portfolio_update",
             "portfolio_id": portfolio_id,
             "data": portfolio_data
         })
         
-        # For now, broadcast to all connections
-        # TODO: Implement user-specific subscriptions
-        for connection_id, websockets in self.connections.items():
-            for websocket in websockets.copy():
-                try:
-                    await websocket.send(message)
-                except Exception:
-                    await self.disconnect(websocket, connection_id)
+        if connection_ids is None:
+            connection_ids = self.portfolio_subscribers.get(portfolio_id, ())
+        for connection_id in connection_ids:
+            for websocket in self.connections.get(connection_id, ()):
+                writer = self.writers.get(websocket)
+                if writer and not writer.enqueue(message):
+                    # Queue stayed full past the threshold: evict after this pass
+                    self._on_writer_failure(writer)
 
 # Global instance
 websocket_manager = WebSocketManager()
\ No newline at end of file
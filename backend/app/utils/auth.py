@@ -1,11 +1,21 @@
+import asyncio
 import bcrypt
+import hashlib
 import jwt
+import itertools
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import NamedTuple, Optional, Tuple, Union
+from sqlalchemy import event, inspect
 from sqlalchemy.orm import Session
+from app.core.config import settings
 from app.database.models import UserModel
-from app.database.connection import get_db
+from app.database.connection import get_db, SessionLocal
+from app.utils.cache import TTLCache
 import re
 
 # JWT Configuration
@@ -13,9 +23,35 @@ SECRET_KEY = os.getenv("JWT_SECRET_KEY", "your-secret-key-change-this-in-product
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
+class AuthenticatedUser(NamedTuple):
+    """Immutable snapshot of the user fields needed for authorization"""
+    id: str
+    is_admin: bool
+    is_active: bool
+
+class _CachedToken(NamedTuple):
+    claims: dict
+    user: AuthenticatedUser
+    generation: int
+
+# Verified tokens keyed by SHA-256 digest; entries never outlive the token's exp claim
+_token_cache = TTLCache(settings.auth_cache_max_entries, settings.auth_cache_ttl_seconds)
+
+# user_id -> (generation, monotonic time it was set); set whenever a user's auth-relevant
+# fields change, so older cache entries are ignored. Users without an entry are at generation 0.
+_user_generations: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+_generation_counter = itertools.count(1)
+_generations_lock = threading.Lock()
+
+# bcrypt is CPU-bound (~250 ms at cost 12), so async callers run it on this dedicated pool
+_password_executor = ThreadPoolExecutor(
+    max_workers=settings.password_hash_workers,
+    thread_name_prefix="password-hash"
+)
+
 def hash_password(password: str) -> str:
-    """Hash a password using bcrypt"""
-    salt = bcrypt.gensalt()
+    """Hash a password using bcrypt with the configured work factor"""
+    salt = bcrypt.gensalt(rounds=settings.bcrypt_rounds)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -23,6 +59,24 @@ def verify_password(password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
 
+def password_needs_rehash(hashed_password: str) -> bool:
+    """Check whether a bcrypt hash was made with a different work factor than configured"""
+    try:
+        # bcrypt hashes look like $2b$<cost>$<salt+hash>
+        return int(hashed_password.split('$')[2]) != settings.bcrypt_rounds
+    except (IndexError, ValueError):
+        return True
+
+async def hash_password_async(password: str) -> str:
+    """Hash a password on the password pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, hash_password, password)
+
+async def verify_password_async(password: str, hashed_password: str) -> bool:
+    """Verify a password on the password pool without blocking the event loop"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_password_executor, verify_password, password, hashed_password)
+
 def validate_email(email: str) -> bool:
     """Validate email format"""
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
@@ -68,9 +122,11 @@ def get_user_by_id(db: Session, user_id: str) -> Optional[UserModel]:
     """Get user by ID"""
     return db.query(UserModel).filter(UserModel.id == user_id).first()
 
-def create_user(db: Session, email: str, password: str, is_admin: bool = False) -> UserModel:
-    """Create a new user"""
-    hashed_password = hash_password(password)
+async def create_user_async(db: Session, email: str, password: str, is_admin: bool = False) -> UserModel:
+    """Create a new user, hashing the password off the event loop"""
+    return _insert_user(db, email, await hash_password_async(password), is_admin)
+
+def _insert_user(db: Session, email: str, hashed_password: str, is_admin: bool) -> UserModel:
     user = UserModel(
         email=email,
         hashed_password=hashed_password,
@@ -83,29 +139,52 @@ def create_user(db: Session, email: str, password: str, is_admin: bool = False)
     db.refresh(user)
     return user
 
-def create_admin_user(db: Session, email: str, password: str) -> UserModel:
-    """Create a new admin user"""
-    return create_user(db, email, password, is_admin=True)
-
-def is_user_admin(user: UserModel) -> bool:
+def is_user_admin(user: Union[UserModel, AuthenticatedUser, None]) -> bool:
     """Check if user is an admin"""
     return user.is_admin if user else False
 
-def authenticate_user(db: Session, email: str, password: str) -> Optional[UserModel]:
-    """Authenticate user by email and password"""
+async def authenticate_user_async(db: Session, email: str, password: str) -> Optional[UserModel]:
+    """Authenticate user off the event loop, upgrading the hash if the work factor changed"""
     user = get_user_by_email(db, email)
     if not user:
         return None
-    if not verify_password(password, user.hashed_password):
+    if not await verify_password_async(password, user.hashed_password):
         return None
     
+    # The plaintext is only available at login, so this is when old hashes get upgraded
+    if password_needs_rehash(user.hashed_password):
+        user.hashed_password = await hash_password_async(password)
+    
     # Update last login
     user.last_login = datetime.utcnow()
     db.commit()
     return user
 
-def get_current_user_from_token(token: str, db: Session) -> Optional[UserModel]:
-    """Get current user from JWT token"""
+def _token_digest(token: str) -> str:
+    return hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+def _user_generation(user_id: str) -> int:
+    entry = _user_generations.get(user_id)
+    return entry[0] if entry else 0
+
+def invalidate_user_tokens(user_id: str):
+    """Drop cached verifications for a user, e.g. after deactivation or a role change"""
+    now = time.monotonic()
+    with _generations_lock:
+        # Generations are unique across users, so a forgotten entry falling back to 0 never revives a stale one
+        _user_generations[user_id] = (next(_generation_counter), now)
+        _user_generations.move_to_end(user_id)
+        # Every entry cached before a bump expires within the cache TTL, after which the bump can be forgotten
+        while now - next(iter(_user_generations.values()))[1] > settings.auth_cache_ttl_seconds:
+            _user_generations.popitem(last=False)
+
+def get_current_user_from_token(token: str, db: Session) -> Optional[AuthenticatedUser]:
+    """Get current active user from JWT token, served from the verified-token cache when hot"""
+    key = _token_digest(token)
+    cached = _token_cache.get(key)
+    if cached is not None and cached.generation == _user_generation(cached.user.id):
+        return cached.user if cached.user.is_active else None
+    
     payload = verify_token(token)
     if payload is None:
         return None
@@ -114,5 +193,50 @@ def get_current_user_from_token(token: str, db: Session) -> Optional[UserModel]:
     if user_id is None:
         return None
     
+    # Read the generation before loading so a concurrent invalidation makes this entry stale
+    generation = _user_generation(user_id)
     user = get_user_by_id(db, user_id)
-    return user
\ No newline at end of file
+    if user is None:
+        return None
+    
+    record = AuthenticatedUser(id=user.id, is_admin=bool(user.is_admin), is_active=bool(user.is_active))
+    _token_cache.set(key, _CachedToken(claims=payload, user=record, generation=generation), expires_at=payload.get("exp"))
+    return record if record.is_active else None
+
+def extract_bearer_token(authorization: Optional[str]) -> Optional[str]:
+    """Extract the token from an 'Authorization: Bearer <token>' header value"""
+    if not authorization or not authorization.startswith("Bearer "):
+        return None
+    return authorization.split(" ")[1]
+
+def load_user_for_token(token: Optional[str]) -> Optional[AuthenticatedUser]:
+    """Verify a token and load its user with a short-lived session"""
+    if not token:
+        return None
+    
+    db = SessionLocal()
+    try:
+        return get_current_user_from_token(token, db)
+    finally:
+        db.close()
+
+@event.listens_for(Session, "after_flush")
+def _collect_user_auth_changes(session, flush_context):
+    """Note users who were deactivated, deleted or changed role; their tokens are invalidated on commit"""
+    changed = session.info.setdefault("auth_changed_user_ids", set())
+    for target in session.dirty:
+        if isinstance(target, UserModel):
+            state = inspect(target)
+            if state.attrs.is_active.history.has_changes() or state.attrs.is_admin.history.has_changes():
+                changed.add(target.id)
+    changed.update(target.id for target in session.deleted if isinstance(target, UserModel))
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_tokens_after_commit(session):
+    # Bumping at flush time would let a concurrent request cache the pre-commit row under the new generation
+    for user_id in session.info.pop("auth_changed_user_ids", ()):
+        invalidate_user_tokens(user_id)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_auth_changes(session):
+    session.info.pop("auth_changed_user_ids", None)
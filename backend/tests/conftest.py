@@ -0,0 +1,37 @@
+"""
+Shared test fixtures: each test runs against a fresh SQLite database
+"""
+import os
+import tempfile
+
+# The engine and settings read the environment on import, so configure it first
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+os.environ.setdefault("AI_PROVIDER", "stub")
+os.environ.setdefault("AI_WARM_UP_ON_STARTUP", "false")
+
+import pytest
+from app.database.connection import engine
+from app.database.models import Base, UserModel
+from app.services.database_service import DatabaseService
+
+@pytest.fixture
+def db_service():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with DatabaseService() as service:
+        yield service
+
+@pytest.fixture
+def user(db_service):
+    user = UserModel(email="owner@example.com", hashed_password="unused")
+    db_service.db.add(user)
+    db_service.db.commit()
+    return user
+
+@pytest.fixture
+def make_asset(db_service, user):
+    """Create an empty asset in a new portfolio using the given cost basis method"""
+    def make(cost_basis_method: str = "fifo", crypto_id: str = "bitcoin"):
+        portfolio = db_service.create_portfolio("Test", user_id=user.id, cost_basis_method=cost_basis_method)
+        return db_service.create_asset(portfolio.id, crypto_id, crypto_id[:3].upper(), crypto_id.title(), 0.0, 0.0, 0.0)
+    return make
@@ -0,0 +1,128 @@
+"""
+Streaming chat against scripts/stub_llm_server.py, run on a local port
+"""
+import json
+import sys
+import threading
+import time
+from pathlib import Path
+import httpx
+import pytest
+import uvicorn
+from app.api import streams
+from app.core.config import settings
+from app.services.ai_service import GitHubLlamaService
+
+SCRIPTS_DIR = Path(__file__).resolve().parents[2] / "scripts"
+MESSAGES = [{"role": "user", "content": "How is my portfolio?"}]
+
+@pytest.fixture(scope="module")
+def stub_llm():
+    sys.path.insert(0, str(SCRIPTS_DIR))
+    import stub_llm_server
+    stub_llm_server.config.first_token_delay = 0
+    stub_llm_server.config.token_delay = 0.01
+    server = uvicorn.Server(uvicorn.Config(stub_llm_server.app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    yield stub_llm_server, f"http://127.0.0.1:{port}"
+    server.should_exit = True
+    thread.join(5)
+
+@pytest.fixture
+async def llm_service(stub_llm, monkeypatch):
+    _, url = stub_llm
+    monkeypatch.setattr(settings, "github_token", "stub")
+    monkeypatch.setattr(settings, "ai_endpoint", url)
+    service = GitHubLlamaService()
+
+    async def market_context():
+        return "Market data unavailable in tests."
+
+    monkeypatch.setattr(service, "get_current_market_context", market_context)
+    monkeypatch.setattr(streams, "get_ai_service", lambda: service)
+    yield service
+    await service.aclose()
+
+@pytest.fixture
+def upstream_error(stub_llm, monkeypatch):
+    stub_llm_server, _ = stub_llm
+    monkeypatch.setattr(stub_llm_server.config, "error_status", 503)
+
+def slots_free(service) -> bool:
+    return service.limiter._semaphore._value == settings.ai_max_concurrent_requests
+
+def parse_events(body: str):
+    events = []
+    for frame in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in frame.split("\n") if ": " in line)
+        events.append((fields.get("event"), json.loads(fields.get("data", "null"))))
+    return events
+
+async def test_stream_yields_tokens_in_order(llm_service, stub_llm):
+    stub_llm_server, _ = stub_llm
+    chunks = [chunk async for chunk in llm_service.stream_chat_completion(MESSAGES)]
+
+    assert chunks[:2] == stub_llm_server.DEFAULT_REPLY.split()[:1] + [" " + stub_llm_server.DEFAULT_REPLY.split()[1]]
+    assert "".join(chunks) == stub_llm_server.DEFAULT_REPLY
+    assert slots_free(llm_service)
+
+async def test_closing_stream_mid_way_releases_its_slot(llm_service):
+    chunks = llm_service.stream_chat_completion(MESSAGES)
+    received = [await chunks.__anext__() for _ in range(3)]
+    assert not slots_free(llm_service)
+
+    await chunks.aclose()
+
+    assert len(received) == 3
+    assert slots_free(llm_service)
+
+async def test_upstream_error_raises(llm_service, upstream_error):
+    with pytest.raises(Exception, match="status 503"):
+        async for _ in llm_service.stream_chat_completion(MESSAGES):
+            pass
+    assert slots_free(llm_service)
+
+async def sse_chat(message: str) -> str:
+    from app.main import app
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        response = await client.get("/cryptassist/stream/chat", params={"message": message})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/event-stream")
+    return response.text
+
+async def test_sse_chat_relays_tokens_then_done(llm_service, stub_llm):
+    stub_llm_server, _ = stub_llm
+    events = parse_events(await sse_chat("hello"))
+
+    assert [name for name, _ in events[:-1]] == ["token"] * (len(events) - 1)
+    assert "".join(data["content"] for _, data in events[:-1]) == stub_llm_server.DEFAULT_REPLY
+    assert events[-1] == ("done", {})
+
+async def test_sse_chat_sends_error_frame_on_upstream_failure(llm_service, upstream_error):
+    events = parse_events(await sse_chat("hello"))
+
+    assert events[-1][0] == "error"
+    assert "503" in events[-1][1]["message"]
+    assert slots_free(llm_service)
+
+class DisconnectingRequest:
+    """Reports the client gone after a few checks"""
+
+    def __init__(self, connected_checks: int):
+        self.connected_checks = connected_checks
+
+    async def is_disconnected(self) -> bool:
+        self.connected_checks -= 1
+        return self.connected_checks < 0
+
+async def test_sse_chat_stops_upstream_when_client_disconnects(llm_service):
+    chunks = llm_service.stream_chat_completion(MESSAGES)
+    frames = [frame async for frame in streams.completion_events(DisconnectingRequest(2), chunks)]
+
+    assert len(frames) == 2
+    assert all(frame.startswith("event: token") for frame in frames)
+    assert slots_free(llm_service)
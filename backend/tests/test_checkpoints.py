@@ -0,0 +1,47 @@
+from datetime import datetime
+import pytest
+from app.core.config import settings
+from app.database.models import AssetCheckpointModel
+
+@pytest.fixture(autouse=True)
+def small_checkpoint_interval(monkeypatch):
+    monkeypatch.setattr(settings, "checkpoint_interval_transactions", 2)
+
+def checkpoint_count(db_service, asset):
+    return db_service.db.query(AssetCheckpointModel).filter(AssetCheckpointModel.asset_id == asset.id).count()
+
+def test_checkpoints_follow_the_counter_on_the_asset(db_service, make_asset):
+    asset = make_asset()
+    for amount in (1.0, 1.0, 1.0):
+        db_service.create_transaction(asset.id, "buy", amount, 10.0)
+    db_service.create_transaction(asset.id, "sell", 0.5, 20.0)
+    db_service.create_transaction(asset.id, "buy", 1.0, 30.0)
+
+    asset = db_service.get_asset(asset.id)
+    assert checkpoint_count(db_service, asset) == 2
+    assert asset.transactions_since_checkpoint == 1
+
+def test_as_of_state_matches_full_replay(db_service, make_asset):
+    asset = make_asset()
+    for price in (10.0, 20.0, 30.0):
+        db_service.create_transaction(asset.id, "buy", 1.0, price)
+    db_service.create_transaction(asset.id, "sell", 1.5, 40.0)
+    db_service.create_transaction(asset.id, "buy", 2.0, 50.0)
+
+    [state] = db_service.get_portfolio_state_as_of(asset.portfolio_id, datetime.utcnow())
+    # FIFO: the sell releases the 10 lot and half the 20 lot
+    assert state.amount == pytest.approx(3.5)
+    assert state.cost_basis == pytest.approx(10.0 + 30.0 + 100.0)
+    assert state.realized_profit_loss == pytest.approx(30.0 + 10.0)
+    assert state.transaction_count == 5
+
+def test_rebuild_resets_the_counter(db_service, make_asset):
+    asset = make_asset()
+    for _ in range(3):
+        db_service.create_transaction(asset.id, "buy", 1.0, 10.0)
+
+    db_service.rebuild_lots(asset.id)
+
+    asset = db_service.get_asset(asset.id)
+    assert checkpoint_count(db_service, asset) == 1
+    assert asset.transactions_since_checkpoint == 1
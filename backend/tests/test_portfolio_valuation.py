@@ -0,0 +1,35 @@
+from app.schemas.context import GraphQLContext
+from app.schemas.schema import schema
+from app.services.portfolio_valuation import portfolio_valuations
+from app.utils.auth import create_access_token
+
+class FakeRequest:
+    def __init__(self, user_id):
+        self.headers = {"authorization": f"Bearer {create_access_token({'sub': user_id})}"}
+
+async def test_deleted_portfolio_ends_listeners(db_service, make_asset):
+    asset = make_asset()
+    messages = []
+    assert portfolio_valuations.add_listener(asset.portfolio_id, messages.append)
+
+    db_service.delete_portfolio(asset.portfolio_id)
+    await portfolio_valuations.holdings_changed(asset.portfolio_id)
+
+    assert messages[-1]["deleted"] is True
+    assert asset.portfolio_id not in portfolio_valuations.portfolios
+
+async def test_portfolio_updates_subscription_completes_on_delete(db_service, make_asset, user):
+    asset = make_asset()
+    context = GraphQLContext()
+    context.request = FakeRequest(user.id)
+    query = 'subscription($id: String!) { portfolioUpdates(portfolioId: $id) { portfolioId } }'
+    updates = await schema.subscribe(query, variable_values={"id": asset.portfolio_id}, context_value=context)
+
+    first = await updates.__anext__()
+    assert first.data == {"portfolioUpdates": {"portfolioId": asset.portfolio_id}}
+
+    db_service.delete_portfolio(asset.portfolio_id)
+    await portfolio_valuations.holdings_changed(asset.portfolio_id)
+
+    remaining = [result async for result in updates]
+    assert remaining == []
@@ -0,0 +1,39 @@
+from app.services import price_hub as price_hub_module
+from app.services.broker import InMemoryBroker
+from app.services.price_hub import PriceHub, PricePoller
+
+class SharedBroker(InMemoryBroker):
+    """Stands in for Redis: every poller registered here is a separate worker"""
+
+    def __init__(self):
+        super().__init__()
+        self.holder = None
+
+    async def acquire_lease(self, name, owner, ttl_seconds):
+        if self.holder is None:
+            self.holder = owner
+        return self.holder == owner
+
+async def test_one_worker_polls_for_all(monkeypatch):
+    fetches = []
+
+    async def get_simple_prices(crypto_ids):
+        fetches.append(crypto_ids)
+        return {crypto_id: 1.0 for crypto_id in crypto_ids}
+
+    monkeypatch.setattr(price_hub_module.crypto_api_service, "get_simple_prices", get_simple_prices)
+    broker = SharedBroker()
+    leader_hub, follower_hub = PriceHub(), PriceHub()
+    leader = PricePoller(leader_hub, broker)
+    follower = PricePoller(follower_hub, broker)
+    leader_hub.subscribe(["bitcoin"])
+    follower_subscription = follower_hub.subscribe(["ethereum"])
+
+    assert await leader.poll_once() == 1
+    # The follower announces its ids but does not fetch
+    assert await follower.poll_once() == 0
+    assert await leader.poll_once() == 2
+
+    assert fetches == [["bitcoin"], ["bitcoin", "ethereum"]]
+    assert (await follower_subscription.get()).crypto_id == "ethereum"
+    assert set(follower_hub.latest) == {"bitcoin", "ethereum"}
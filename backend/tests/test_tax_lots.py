@@ -0,0 +1,88 @@
+import pytest
+from app.database.models import TaxLotModel
+from app.services import database_service as database_service_module
+from app.services.lot_engine import LotBook, OpenLot
+
+def buy_then_sell(db_service, asset, sell_amount=1.5, sell_price=50.0):
+    """Buys of one unit at 10, 30 and 20 (in that order), then a sell"""
+    for price in (10.0, 30.0, 20.0):
+        db_service.create_transaction(asset.id, "buy", 1.0, price)
+    return db_service.create_transaction(asset.id, "sell", sell_amount, sell_price)
+
+def open_lots(db_service, asset):
+    lots = db_service.db.query(TaxLotModel).filter(TaxLotModel.asset_id == asset.id).order_by(TaxLotModel.acquired_at)
+    return [(lot.price_per_unit, lot.remaining_amount) for lot in lots]
+
+@pytest.mark.parametrize("method, realized, remaining", [
+    # FIFO sells the 10 lot and half the 30 lot
+    ("fifo", 40.0 + 10.0, [(10.0, 0.0), (30.0, 0.5), (20.0, 1.0)]),
+    # LIFO sells the 20 lot and half the 30 lot
+    ("lifo", 30.0 + 10.0, [(10.0, 1.0), (30.0, 0.5), (20.0, 0.0)]),
+    # HIFO sells the 30 lot and half the 20 lot
+    ("hifo", 20.0 + 15.0, [(10.0, 1.0), (30.0, 0.0), (20.0, 0.5)]),
+])
+def test_sell_matches_lots_by_method(db_service, make_asset, method, realized, remaining):
+    asset = make_asset(method)
+    sell = buy_then_sell(db_service, asset)
+
+    assert sell.realized_profit_loss == pytest.approx(realized)
+    assert open_lots(db_service, asset) == pytest.approx(remaining)
+
+def test_partial_lot_is_consumed_across_sells(db_service, make_asset):
+    asset = make_asset("fifo")
+    db_service.create_transaction(asset.id, "buy", 2.0, 10.0)
+    first = db_service.create_transaction(asset.id, "sell", 0.5, 20.0)
+    second = db_service.create_transaction(asset.id, "sell", 0.5, 30.0)
+
+    assert first.realized_profit_loss == pytest.approx(5.0)
+    assert second.realized_profit_loss == pytest.approx(10.0)
+    assert open_lots(db_service, asset) == pytest.approx([(10.0, 1.0)])
+
+def test_oversell_is_rejected(db_service, make_asset):
+    asset = make_asset("fifo")
+    db_service.create_transaction(asset.id, "buy", 1.0, 10.0)
+
+    with pytest.raises(Exception, match="Cannot sell"):
+        db_service.create_transaction(asset.id, "sell", 2.0, 10.0)
+
+@pytest.mark.parametrize("method", ["fifo", "lifo", "hifo"])
+def test_sell_spanning_several_pages_of_lots(db_service, make_asset, monkeypatch, method):
+    monkeypatch.setattr(database_service_module, "LOT_PAGE_SIZE", 2)
+    asset = make_asset(method)
+    prices = [10.0, 40.0, 20.0, 50.0, 30.0]
+    for price in prices:
+        db_service.create_transaction(asset.id, "buy", 1.0, price)
+    sell = db_service.create_transaction(asset.id, "sell", 3.5, 100.0)
+
+    # The same sell against an in-memory book holding every lot
+    book = LotBook(method)
+    for index, price in enumerate(prices):
+        book.add(OpenLot(lot_id=index, price_per_unit=price, remaining_amount=1.0))
+    expected = sum(c.realized_profit_loss(100.0) for c in book.consume(3.5))
+
+    assert sell.realized_profit_loss == pytest.approx(expected)
+    assert sum(amount for _, amount in open_lots(db_service, asset)) == pytest.approx(1.5)
+
+def test_changing_method_rebuilds_lots(db_service, make_asset):
+    asset = make_asset("fifo")
+    sell = buy_then_sell(db_service, asset)
+
+    db_service.set_cost_basis_method(asset.portfolio_id, "hifo")
+    db_service.db.refresh(sell)
+
+    assert sell.realized_profit_loss == pytest.approx(35.0)
+    assert open_lots(db_service, asset) == pytest.approx([(10.0, 1.0), (30.0, 0.0), (20.0, 0.5)])
+    asset = db_service.get_asset(asset.id)
+    assert asset.amount == pytest.approx(1.5)
+    assert asset.average_buy_price == pytest.approx((10.0 + 10.0) / 1.5)
+
+def test_rebuild_lots_replays_history(db_service, make_asset):
+    asset = make_asset("lifo")
+    sell = buy_then_sell(db_service, asset)
+    before = open_lots(db_service, asset)
+
+    db_service.rebuild_lots(asset.id)
+    db_service.db.refresh(sell)
+
+    assert sell.realized_profit_loss == pytest.approx(40.0)
+    assert open_lots(db_service, asset) == pytest.approx(before)
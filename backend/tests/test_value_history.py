@@ -0,0 +1,51 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from app.services.broker import InMemoryBroker
+from app.services.price_history import utc_day
+from app.services.value_history import PortfolioValueHistoryService
+
+DAYS = 5
+nan = np.nan
+
+class FixedHistories:
+    """Serves a fixed price matrix over the last DAYS days"""
+
+    def __init__(self, prices):
+        self.prices = prices
+
+    async def matrix(self, crypto_ids, days):
+        today = utc_day()
+        grid = np.arange(today - days, today + 1, dtype=np.int64)
+        return grid, np.array([self.prices[crypto_id] for crypto_id in crypto_ids], dtype=float).T
+
+def days_ago(days: int) -> datetime:
+    """Noon UTC of the day `days` before today, as a naive UTC datetime"""
+    return datetime.utcfromtimestamp((utc_day() - days) * 86400 + 43200)
+
+def backdate(db_service, transaction, days: int):
+    transaction.timestamp = days_ago(days)
+    db_service.db.commit()
+
+async def test_replay_across_the_window(db_service, make_asset):
+    bitcoin = make_asset("fifo", "bitcoin")
+    newcoin = db_service.create_asset(bitcoin.portfolio_id, "newcoin", "NEW", "Newcoin", 0.0, 0.0, 0.0)
+    backdate(db_service, db_service.create_transaction(bitcoin.id, "buy", 2.0, 10.0), DAYS + 3)
+    backdate(db_service, db_service.create_transaction(newcoin.id, "buy", 4.0, 1.0), DAYS + 3)
+    backdate(db_service, db_service.create_transaction(bitcoin.id, "buy", 1.0, 20.0), 2)
+    backdate(db_service, db_service.create_transaction(bitcoin.id, "sell", 1.5, 30.0), 1)
+
+    service = PortfolioValueHistoryService(
+        FixedHistories({"bitcoin": [100.0] * (DAYS + 1), "newcoin": [nan, nan, 5.0, 5.0, 5.0, 5.0]}),
+        InMemoryBroker()
+    )
+    result = await service.history(bitcoin.portfolio_id, DAYS)
+
+    # Bitcoin holds 2, then 3 after the mid-window buy, then 1.5 after the sell;
+    # newcoin's 4 units are worth nothing before its first price
+    assert result.value.tolist() == pytest.approx([200.0, 200.0, 220.0, 320.0, 170.0, 170.0])
+    # FIFO: the sell releases 1.5 units of the 10 lot (15 of cost) for 45
+    assert result.cost_basis.tolist() == pytest.approx([24.0, 24.0, 24.0, 44.0, 29.0, 29.0])
+    assert result.realized_profit_loss.tolist() == pytest.approx([0.0, 0.0, 0.0, 0.0, 30.0, 30.0])
+    assert result.missing_history == ["newcoin"]
+    assert result.timestamps[-1] == utc_day() * 86400000
@@ -0,0 +1,45 @@
+import asyncio
+import time
+from app.core.config import settings
+from app.services.websocket_manager import WebSocketManager
+
+class FakeWebSocket:
+    def __init__(self, messages=()):
+        self.messages = asyncio.Queue()
+        for message in messages:
+            self.messages.put_nowait(message)
+
+    async def recv(self):
+        return await self.messages.get()
+
+    async def send(self, message):
+        pass
+
+async def test_received_messages_keep_unsubscribed_connection_alive():
+    manager = WebSocketManager()
+    websocket = FakeWebSocket(['{"type": "ping"}'])
+    await manager.connect(websocket, "connection")
+    writer = manager.writers[websocket]
+    writer.last_activity = time.monotonic() - settings.ws_idle_timeout_seconds - 1
+    assert manager._is_idle(writer, time.monotonic())
+
+    assert await manager.receive(websocket) == '{"type": "ping"}'
+    assert not manager._is_idle(writer, time.monotonic())
+
+    await manager.disconnect(websocket, "connection")
+
+async def test_deleted_portfolio_drops_websocket_subscribers(db_service, make_asset, user):
+    manager = WebSocketManager()
+    websocket = FakeWebSocket()
+    await manager.connect(websocket, "connection", user_id=user.id)
+    asset = make_asset()
+    assert await manager.subscribe_to_portfolio("connection", asset.portfolio_id, user.id)
+
+    db_service.delete_portfolio(asset.portfolio_id)
+    await manager.valuations.holdings_changed(asset.portfolio_id)
+
+    assert asset.portfolio_id not in manager.portfolio_subscribers
+    assert "connection" not in manager.portfolio_subscriptions
+    assert '"deleted": true' in manager.writers[websocket]._queue[-1]
+
+    await manager.disconnect(websocket, "connection")
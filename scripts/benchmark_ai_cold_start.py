@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark AI cold start: worker import cost and first-request latency.
+
+Every measurement runs in a fresh interpreter so nothing is already imported or
+connected. "eager" imports the AI service module and builds the backend the way
+the module-level singleton used to; "lazy" imports only the provider registry.
+"cold" times the first chat completion when the backend is built on demand,
+"warm" times it after the background warm-up at startup has finished.
+
+By default the local stub LLM server is started on a free port; pass --endpoint
+(and GITHUB_TOKEN) to measure against the real model endpoint instead.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+BACKEND_DIR = SCRIPTS_DIR.parent / "backend"
+
+MESSAGES = [{"role": "user", "content": "ping"}]
+
+
+async def measure(scenario: str) -> float:
+    """Seconds taken by one scenario, in this (fresh) interpreter"""
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    if scenario == "import_eager":
+        started = time.perf_counter()
+        from app.services.ai_service import GitHubLlamaService
+        GitHubLlamaService()
+        return time.perf_counter() - started
+
+    if scenario == "import_lazy":
+        started = time.perf_counter()
+        from app.services.ai_providers import ai_providers  # noqa: F401
+        return time.perf_counter() - started
+
+    from app.services.ai_providers import ai_providers
+    try:
+        if scenario == "warm":
+            await ai_providers.warm_up()
+        started = time.perf_counter()
+        await ai_providers.get().chat_completion(MESSAGES, max_tokens=16)
+        return time.perf_counter() - started
+    finally:
+        await ai_providers.aclose()
+
+
+def run_child(scenario: str, env: dict) -> float:
+    output = subprocess.run(
+        [sys.executable, __file__, "--child", scenario],
+        env=env, cwd=BACKEND_DIR, capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])["seconds"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port: int, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("Stub LLM server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark AI service cold start")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per scenario")
+    parser.add_argument("--endpoint", help="Chat completions endpoint (default: start the local stub server)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps({"seconds": asyncio.run(measure(args.child))}))
+        return
+
+    env = dict(os.environ, AI_PROVIDER="github")
+    env.setdefault("GITHUB_TOKEN", "stub")
+    stub_server = None
+    if args.endpoint:
+        env["AI_ENDPOINT"] = args.endpoint
+    else:
+        port = free_port()
+        stub_server = subprocess.Popen(
+            [sys.executable, str(SCRIPTS_DIR / "stub_llm_server.py"), "--port", str(port), "--reply", "pong", "--first-token-delay", "0"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        wait_for_port(port)
+        env["AI_ENDPOINT"] = f"http://127.0.0.1:{port}"
+
+    try:
+        print(f"Endpoint: {env['AI_ENDPOINT']}  runs: {args.runs}\n")
+        print(f"{'scenario':<14} {'median ms':>10} {'min ms':>10} {'max ms':>10}")
+        medians = {}
+        for scenario in ("import_eager", "import_lazy", "cold", "warm"):
+            samples = [run_child(scenario, env) * 1000 for _ in range(args.runs)]
+            medians[scenario] = statistics.median(samples)
+            print(f"{scenario:<14} {medians[scenario]:>10.1f} {min(samples):>10.1f} {max(samples):>10.1f}")
+    finally:
+        if stub_server is not None:
+            stub_server.terminate()
+            stub_server.wait()
+
+    print(f"\nWorker import time saved: {medians['import_eager'] - medians['import_lazy']:.1f} ms")
+    print(f"First-request latency saved by warm-up: {medians['cold'] - medians['warm']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark login throughput versus event-loop lag.
+
+Runs a burst of concurrent bcrypt password checks twice: inline on the event
+loop (how login used to work) and on the dedicated password pool. Meanwhile a
+probe coroutine measures how late the event loop wakes it up. Inline hashing
+stalls every other coroutine on the worker, including WebSocket subscriptions.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Add the backend directory to Python path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+
+PROBE_INTERVAL = 0.01
+
+
+async def probe_loop_lag(stop: asyncio.Event) -> list:
+    """Record how much later than requested each short sleep wakes up"""
+    lags = []
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(PROBE_INTERVAL)
+        lags.append(time.perf_counter() - started - PROBE_INTERVAL)
+    return lags
+
+
+async def run_scenario(name: str, login, logins: int):
+    stop = asyncio.Event()
+    probe = asyncio.create_task(probe_loop_lag(stop))
+    await asyncio.sleep(PROBE_INTERVAL * 2)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(login() for _ in range(logins)))
+    elapsed = time.perf_counter() - started
+
+    stop.set()
+    lags = await probe
+    lags_ms = sorted(lag * 1000 for lag in lags) or [0.0]
+    p99 = lags_ms[min(len(lags_ms) - 1, int(len(lags_ms) * 0.99))]
+
+    print(f"{name:<10} {logins / elapsed:>10.1f} {elapsed:>10.2f} "
+          f"{statistics.median(lags_ms):>12.1f} {p99:>12.1f} {lags_ms[-1]:>12.1f}")
+
+
+async def main(args):
+    from app.utils.auth import hash_password, verify_password, verify_password_async
+
+    password = "Benchmark-Passw0rd"
+    hashed = hash_password(password)
+
+    async def inline_login():
+        # Old behaviour: bcrypt runs directly inside the async resolver
+        verify_password(password, hashed)
+
+    async def pooled_login():
+        await verify_password_async(password, hashed)
+
+    print(f"bcrypt cost={args.rounds}, logins={args.logins}, pool workers={args.workers}\n")
+    print(f"{'mode':<10} {'logins/s':>10} {'total s':>10} {'lag p50 ms':>12} {'lag p99 ms':>12} {'lag max ms':>12}")
+    await run_scenario("inline", inline_login, args.logins)
+    await run_scenario("pooled", pooled_login, args.logins)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark login throughput versus event-loop lag")
+    parser.add_argument("--logins", type=int, default=20, help="Concurrent logins per scenario")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt work factor")
+    parser.add_argument("--workers", type=int, default=4, help="Password pool size")
+    args = parser.parse_args()
+
+    # Settings are read at import time, so configure them before importing the app
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    os.environ["PASSWORD_HASH_WORKERS"] = str(args.workers)
+
+    asyncio.run(main(args))
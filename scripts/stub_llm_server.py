@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Local stub of an OpenAI-compatible chat completions API.
+
+Answers POST /chat/completions with a canned reply, either as one JSON body or,
+when the request sets "stream": true, as Server-Sent Events with one chunk per
+word. Point the backend at it to develop and test AI features offline without
+spending model quota:
+
+    AI_ENDPOINT=http://127.0.0.1:8001 GITHUB_TOKEN=stub uvicorn app.main:app
+"""
+
+import argparse
+import asyncio
+import json
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+DEFAULT_REPLY = (
+    "This is a stub response from the local test model. Your portfolio looks "
+    "concentrated in a few assets; consider diversifying. This is educational "
+    "information, not financial advice."
+)
+
+app = FastAPI(title="Stub LLM server")
+config = argparse.Namespace(reply=DEFAULT_REPLY, first_token_delay=0.2, token_delay=0.02, error_status=None)
+
+
+def completion_chunk(completion_id: str, model: str, delta: dict, finish_reason=None) -> str:
+    chunk = {
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+    return f"data: {json.dumps(chunk)}\n\n"
+
+
+async def stream_reply(completion_id: str, model: str, words: list):
+    await asyncio.sleep(config.first_token_delay)
+    yield completion_chunk(completion_id, model, {"role": "assistant"})
+    for index, word in enumerate(words):
+        yield completion_chunk(completion_id, model, {"content": word if index == 0 else f" {word}"})
+        await asyncio.sleep(config.token_delay)
+    yield completion_chunk(completion_id, model, {}, finish_reason="stop")
+    yield "data: [DONE]\n\n"
+
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if config.error_status:
+        # Simulates the upstream failing, e.g. rate limits (429) or an outage (503)
+        return JSONResponse({"error": {"message": "Stub upstream error"}}, status_code=config.error_status)
+    model = body.get("model", "stub")
+    words = config.reply.split()[: body.get("max_tokens") or None]
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+    if body.get("stream"):
+        return StreamingResponse(stream_reply(completion_id, model, words), media_type="text/event-stream")
+
+    # Non-streaming callers wait for the whole generation, like the real API
+    await asyncio.sleep(config.first_token_delay + config.token_delay * len(words))
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": " ".join(words)},
+            "finish_reason": "stop",
+        }],
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stub chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--reply", default=DEFAULT_REPLY, help="Canned reply text")
+    parser.add_argument("--first-token-delay", type=float, default=0.2, help="Seconds before the first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between tokens")
+    parser.add_argument("--error-status", type=int, help="Fail every request with this HTTP status")
+    args = parser.parse_args()
+
+    config.reply = args.reply
+    config.first_token_delay = args.first_token_delay
+    config.token_delay = args.token_delay
+    config.error_status = args.error_status
+    uvicorn.run(app, host=args.host, port=args.port)